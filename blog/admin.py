@@ -1,17 +1,27 @@
+import logging
+
 from django.contrib import admin, messages
 from django.conf import settings
 from django import forms
-from .models import BlogPost, Category, Tag, Comment, get_images_from_content
+from . import cleanup, perf
+from .models import BlogPost, Category, Tag, Comment, ImageCleanup, ImageJob
 from ckeditor.widgets import CKEditorWidget
-import os
 from django.urls import path
+from django.template.defaultfilters import filesizeformat
 from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+
+logger = logging.getLogger(__name__)
 
 class CommentInline(admin.TabularInline):
     model = Comment
     extra = 0
     readonly_fields = ('user', 'email_preview', 'created_at', 'content')
 
+    def get_queryset(self, request):
+        # email_preview reads obj.user for every row
+        return super().get_queryset(request).select_related('user')
+
     def email_preview(self, obj):
         return obj.user.email
 
@@ -29,8 +39,9 @@ class BlogPostForm(forms.ModelForm):
 class BlogPostAdmin(admin.ModelAdmin):
     inlines = [CommentInline]
     form = BlogPostForm
-    list_display = ('title', 'category', 'publish', 'created_at', 'updated_at')
+    list_display = ('title', 'category', 'publish', 'comment_count', 'created_at', 'updated_at')
     list_editable = ('publish',)  # make publish editable right in the list
+    list_select_related = ('category',)
     list_filter = ('category', 'tags', 'publish')
     search_fields = ('title', 'category__name', 'content')
     #readonly_fields = ('slug',)  # Make slug field read-only
@@ -39,67 +50,46 @@ class BlogPostAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('delete-unused-images/', self.admin_site.admin_view(self.delete_unused_images_view), name='delete_unused_images'),
+            path('performance/', self.admin_site.admin_view(self.performance_view), name='blog_performance'),
         ]
         return custom_urls + urls
     
     def delete_unused_images_view(self, request):
-        deleted_images_count = 0
-        all_posts = BlogPost.objects.all()
-        used_images = set()
-        media_root = settings.MEDIA_ROOT
-
-        # --- Collect all used image paths ---
-        for post in all_posts:
-            # Main image (ImageField)
-            if post.image:
-                try:
-                    rel_path = os.path.relpath(post.image.path, media_root)
-                    used_images.add(rel_path.replace("\\", "/"))  # normalize slashes
-                except Exception as e:
-                    print(f"⚠️ Could not resolve main image path for {post.title}: {e}")
-
-            # CKEditor images (from content)
-            content_images = get_images_from_content(post.content)
-            for img in content_images:
-                # remove leading slash and normalize
-                clean_img = img.lstrip("/").replace("\\", "/")
-                used_images.add(clean_img)
-
-        print(f"🧩 Total used images detected: {len(used_images)}")
-        print(f"Sample used images: {list(used_images)[:5]}")
-
-        # --- Scan blog_images/ folder for unused files ---
-        blog_images_folder = os.path.join(media_root, "blog_images")
-        if not os.path.exists(blog_images_folder):
-            self.message_user(request, "❌ blog_images folder does not exist.", level=messages.ERROR)
+        # scanning the whole media folder can take a while, so it runs as a background job
+        if request.method != 'POST':
             return redirect('..')
 
-        scanned_images = 0
-        for root, dirs, files in os.walk(blog_images_folder):
-            for file in files:
-                scanned_images += 1
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, media_root).replace("\\", "/")
-
-                if rel_path not in used_images:
-                    try:
-                        os.remove(file_path)
-                        deleted_images_count += 1
-                        print(f"💀 Deleted unused image: {rel_path}")
-                    except Exception as e:
-                        print(f"⚠️ Failed to delete {rel_path}: {e}")
-                else:
-                    print(f"✅ Keeping in use: {rel_path}")
-                
-
-        self.message_user(
-            request,
-            f"✅ Scan complete. Scanned {scanned_images} images, Deleted {deleted_images_count} unused images.",
-            level=messages.SUCCESS
-        )
-
-        return redirect('..')
-    
+        dry_run = 'apply' not in request.POST
+        run, created = cleanup.start(dry_run=dry_run)
+        logger.info("Image cleanup requested", extra={
+            'cleanup': run.pk, 'dry_run': dry_run, 'started': created, 'user': request.user.get_username(),
+        })
+        if created:
+            kind = "Dry run" if dry_run else "Cleanup"
+            self.message_user(request, f"✅ {kind} #{run.pk} started, progress is shown below.", level=messages.SUCCESS)
+        else:
+            self.message_user(request, f"⚠️ Cleanup #{run.pk} is still running.", level=messages.WARNING)
+        return redirect('admin:blog_imagecleanup_change', run.pk)
+
+    def performance_view(self, request):
+        # this process's ring buffer only; with several workers each shows its own share
+        if request.method == 'POST' and 'reset' in request.POST:
+            perf.recorder.reset()
+            self.message_user(request, "Performance data cleared.", level=messages.SUCCESS)
+            return redirect('admin:blog_performance')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Performance',
+            'opts': self.model._meta,
+            'enabled': 'blog.perf.PerfMiddleware' in settings.MIDDLEWARE,
+            'buffer_size': perf.recorder.recent.maxlen,
+            'routes': perf.route_summary(),
+            'slow_requests': perf.slowest_requests(),
+            'slow_queries': perf.slowest_queries(),
+        }
+        return TemplateResponse(request, 'admin/blog/performance.html', context)
+
     def changelist_view(self, request, extra_context=None):
         if extra_context is None:
             extra_context = {}
@@ -134,11 +124,79 @@ class TagAdmin(admin.ModelAdmin):
     readonly_fields = ('slug',)  # Make slug field read-only
 
 
+# Background image queue, read-only: jobs are created by uploads and saves
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('path', 'status', 'attempts', 'updated_at', 'error')
+    list_filter = ('status',)
+    search_fields = ('path',)
+    readonly_fields = ('path', 'status', 'attempts', 'error', 'run_after', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+# Unused image cleanup runs, started from the blog post list (see blog/cleanup.py)
+class ImageCleanupAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'phase', 'progress', 'orphaned', 'deleted', 'freed', 'updated_at')
+    list_filter = ('status', 'dry_run')
+    readonly_fields = (
+        'dry_run', 'status', 'phase', 'progress', 'orphaned', 'reclaimable', 'deleted', 'freed',
+        'error', 'created_at', 'updated_at', 'finished_at', 'orphan_report',
+    )
+    exclude = ('cursor', 'scanned', 'orphaned_bytes', 'deleted_bytes', 'report')
+    actions = ['resume_runs']
+
+    def progress(self, obj):
+        if obj.phase == ImageCleanup.SWEEP:
+            return f"{obj.scanned} files scanned, deleting expired orphans"
+        if obj.cursor:
+            return f"{obj.scanned} files scanned, at {obj.cursor}"
+        return f"{obj.scanned} files scanned"
+
+    def reclaimable(self, obj):
+        return filesizeformat(obj.orphaned_bytes)
+
+    def freed(self, obj):
+        return filesizeformat(obj.deleted_bytes)
+
+    def orphan_report(self, obj):
+        if not obj.dry_run:
+            return "Unused files are marked and deleted after the grace period."
+        lines = [f"{item['path']} ({filesizeformat(item['size'])})" for item in obj.report]
+        if obj.orphaned > len(lines):
+            lines.append(f"... and {obj.orphaned - len(lines)} more")
+        return "\n".join(lines) or "No unused images."
+
+    @admin.action(description="Resume selected interrupted or failed runs")
+    def resume_runs(self, request, queryset):
+        resumed = 0
+        for run in queryset.exclude(status=ImageCleanup.DONE):
+            cleanup.resume(run)
+            resumed += 1
+        self.message_user(request, f"Resumed {resumed} cleanup runs.")
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        extra_context = extra_context or {}
+        # the template refreshes the page while the run is still going
+        extra_context['cleanup_active'] = ImageCleanup.objects.filter(
+            pk=object_id, status__in=[ImageCleanup.PENDING, ImageCleanup.RUNNING]
+        ).exists()
+        return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Register your models
 admin.site.register(BlogPost, BlogPostAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Comment)
+admin.site.register(ImageJob, ImageJobAdmin)
+admin.site.register(ImageCleanup, ImageCleanupAdmin)
 
 # Customize admin site headers and titles
 admin.site.site_header = "Client Blog Dashboard"
@@ -0,0 +1,217 @@
+"""
+The site's own CSS and fonts, built once at deploy instead of fetched
+from third parties on every page view.
+
+`manage.py build_assets` writes blog/static/dist/:
+
+* site.css: Tailwind compiled by its CLI (BLOG_TAILWIND_CLI) with only
+  the utilities the templates, blog.js and the form widgets use, plus
+  static/css/blog.css and the @font-face rules, minified;
+* fonts/<family>-<weight>.woff2: the Inter and Roboto weights the pages
+  use, cut down to Latin (fontTools) from the files in blog/assets/fonts/;
+* assets.json: what {% site_assets %} links and preloads.
+
+collectstatic then gives each file a content-hashed name and rewrites
+the font URLs inside site.css to match, so all of them are served as
+immutable (blog/serving.py). Until the build has run, {% site_assets %}
+falls back to the Tailwind browser build and Google Fonts, so a fresh
+checkout still renders. A build without some font sources
+(--allow-missing-fonts) keeps Google Fonts for those families.
+"""
+import json
+import shlex
+import shutil
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+APP_DIR = Path(__file__).resolve().parent
+FONT_SOURCE_DIR = APP_DIR / 'assets' / 'fonts'
+DIST_DIR = APP_DIR / 'static' / 'dist'
+
+# where Tailwind looks for class names; template dirs come from TEMPLATES
+CLASS_SOURCES = [APP_DIR / 'static' / 'js', APP_DIR / 'forms.py', APP_DIR / 'templatetags']
+
+FONTS = [
+    # (family, weight, source file name without extension, preloaded)
+    ('Inter', 400, 'Inter-Regular', True),
+    ('Inter', 600, 'Inter-SemiBold', False),
+    ('Roboto', 400, 'Roboto-Regular', True),
+    ('Roboto', 500, 'Roboto-Medium', False),
+]
+FONT_SOURCE_SUFFIXES = ('.woff2', '.ttf', '.otf')
+
+# Google Fonts' "latin" subset; other characters fall back to the system font
+LATIN = ('U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, U+0304, U+0308, '
+         'U+0329, U+2000-206F, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD')
+
+# for the families a build has no font files for
+GOOGLE_FONTS = {
+    'Inter': 'https://fonts.googleapis.com/css2?family=Inter:wght@400;600&display=swap',
+    'Roboto': 'https://fonts.googleapis.com/css2?family=Roboto:wght@400;500&display=swap',
+}
+# until `manage.py build_assets` has run
+FALLBACK_HTML = '<script src="https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4"></script>\n' + ''.join(
+    f'<link href="{url}" rel="stylesheet">\n' for url in GOOGLE_FONTS.values()
+)
+
+_html = None
+
+
+def template_dirs():
+    return [Path(d) for backend in settings.TEMPLATES for d in backend.get('DIRS', [])]
+
+
+def unicodes(ranges=LATIN):
+    """The code points of a CSS unicode-range list."""
+    points = set()
+    for part in ranges.split(','):
+        first, _, last = part.strip()[2:].partition('-')
+        points.update(range(int(first, 16), int(last or first, 16) + 1))
+    return points
+
+
+def find_font_source(name):
+    for suffix in FONT_SOURCE_SUFFIXES:
+        path = FONT_SOURCE_DIR / f'{name}{suffix}'
+        if path.exists():
+            return path
+    return None
+
+
+def build_font(source, target):
+    """Write `source` cut down to LATIN as WOFF2 at `target`."""
+    try:
+        from fontTools import subset
+        import brotli  # noqa: F401 (fontTools writes WOFF2 with it)
+    except ImportError:
+        raise ImproperlyConfigured("Subsetting fonts needs fontTools and brotli: pip install fonttools brotli")
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']  # keep kerning and ligatures
+    options.name_IDs = ['*']
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=unicodes())
+    subsetter.subset(font)
+    subset.save_font(font, str(target), options)
+
+
+def build_fonts(out_dir, allow_missing=False):
+    """
+    Subset every FONTS face into `out_dir`/fonts/; returns (faces, missing)
+    where faces are (family, weight, file name relative to dist/, preload)
+    and missing the FONTS entries without a source file. Missing sources
+    are an error unless `allow_missing`.
+    """
+    sources = {name: find_font_source(name) for *_, name, _ in FONTS}
+    missing = [font for font in FONTS if sources[font[2]] is None]
+    if missing and not allow_missing:
+        raise ImproperlyConfigured(
+            f"No source in {FONT_SOURCE_DIR} for {', '.join(name for *_, name, _ in missing)} "
+            f"(one of {', '.join(FONT_SOURCE_SUFFIXES)} each). Add them, or build with --allow-missing-fonts "
+            "to load those families from Google Fonts."
+        )
+    fonts_dir = out_dir / 'fonts'
+    shutil.rmtree(fonts_dir, ignore_errors=True)
+    fonts_dir.mkdir(parents=True)
+    faces = []
+    for family, weight, name, preload in FONTS:
+        source = sources[name]
+        if source is None:
+            continue
+        file_name = f'fonts/{family.lower()}-{weight}.woff2'
+        build_font(source, out_dir / file_name)
+        faces.append((family, weight, file_name, preload))
+    return faces, missing
+
+
+def font_face_css(faces):
+    return ''.join(
+        f'@font-face{{font-family:"{family}";font-style:normal;font-weight:{weight};font-display:swap;'
+        f'src:url("{file_name}") format("woff2");unicode-range:{LATIN}}}\n'
+        for family, weight, file_name, _ in faces
+    )
+
+
+def tailwind_cli():
+    command = shlex.split(settings.BLOG_TAILWIND_CLI)
+    if not command or not shutil.which(command[0]):
+        raise ImproperlyConfigured(
+            f"Tailwind CLI {settings.BLOG_TAILWIND_CLI!r} not found: install the standalone tailwindcss v4 "
+            "binary, or set BLOG_TAILWIND_CLI (e.g. \"npx @tailwindcss/cli\")."
+        )
+    return command
+
+
+def build_css(out_dir, font_css):
+    """Compile dist/site.css; the input sits next to it so url()s resolve the same."""
+    sources = template_dirs() + CLASS_SOURCES
+    lines = ['@import "tailwindcss" source(none);']
+    lines += [f'@source "{path}";' for path in sources]
+    lines.append(font_css)
+    lines.append((APP_DIR / 'static' / 'css' / 'blog.css').read_text())
+    source = out_dir / '.site.input.css'
+    source.write_text('\n'.join(lines))
+    try:
+        subprocess.run(tailwind_cli() + ['--input', str(source), '--output', str(out_dir / 'site.css'), '--minify'],
+                       check=True, capture_output=True, text=True)
+    finally:
+        source.unlink()
+    return sources
+
+
+def build(out_dir=DIST_DIR, allow_missing_fonts=False):
+    """Build everything into `out_dir`; returns a summary for the command to print."""
+    global _html
+    out_dir.mkdir(parents=True, exist_ok=True)
+    faces, missing = build_fonts(out_dir, allow_missing_fonts)
+    sources = build_css(out_dir, font_face_css(faces))
+    manifest = {
+        'css': 'dist/site.css',
+        'preload': [f'dist/{file_name}' for *_, file_name, preload in faces if preload],
+        # families with a face missing keep their Google Fonts stylesheet
+        'font_fallback': sorted({family for family, *_ in missing}),
+    }
+    (out_dir / 'assets.json').write_text(json.dumps(manifest, indent=2))
+    _html = None
+    return {
+        'templates': sum(len(list(d.rglob('*.html'))) for d in template_dirs() if d.is_dir()),
+        'sources': len(sources),
+        'css_bytes': (out_dir / 'site.css').stat().st_size,
+        'fonts': [file_name for *_, file_name, _ in faces],
+        'font_bytes': sum((out_dir / file_name).stat().st_size for *_, file_name, _ in faces),
+        'missing_fonts': [name for *_, name, _ in missing],
+    }
+
+
+def load_manifest():
+    try:
+        return json.loads((DIST_DIR / 'assets.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def head_html():
+    """The <head> tags for the site's styles and fonts, worked out once per process."""
+    global _html
+    if _html is None:
+        manifest = load_manifest()
+        if manifest is None:
+            html = FALLBACK_HTML + format_html('<link rel="stylesheet" href="{}">', static('css/blog.css'))
+        else:
+            html = ''.join(
+                format_html('<link href="{}" rel="stylesheet">\n', GOOGLE_FONTS[family])
+                for family in manifest.get('font_fallback', ())
+            ) + ''.join(
+                format_html('<link rel="preload" href="{}" as="font" type="font/woff2" crossorigin>\n', static(path))
+                for path in manifest['preload']
+            ) + format_html('<link rel="stylesheet" href="{}">', static(manifest['css']))
+        _html = mark_safe(html)
+    return _html
@@ -0,0 +1,149 @@
+"""
+Async versions of the read-heavy views and the CKEditor upload.
+
+Used instead of their blog/views.py counterparts when BLOG_ASYNC_VIEWS is
+on (see blog/urls.py), which only pays off under ASGI: under WSGI every
+async view gets its own event loop. Queries go through the async ORM
+(aget, acount, async for), and everything a template would otherwise
+load lazily is fetched before rendering, since a template can't run a
+query on the event loop. Pillow and file writes run in an executor.
+
+`manage.py benchmark_site --views sync,async` compares them with the
+sync views on the same data.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.csrf import csrf_exempt
+
+from . import caching, images, taxonomy
+from .models import BlogPost, Category, Tag
+from .pagination import KeysetPaginator, OffsetPaginator, apaginate
+from .search import asearch
+from .views import comment_paginator, handle_comment, listing, store_upload, upload_response
+
+
+async def resolve_user(request):
+    # templates read request.user, which would otherwise be loaded synchronously
+    request.user = await request.auser()
+
+
+async def render_listing(request, posts, **context):
+    page_obj, redirect_response = await apaginate(request, KeysetPaginator(posts))
+    if redirect_response:
+        return redirect_response
+    return await _render_list_page(request, page_obj, context)
+
+
+async def _render_list_page(request, page_obj, context):
+    sidebar = await taxonomy.aget_sidebar()
+    return render(request, 'blog/blog_list.html', {
+        'page_obj': page_obj,
+        'cache_version': await caching.alisting_version(),
+        'categories': sidebar['categories'],
+        'tags': sidebar['tags'],
+        **context,
+    })
+
+
+@csrf_exempt
+async def upload_ckeditor_image(request):
+    """ Handle image upload from CKEditor, hashing and header check off the event loop """
+    if request.method == 'POST' and request.FILES.get('upload'):
+        image = request.FILES['upload']
+        started = time.perf_counter()
+        path, img_format = await asyncio.get_running_loop().run_in_executor(None, store_upload, image)
+        if img_format:
+            await sync_to_async(images.enqueue)(path)
+        return upload_response(image, path, img_format, started)
+    return JsonResponse({'uploaded': 0, 'error': {'message': 'Image upload failed'}})
+
+
+@caching.cache_anonymous_page(caching.alisting_page_version)
+async def blog_list(request):
+    await resolve_user(request)
+    return await render_listing(request, listing(BlogPost.objects.filter(publish=True)))
+
+
+@caching.cache_anonymous_page(caching.adetail_page_version)
+async def blog_detail(request, id, slug=None):
+    await resolve_user(request)
+    blog_post = await aget_object_or_404(BlogPost.objects.select_related('category', 'author'), id=id, publish=True)
+
+    # if slug is outdated, redirect to canonical URL
+    if slug != blog_post.slug:
+        return redirect(blog_post.get_absolute_url(), permanent=True)
+
+    if request.method == 'POST':
+        # form validation and the save signals are sync code
+        response, form = await sync_to_async(handle_comment)(request, blog_post)
+        if response:
+            return response
+    else:
+        response, form = handle_comment(request, blog_post)
+
+    # fetched even when the template's comment fragment is cached: it can't query lazily here
+    tags = [tag async for tag in blog_post.tags.all()]
+    comments = await comment_paginator(blog_post).apage()
+
+    return render(request, 'blog/blog_detail.html', {
+        'blog_post': blog_post,
+        'cache_version': await caching.apost_version(blog_post.pk),
+        'tags': tags,
+        'comments': comments,
+        'form': form
+    })
+
+
+async def post_comments(request, id):
+    await resolve_user(request)
+    blog_post = await aget_object_or_404(BlogPost.objects.only('id'), id=id, publish=True)
+    comments = await comment_paginator(blog_post).apage(request.GET.get('cursor'))
+    html = render_to_string('blog/comment_page.html', {'blog_post': blog_post, 'comments': comments}, request)
+    return JsonResponse({'html': html, 'next': comments.next_cursor})
+
+
+@caching.cache_anonymous_page(caching.alisting_page_version)
+async def category_posts(request, slug=None):
+    await resolve_user(request)
+    selected_category = None
+    deselect = request.GET.get('deselect') == '1'
+
+    if slug and not deselect:
+        selected_category = await aget_object_or_404(Category, slug=slug)
+        posts = listing(BlogPost.objects.filter(publish=True, category=selected_category))
+    else:
+        posts = listing(BlogPost.objects.all())
+    return await render_listing(request, posts, selected_category=selected_category)
+
+
+@caching.cache_anonymous_page(caching.alisting_page_version)
+async def tag_posts(request, slug=None):
+    await resolve_user(request)
+    selected_tag = None
+    deselect = request.GET.get('deselect') == '1'
+
+    if slug and not deselect:
+        selected_tag = await aget_object_or_404(Tag, slug=slug)
+        posts = listing(BlogPost.objects.filter(publish=True, tags=selected_tag))
+    else:
+        posts = listing(BlogPost.objects.all())
+    return await render_listing(request, posts, selected_tag=selected_tag)
+
+
+async def search_posts(request):
+    await resolve_user(request)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return redirect('blog_list')
+
+    # ranked by relevance (BM25), each post carries a highlighted search_snippet
+    posts = await asearch(query, listing(BlogPost.objects.filter(publish=True)))
+    page_obj, redirect_response = await apaginate(request, OffsetPaginator(posts))
+    if redirect_response:
+        return redirect_response
+    return await _render_list_page(request, page_obj, {'search_query': query})
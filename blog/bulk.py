@@ -0,0 +1,404 @@
+"""
+Bulk export and import of blog content.
+
+An export is a directory:
+
+    blog.jsonl   one JSON object per line with a "type" of category, tag,
+                 post or comment, written in that order
+    media/       every uploaded image the posts use, by media-relative path
+
+Posts refer to their category, tags and author by slug/username and
+comments to their post by slug, so an export loads into any database.
+
+Both directions stream. The export walks each table in primary-key
+batches; the import reads a line at a time and writes BATCH_SIZE records
+per transaction with bulk_create/bulk_update, resolving every slug or
+username in a batch with one query. Bulk writes skip BlogPost.save and
+the model signals, so the importer does that bookkeeping itself, once
+per batch: plain text and excerpt, image references, search index, the
+background optimisation of the images (once the batch commits) and
+finally the page caches.
+"""
+import json
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import reset_queries, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, content_images, images, search, snapshots
+from .models import BlogPost, Category, Comment, ImageReference, Tag, make_excerpt, recount_comments, referenced_paths
+from .storage import IMAGE_DIR, blog_image_storage
+
+BATCH_SIZE = 1000
+DATA_FILE = 'blog.jsonl'
+MEDIA_DIR = 'media'
+RECORD_TYPES = ('category', 'tag', 'post', 'comment')
+
+# written as-is by --update, besides the foreign keys
+POST_UPDATE_FIELDS = [
+    'title', 'description', 'content', 'plain_text', 'excerpt', 'image',
+    'category', 'author', 'publish', 'created_at', 'updated_at',
+]
+
+
+def iter_batches(queryset, size=BATCH_SIZE):
+    """Lists of rows from a values() queryset, walking the primary key instead of OFFSET."""
+    last = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last).order_by('pk')[:size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]['id']
+
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+
+def _parse_timestamp(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """
+    Let bulk_create write the exported created_at/updated_at values.
+
+    auto_now/auto_now_add would overwrite them with the import time. The
+    flags are switched off for the duration, so only use this in commands,
+    never inside a request.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# --- Export ---
+
+def copy_media(paths, media_dir):
+    """Copy images into the export, skipping ones already there (posts often share them)."""
+    copied = 0
+    for path in paths:
+        source = os.path.join(settings.MEDIA_ROOT, path)
+        target = os.path.join(media_dir, path)
+        if os.path.exists(target) or not os.path.exists(source):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        copied += 1
+    return copied
+
+
+def export_records(media_dir=None, batch_size=BATCH_SIZE, stats=None):
+    """Yield every record of an export in load order, copying media on the way if `media_dir` is given."""
+    stats = stats if stats is not None else defaultdict(int)
+
+    for model, record_type in ((Category, 'category'), (Tag, 'tag')):
+        for row in model.objects.order_by('pk').values('name', 'slug').iterator(chunk_size=batch_size):
+            stats[record_type] += 1
+            yield {'type': record_type, **row}
+
+    posts = BlogPost.objects.values(
+        'id', 'title', 'slug', 'description', 'content', 'image', 'publish', 'created_at', 'updated_at',
+        'category__slug', 'author__username',
+    )
+    for batch in iter_batches(posts, batch_size):
+        tags = defaultdict(list)
+        through = BlogPost.tags.through.objects.filter(blogpost_id__in=[row['id'] for row in batch])
+        for post_id, slug in through.order_by('tag__slug').values_list('blogpost_id', 'tag__slug'):
+            tags[post_id].append(slug)
+
+        for row in batch:
+            if media_dir:
+                paths = {row['image']} if row['image'] else set()
+                paths.update(content_images.iter_image_paths(row['content']))
+                stats['media'] += copy_media(sorted(p for p in paths if p.startswith(f'{IMAGE_DIR}/')), media_dir)
+            stats['post'] += 1
+            yield {
+                'type': 'post',
+                'slug': row['slug'],
+                'title': row['title'],
+                'description': row['description'],
+                'content': row['content'],
+                'image': row['image'] or '',
+                'category': row['category__slug'],
+                'tags': tags[row['id']],
+                'author': row['author__username'],
+                'publish': row['publish'],
+                'created_at': _timestamp(row['created_at']),
+                'updated_at': _timestamp(row['updated_at']),
+            }
+
+    comments = Comment.objects.values('id', 'post__slug', 'user__username', 'content', 'created_at')
+    for batch in iter_batches(comments, batch_size):
+        for row in batch:
+            stats['comment'] += 1
+            yield {
+                'type': 'comment',
+                'post': row['post__slug'],
+                'user': row['user__username'],
+                'content': row['content'],
+                'created_at': _timestamp(row['created_at']),
+            }
+
+
+def export_to(directory, include_media=True, batch_size=BATCH_SIZE):
+    """Write an export directory, returns counts per record type (and 'media' files copied)."""
+    os.makedirs(directory, exist_ok=True)
+    media_dir = os.path.join(directory, MEDIA_DIR) if include_media else None
+    stats = defaultdict(int)
+    with open(os.path.join(directory, DATA_FILE), 'w', encoding='utf-8') as f:
+        for record in export_records(media_dir, batch_size, stats):
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+    return stats
+
+
+# --- Import ---
+
+def derive_text(content):
+    """(plain_text, excerpt) for a post body, what BlogPost.save would store."""
+    plain_text = search.html_to_text(content)
+    return plain_text, make_excerpt(plain_text)
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('type') not in RECORD_TYPES:
+                raise ValueError(f"line {number}: unknown record type {record.get('type')!r}")
+            yield record
+
+
+class Importer:
+    """
+    Loads records batch by batch. Existing posts (same slug) are skipped,
+    or overwritten with update=True; comments already present are skipped,
+    so an import can be re-run after an interruption.
+    """
+
+    def __init__(self, media_dir=None, batch_size=BATCH_SIZE, update=False, workers=1, process_images=True):
+        self.media_dir = media_dir
+        self.batch_size = batch_size
+        self.update = update
+        self.workers = workers
+        self.process_images = process_images
+        self.stats = defaultdict(int)
+        self._stored_media = {}  # export path -> stored (content-addressed) path
+        self._queued_images = set()
+        self._pool = None
+
+    def run(self, records):
+        flushers = {
+            'category': lambda batch: self.import_taxonomy(Category, 'category', batch),
+            'tag': lambda batch: self.import_taxonomy(Tag, 'tag', batch),
+            'post': self.import_posts,
+            'comment': self.import_comments,
+        }
+        batch, batch_type = [], None
+        if self.workers > 1:
+            # stripping HTML and truncating excerpts is the CPU-heavy part of a post
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            with keep_timestamps(BlogPost, Comment):
+                for record in records:
+                    # a new type means everything the next records refer to has been written
+                    if batch and (record['type'] != batch_type or len(batch) >= self.batch_size):
+                        self.flush(flushers[batch_type], batch)
+                        batch = []
+                    batch_type = record['type']
+                    batch.append(record)
+                if batch:
+                    self.flush(flushers[batch_type], batch)
+        finally:
+            if self._pool:
+                self._pool.shutdown()
+
+        # one bump for everything: taxonomy version is part of every page's cache key
+        caching.invalidate_taxonomy()
+        snapshots.refresh_all()
+        return self.stats
+
+    def flush(self, import_batch, batch):
+        with transaction.atomic():
+            import_batch(batch)
+        # with DEBUG on every multi-megabyte INSERT would stay in connection.queries
+        reset_queries()
+
+    def import_taxonomy(self, model, record_type, batch):
+        existing = set(model.objects.filter(slug__in=[r['slug'] for r in batch]).values_list('slug', flat=True))
+        new = [model(name=r['name'], slug=r['slug']) for r in batch if r['slug'] not in existing]
+        # ignore_conflicts: a different slug may already carry the same (unique) name
+        model.objects.bulk_create(new, ignore_conflicts=True)
+        self.stats[record_type] += len(new)
+
+    def store_media(self, path):
+        """Copy one exported image into content-addressed storage, returning its stored path."""
+        if not self.media_dir or not path.startswith(f'{IMAGE_DIR}/'):
+            return path
+        if path not in self._stored_media:
+            source = os.path.join(self.media_dir, path)
+            if os.path.exists(source):
+                with open(source, 'rb') as f:
+                    self._stored_media[path] = blog_image_storage.save(os.path.basename(path), File(f))
+                self.stats['media'] += 1
+            else:
+                self.stats['media_missing'] += 1
+                self._stored_media[path] = path
+        return self._stored_media[path]
+
+    def build_post(self, record, content, plain_text, excerpt, categories, authors):
+        image = record.get('image') or ''
+        if self.media_dir:
+            image = self.store_media(image) if image else ''
+            for path in set(content_images.iter_image_paths(content)):
+                stored = self.store_media(path)
+                if stored != path:
+                    content = content.replace(f'{settings.MEDIA_URL}{path}', f'{settings.MEDIA_URL}{stored}')
+
+        return BlogPost(
+            title=record['title'],
+            slug=record['slug'],
+            description=record.get('description') or '',
+            content=content,
+            plain_text=plain_text,
+            excerpt=excerpt,
+            image=image or None,
+            category_id=categories.get(record.get('category')),
+            author_id=authors.get(record.get('author')),
+            publish=bool(record.get('publish')),
+            created_at=_parse_timestamp(record.get('created_at')),
+            updated_at=_parse_timestamp(record.get('updated_at') or record.get('created_at')),
+        )
+
+    def import_posts(self, batch):
+        def lookup(model, field, values):
+            values = {v for v in values if v}
+            return dict(model.objects.filter(**{f'{field}__in': values}).values_list(field, 'pk')) if values else {}
+
+        categories = lookup(Category, 'slug', (r.get('category') for r in batch))
+        authors = lookup(User, 'username', (r.get('author') for r in batch))
+        tags = lookup(Tag, 'slug', (slug for r in batch for slug in r.get('tags', ())))
+        existing = lookup(BlogPost, 'slug', (r['slug'] for r in batch))
+
+        wanted = []
+        for record in batch:
+            if record['slug'] in existing and not self.update:
+                self.stats['post_skipped'] += 1
+            else:
+                wanted.append(record)
+        contents = [record.get('content') or '' for record in wanted]
+        if self._pool:
+            texts = self._pool.map(derive_text, contents, chunksize=max(len(contents) // (self.workers * 4), 1))
+        else:
+            texts = map(derive_text, contents)
+
+        created, updated = [], []
+        for record, content, (plain_text, excerpt) in zip(wanted, contents, texts):
+            post = self.build_post(record, content, plain_text, excerpt, categories, authors)
+            post.tag_ids = [tags[slug] for slug in record.get('tags', ()) if slug in tags]
+            if record['slug'] in existing:
+                post.pk = existing[record['slug']]
+                post._state.adding = False
+                updated.append(post)
+            else:
+                created.append(post)
+
+        BlogPost.objects.bulk_create(created)
+        if updated:
+            BlogPost.objects.bulk_update(updated, POST_UPDATE_FIELDS)
+            updated_ids = [post.pk for post in updated]
+            BlogPost.tags.through.objects.filter(blogpost_id__in=updated_ids).delete()
+            ImageReference.objects.filter(post_id__in=updated_ids).delete()
+
+        posts = created + updated
+        BlogPost.tags.through.objects.bulk_create(
+            [BlogPost.tags.through(blogpost_id=post.pk, tag_id=tag_id) for post in posts for tag_id in post.tag_ids],
+            ignore_conflicts=True,
+        )
+        references = [ImageReference(post_id=post.pk, path=path) for post in posts for path in referenced_paths(post)]
+        ImageReference.objects.bulk_create(references, ignore_conflicts=True)
+        if self.process_images:
+            # optimisation and renditions, handed to the pool when the batch commits
+            for path in {ref.path for ref in references} - self._queued_images:
+                images.enqueue(path)
+                self._queued_images.add(path)
+        search.index_posts(posts)
+        self.stats['post'] += len(created)
+        self.stats['post_updated'] += len(updated)
+
+    def import_comments(self, batch):
+        post_ids = dict(
+            BlogPost.objects.filter(slug__in={r['post'] for r in batch}).values_list('slug', 'pk')
+        )
+        usernames = {r['user'] for r in batch if r.get('user')}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        missing = usernames - users.keys()
+        if missing:
+            # commenters come over as accounts without a usable password
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None)) for name in missing], ignore_conflicts=True
+            )
+            users.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+            self.stats['user'] += len(missing)
+
+        keys = []
+        for record in batch:
+            post_id, user_id = post_ids.get(record['post']), users.get(record.get('user'))
+            if post_id is None or user_id is None:
+                self.stats['comment_orphaned'] += 1
+                continue
+            keys.append((record, post_id, user_id, _parse_timestamp(record.get('created_at'))))
+
+        # only the rows that can match this batch's keys, however many comments the posts already have
+        seen = set(Comment.objects.filter(
+            post_id__in={key[1] for key in keys},
+            user_id__in={key[2] for key in keys},
+            created_at__in={key[3] for key in keys},
+        ).values_list('post_id', 'user_id', 'created_at')) if keys else set()
+        new = []
+        for record, post_id, user_id, created_at in keys:
+            if (post_id, user_id, created_at) in seen:
+                self.stats['comment_skipped'] += 1
+                continue
+            seen.add((post_id, user_id, created_at))
+            new.append(Comment(post_id=post_id, user_id=user_id, content=record['content'], created_at=created_at))
+
+        Comment.objects.bulk_create(new)
+        # bulk_create skips Comment.save(), so the counts are brought up to date here
+        recount_comments(BlogPost.objects.filter(pk__in={comment.post_id for comment in new}))
+        self.stats['comment'] += len(new)
+
+
+def import_from(directory, batch_size=BATCH_SIZE, update=False, include_media=True, workers=1):
+    media_dir = os.path.join(directory, MEDIA_DIR)
+    importer = Importer(
+        media_dir=media_dir if include_media and os.path.isdir(media_dir) else None,
+        batch_size=batch_size,
+        update=update,
+        workers=workers,
+    )
+    return importer.run(read_records(os.path.join(directory, DATA_FILE)))
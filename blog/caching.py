@@ -0,0 +1,244 @@
+"""
+Rendered page caching for the public blog views.
+
+Nothing is ever deleted from the cache. Each cached page key embeds the
+current version tokens it depends on, and saving a post/comment/taxonomy
+just swaps the token once its transaction commits, so old entries stop
+being looked up and age out.
+
+- listing version: any post, category or tag change (list/category/tag pages)
+- taxonomy version: category or tag renames (shown on detail pages too)
+- post version: one per post, its content, tags and comments
+
+The same tokens are the pages' validators: a token is the time.time_ns()
+of the last change it covers (a post's updated_at, its newest comment,
+a rename), so anonymous pages get an ETag and Last-Modified, and a
+revalidation is answered with 304 from two cache reads, without a query
+or a render.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+LISTING_VERSION_KEY = 'blog:v:listing'
+TAXONOMY_VERSION_KEY = 'blog:v:taxonomy'
+POST_VERSION_KEY = 'blog:v:post:{}'
+SIDEBAR_KEY = 'blog:sidebar'
+
+
+def page_timeout():
+    return getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # a fresh token (not 1) so an evicted version key can't revive stale pages
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def _aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def _bump(*keys):
+    def bump():
+        version = time.time_ns()
+        cache.set_many({key: version for key in keys}, None)
+
+    # only once the change is visible: a request reading the old rows before
+    # the commit would otherwise cache them under the new version
+    transaction.on_commit(bump)
+
+
+def listing_version():
+    return _get_version(LISTING_VERSION_KEY)
+
+
+def post_version(post_id):
+    return f'{_get_version(POST_VERSION_KEY.format(post_id))}.{_get_version(TAXONOMY_VERSION_KEY)}'
+
+
+async def alisting_version():
+    return await _aget_version(LISTING_VERSION_KEY)
+
+
+async def apost_version(post_id):
+    return f'{await _aget_version(POST_VERSION_KEY.format(post_id))}.{await _aget_version(TAXONOMY_VERSION_KEY)}'
+
+
+def invalidate_post(post_id):
+    """A post's own page and every listing that may show it."""
+    _bump(POST_VERSION_KEY.format(post_id), LISTING_VERSION_KEY)
+
+
+def invalidate_comments(post_id):
+    """Comments only appear on the post's detail page."""
+    _bump(POST_VERSION_KEY.format(post_id))
+
+
+def invalidate_taxonomy():
+    _bump(TAXONOMY_VERSION_KEY, LISTING_VERSION_KEY)
+    invalidate_sidebar()
+
+
+def invalidate_sidebar():
+    """Drop the category/tag counts once the change commits, blog.taxonomy rebuilds them on next use."""
+    transaction.on_commit(lambda: cache.delete(SIDEBAR_KEY))
+
+
+def sidebar_timeout():
+    # bounds how long another process's local cache can keep a stale copy
+    return getattr(settings, 'BLOG_SIDEBAR_CACHE_TIMEOUT', 5 * 60)
+
+
+def _page_key(request, version):
+    raw = f'{request.get_host()}|{request.get_full_path()}|{version}'
+    return 'blog:page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _cacheable_request(request):
+    # logged-in pages carry CSRF tokens and per-user comment controls
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    # a pending flash message must be shown once, not frozen into the page
+    return len(get_messages(request)) == 0
+
+
+async def _acacheable_request(request):
+    if request.method != 'GET':
+        return False
+    # resolved up front: the lazy request.user would query synchronously,
+    # and this also loads the session the message check below reads
+    request.user = await request.auser()
+    return _cacheable_request(request)
+
+
+def _validators(version):
+    """(ETag, Last-Modified timestamp) for a page version."""
+    etag = 'W/"%s"' % hashlib.md5(str(version).encode()).hexdigest()
+    # every part is a time.time_ns() token, the newest is the last change
+    last_modified = max(int(part) for part in str(version).split('.')) // 10 ** 9
+    return etag, last_modified
+
+
+def _not_modified(request, version):
+    """(304 response or None, ETag, Last-Modified) for the request's If-None-Match/If-Modified-Since."""
+    etag, last_modified = _validators(version)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified), etag, last_modified
+
+
+def _shared(response, etag, last_modified):
+    # the same for every anonymous visitor; caches may keep it but must revalidate
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _personal(request, response):
+    # logged in, or showing a flash message: no validators, never in a shared cache
+    if request.method in ('GET', 'HEAD'):
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_anonymous_page(version_func):
+    """
+    Serve whole rendered pages to anonymous visitors from the cache.
+
+    `version_func(request, **kwargs)` returns the version string the page
+    depends on; bumping it is what invalidates the page. Async views take
+    an async version_func (alisting_page_version, adetail_page_version).
+
+    Anonymous responses carry an ETag and Last-Modified derived from the
+    version, and conditional requests that still match get a 304. Every
+    response varies on Cookie, since a session changes what is shown.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_cached(view, version_func)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable_request(request):
+                return _personal(request, view(request, *args, **kwargs))
+
+            version = version_func(request, **kwargs)
+            not_modified, etag, last_modified = _not_modified(request, version)
+            if not_modified is not None:
+                return _shared(not_modified, etag, last_modified)
+
+            key = _page_key(request, version)
+            content = cache.get(key)
+            if content is not None:
+                return _shared(HttpResponse(content), etag, last_modified)
+
+            response = view(request, *args, **kwargs)
+            # cookies mean the page was personalised (session, csrf), don't share it
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, response.content, page_timeout())
+                return _shared(response, etag, last_modified)
+            return _personal(request, response) if response.cookies else response
+        return wrapper
+    return decorator
+
+
+def _async_cached(view, version_func):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await _acacheable_request(request):
+            return _personal(request, await view(request, *args, **kwargs))
+
+        version = await version_func(request, **kwargs)
+        not_modified, etag, last_modified = _not_modified(request, version)
+        if not_modified is not None:
+            return _shared(not_modified, etag, last_modified)
+
+        key = _page_key(request, version)
+        content = await cache.aget(key)
+        if content is not None:
+            return _shared(HttpResponse(content), etag, last_modified)
+
+        response = await view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            await cache.aset(key, response.content, page_timeout())
+            return _shared(response, etag, last_modified)
+        return _personal(request, response) if response.cookies else response
+    return wrapper
+
+
+def listing_page_version(request, **kwargs):
+    return listing_version()
+
+
+def detail_page_version(request, id, **kwargs):
+    return post_version(id)
+
+
+async def alisting_page_version(request, **kwargs):
+    return await alisting_version()
+
+
+async def adetail_page_version(request, id, **kwargs):
+    return await apost_version(id)
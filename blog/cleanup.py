@@ -0,0 +1,236 @@
+"""
+Unused image cleanup, in small resumable steps.
+
+A run first scans blog_images/ in path order, CHUNK_SIZE files at a time,
+checking each chunk against the ImageReference table with one query. Every
+chunk commits its progress (the last path seen) on the ImageCleanup row, so
+a run that is interrupted resumes where it stopped instead of starting over.
+
+Files nobody references are not deleted on sight. They get an OrphanImage
+mark and are only removed by a later sweep once the grace period
+(BLOG_IMAGE_CLEANUP_GRACE seconds) has passed and they are still unused,
+so an image uploaded into a post that hasn't been saved yet survives.
+
+A dry run only reports what it finds and touches neither marks nor files.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import renditions
+from .storage import IMAGE_DIR
+
+CHUNK_SIZE = 500
+REPORT_LIMIT = 1000  # orphans listed in a dry-run report, the counters keep going
+DEFAULT_GRACE = 7 * 24 * 60 * 60
+PARTIAL_SUFFIXES = ('.tmp', '.upload')  # files still being written
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def grace_period():
+    return timedelta(seconds=getattr(settings, 'BLOG_IMAGE_CLEANUP_GRACE', DEFAULT_GRACE))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # one worker: runs never overlap within a process
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blog-cleanup')
+    return _executor
+
+
+def iter_files(after=''):
+    """
+    Yield (path, size) for every file under blog_images/ after `after`, in path order.
+
+    Directories that sort entirely before `after` are skipped without being listed.
+    """
+    def walk(directory):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        # sort "ab/" after "ab.jpg", the same order the full paths compare in
+        entries.sort(key=lambda e: e.name + '/' if e.is_dir(follow_symlinks=False) else e.name)
+        for entry in entries:
+            rel = os.path.relpath(entry.path, settings.MEDIA_ROOT).replace('\\', '/')
+            if entry.is_dir(follow_symlinks=False):
+                if after and rel + '/' < after and not after.startswith(rel + '/'):
+                    continue
+                yield from walk(entry.path)
+            elif rel > after and not entry.name.endswith(PARTIAL_SUFFIXES):
+                yield rel, entry.stat().st_size
+
+    yield from walk(os.path.join(settings.MEDIA_ROOT, IMAGE_DIR))
+
+
+def scan_chunk(run, chunk_size=CHUNK_SIZE):
+    """Check the next chunk of files; returns False once the scan has reached the end."""
+    from .models import ImageReference, OrphanImage
+
+    batch = list(islice(iter_files(run.cursor), chunk_size))
+    if not batch:
+        return False
+
+    paths = [path for path, _ in batch]
+    used = set(ImageReference.objects.filter(path__in=paths).values_list('path', flat=True))
+    orphans = [(path, size) for path, size in batch if path not in used]
+
+    with transaction.atomic():
+        if run.dry_run:
+            room = REPORT_LIMIT - len(run.report)
+            run.report.extend({'path': path, 'size': size} for path, size in orphans[:max(room, 0)])
+        else:
+            now = timezone.now()
+            # used again since an earlier run marked them
+            OrphanImage.objects.filter(path__in=used).delete()
+            # existing marks keep their original deadline
+            OrphanImage.objects.bulk_create(
+                [OrphanImage(path=path, size=size, found_at=now, delete_after=now + grace_period())
+                 for path, size in orphans],
+                ignore_conflicts=True,
+            )
+        run.scanned += len(batch)
+        run.orphaned += len(orphans)
+        run.orphaned_bytes += sum(size for _, size in orphans)
+        run.cursor = paths[-1]
+        run.save()
+    return True
+
+
+def sweep_chunk(run, chunk_size=CHUNK_SIZE):
+    """Delete the next chunk of orphans past their grace period; False when none are due."""
+    from .models import ImageReference, OrphanImage
+
+    due = list(OrphanImage.objects.filter(delete_after__lte=timezone.now()).order_by('pk')[:chunk_size])
+    if not due:
+        return False
+
+    # re-check: a post may have started using the file during the grace period
+    used = set(ImageReference.objects.filter(path__in=[o.path for o in due]).values_list('path', flat=True))
+    for orphan in due:
+        if orphan.path in used:
+            continue
+        full_path = os.path.join(settings.MEDIA_ROOT, orphan.path)
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        else:
+            logger.debug("Deleted unused image", extra={'path': orphan.path, 'bytes': orphan.size, 'cleanup': run.pk})
+            run.deleted += 1
+            run.deleted_bytes += orphan.size
+        renditions.delete(orphan.path)
+
+    with transaction.atomic():
+        OrphanImage.objects.filter(pk__in=[o.pk for o in due]).delete()
+        run.save()
+    return True
+
+
+def step(run, chunk_size=CHUNK_SIZE):
+    """Do one chunk of work. Returns False when the run is finished."""
+    from .models import ImageCleanup
+
+    if run.phase == ImageCleanup.SCAN:
+        if scan_chunk(run, chunk_size):
+            return True
+        if run.dry_run:
+            return False
+        run.phase = ImageCleanup.SWEEP
+        run.save(update_fields=['phase', 'updated_at'])
+        return True
+    return sweep_chunk(run, chunk_size)
+
+
+def run_cleanup(cleanup_id, chunk_size=CHUNK_SIZE):
+    """Run (or resume) a cleanup to the end. Returns the finished run."""
+    from .models import ImageCleanup
+
+    run = ImageCleanup.objects.get(pk=cleanup_id)
+    if run.status == ImageCleanup.DONE:
+        return run
+    run.status = ImageCleanup.RUNNING
+    run.error = ''
+    run.save(update_fields=['status', 'error', 'updated_at'])
+
+    started = time.perf_counter()
+    try:
+        while True:
+            chunk_started = time.perf_counter()
+            more = step(run, chunk_size)
+            logger.debug("Image cleanup chunk", extra={
+                'cleanup': run.pk, 'phase': run.phase, 'cursor': run.cursor,
+                'duration_ms': round((time.perf_counter() - chunk_started) * 1000, 2),
+            })
+            if not more:
+                break
+    except Exception as e:
+        logger.exception("Image cleanup failed", extra={
+            'cleanup': run.pk, 'cursor': run.cursor, 'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        })
+        run.status = ImageCleanup.FAILED
+        run.error = str(e)
+        run.save(update_fields=['status', 'error', 'updated_at'])
+        return run
+
+    run.status = ImageCleanup.DONE
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'finished_at', 'updated_at'])
+    logger.info("Image cleanup finished", extra={
+        'cleanup': run.pk, 'dry_run': run.dry_run, 'scanned': run.scanned, 'orphaned': run.orphaned,
+        'deleted': run.deleted, 'deleted_bytes': run.deleted_bytes,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+    return run
+
+
+def run_in_worker(cleanup_id):
+    try:
+        run_cleanup(cleanup_id)
+    finally:
+        close_old_connections()
+
+
+def active_run():
+    from .models import ImageCleanup
+
+    return ImageCleanup.objects.filter(status__in=[ImageCleanup.PENDING, ImageCleanup.RUNNING]).first()
+
+
+def start(dry_run=True):
+    """
+    Queue a new cleanup in the background. Returns (run, created).
+
+    If a run is already pending or running that one is returned instead,
+    two runs sweeping the same files would only get in each other's way.
+    """
+    from .models import ImageCleanup
+
+    existing = active_run()
+    if existing is not None:
+        return existing, False
+    run = ImageCleanup.objects.create(dry_run=dry_run)
+    transaction.on_commit(lambda: get_executor().submit(run_in_worker, run.pk))
+    return run, True
+
+
+def resume(run):
+    """Hand an interrupted or failed run back to the background worker."""
+    from .models import ImageCleanup
+
+    ImageCleanup.objects.filter(pk=run.pk).update(status=ImageCleanup.PENDING)
+    transaction.on_commit(lambda: get_executor().submit(run_in_worker, run.pk))
@@ -0,0 +1,132 @@
+"""
+Find the images a post body uses.
+
+Rich content is scanned in two stages. A single regex pass finds
+candidate <img>/<source> tags lazily; only their attributes are then
+tokenized, with the same rules html.parser uses (single, double or no
+quotes, any case, entities decoded). Feeding whole 1 MB bodies through
+html.parser would be ~50x slower (see `manage.py
+benchmark_image_extraction`), and nothing builds a list of the whole
+document: references are yielded as they are found.
+
+Covers <img src>, <img srcset> and <picture><source srcset/src>.
+"""
+import re
+from html import escape, unescape
+from urllib.parse import unquote
+
+from django.conf import settings
+
+# an <img ...> or <source ...> tag and its attribute markup, quoted values may contain '>'
+# (case spelled out: re.IGNORECASE makes the scan over long bodies noticeably slower)
+IMAGE_TAG_RE = re.compile(r'<(?:[iI][mM][gG]|[sS][oO][uU][rR][cC][eE])\b([^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*)>')
+# name[=value] pairs inside a tag, as html.parser's attrfind_tolerant splits them
+ATTR_RE = re.compile(r'''([^\s/>"'=][^\s/>=]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]*))?''')
+URL_ATTRS = ('src', 'srcset')
+# a srcset candidate URL runs to the next whitespace, separators before it are skipped
+SRCSET_URL_RE = re.compile(r'[\s,]*(\S+)')
+
+
+def _srcset_spans(value):
+    """(start, end) of each candidate URL in a srcset value."""
+    pos, end = 0, len(value)
+    while pos < end:
+        match = SRCSET_URL_RE.match(value, pos)
+        if not match:
+            return
+        url, pos = match.group(1), match.end()
+        if url.endswith(','):
+            url = url.rstrip(',')  # "a.jpg,b.jpg": no descriptor, the comma ends the candidate
+        else:
+            # skip the descriptors up to the next candidate
+            comma = value.find(',', pos)
+            pos = end if comma == -1 else comma + 1
+        if url:
+            yield match.start(1), match.start(1) + len(url)
+
+
+def parse_srcset(value):
+    """URLs of a srcset attribute ("a.jpg 480w, b.jpg 2x"), following the HTML candidate rules."""
+    for start, end in _srcset_spans(value):
+        yield value[start:end]
+
+
+def _url_attr_matches(markup):
+    """(match, name, value) for the src/srcset attributes in a tag's attribute markup."""
+    for match in ATTR_RE.finditer(markup):
+        name = match.group(1).lower()
+        value = match.group(2)
+        if name not in URL_ATTRS or not value:
+            continue
+        if value[0] in '"\'' and value[0] == value[-1]:
+            value = value[1:-1]
+        if '&' in value:
+            value = unescape(value)
+        if value:
+            yield match, name, value
+
+
+def iter_url_attrs(markup):
+    """(name, value) for the src/srcset attributes in a tag's attribute markup."""
+    for _, name, value in _url_attr_matches(markup):
+        yield name, value
+
+
+def iter_image_urls(html):
+    """Yield every image URL in the HTML, in document order, as written (entities decoded)."""
+    if not html:
+        return
+    for match in IMAGE_TAG_RE.finditer(html):
+        for name, value in iter_url_attrs(match.group(1)):
+            if name == 'srcset':
+                yield from parse_srcset(value)
+            else:
+                yield value.strip()
+
+
+def rewrite_image_urls(html, replace):
+    """
+    The HTML with every image URL passed through replace(url). Only the
+    src/srcset values that change are rewritten (double-quoted, escaped);
+    the rest of the markup is kept as written.
+    """
+    def rewrite_tag(tag):
+        markup = tag.group(1)
+        parts, last = [], 0
+        for match, name, value in _url_attr_matches(markup):
+            if name == 'srcset':
+                new, pos = [], 0
+                for start, end in _srcset_spans(value):
+                    new += [value[pos:start], replace(value[start:end])]
+                    pos = end
+                new = ''.join(new) + value[pos:]
+            else:
+                url = value.strip()
+                new = value.replace(url, replace(url), 1)
+            if new != value:
+                parts += [markup[last:match.start(2)], '"', escape(new), '"']
+                last = match.end(2)
+        if not parts:
+            return tag.group(0)
+        start = tag.start(1) - tag.start(0)
+        return tag.group(0)[:start] + ''.join(parts) + markup[last:] + '>'
+
+    return IMAGE_TAG_RE.sub(rewrite_tag, html) if html else html
+
+
+def media_path(url, media_url=None):
+    """'blog_images/x.jpg' for a URL under MEDIA_URL on this site, None otherwise."""
+    media_url = media_url or settings.MEDIA_URL
+    if not url.startswith(media_url):
+        return None  # other sites, /static/, data: URIs
+    path = url[len(media_url):].split('?', 1)[0].split('#', 1)[0]
+    return unquote(path) if '%' in path else path
+
+
+def iter_image_paths(html):
+    """Yield the media-relative path of every local image the HTML uses."""
+    media_url = settings.MEDIA_URL
+    for url in iter_image_urls(html):
+        path = media_path(url, media_url)
+        if path:
+            yield path
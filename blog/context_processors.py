@@ -1,5 +1,11 @@
 from datetime import datetime
 
+from .caching import page_timeout
+
 def current_time(request):
     """Adds the current time to the context."""
     return {'current_time': datetime.now()}
+
+def page_cache(request):
+    """Timeout for the {% cache %} fragments in the blog templates."""
+    return {'page_cache_timeout': page_timeout()}
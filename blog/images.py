@@ -0,0 +1,212 @@
+"""
+Background image optimisation.
+
+Uploads are stored as-is and answered straight away. An ImageJob row is
+queued for each stored file and a small thread pool resizes, re-encodes,
+strips metadata and writes the responsive renditions off the request path. The optimised file is written
+next to the original and swapped in with os.replace, so readers only ever
+see the old or the new file, never half of one. The posts using it are
+then rendered again, so their pages pick up the new file and srcset.
+
+Jobs survive restarts in the ImageJob table: `manage.py process_image_queue`
+drains whatever is still pending or failed.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import caching, renditions, snapshots
+
+MAX_SIZE = (1200, 1200)
+RESIZE_OVER_BYTES = 1024 * 1024  # 1 MB
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # seconds, doubled per attempt
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_async():
+    return getattr(settings, 'BLOG_IMAGE_ASYNC', True)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BLOG_IMAGE_WORKERS', 2),
+                thread_name_prefix='blog-images',
+            )
+    return _executor
+
+
+def optimize_image(path):
+    """
+    Shrink, re-encode and strip metadata in place. Returns True if the file changed.
+
+    Small images without metadata are left byte-for-byte alone.
+    """
+    with Image.open(path) as img:
+        if getattr(img, 'is_animated', False):
+            return False  # re-encoding would drop the frames
+
+        too_big = os.path.getsize(path) > RESIZE_OVER_BYTES or img.width > MAX_SIZE[0] or img.height > MAX_SIZE[1]
+        has_metadata = bool(img.getexif())
+        if not too_big and not has_metadata:
+            return False
+
+        image_format = img.format
+        # bake the EXIF rotation into the pixels before EXIF is thrown away
+        out = ImageOps.exif_transpose(img)
+        if too_big:
+            out.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and out.mode not in ('RGB', 'L'):
+            out = out.convert('RGB')
+
+        tmp_path = f'{path}.tmp'
+        save_kwargs = {'optimize': True}
+        if image_format in ('JPEG', 'WEBP'):
+            save_kwargs['quality'] = 70 if too_big else 85
+        if img.info.get('icc_profile'):
+            save_kwargs['icc_profile'] = img.info['icc_profile']  # keep colours right
+        try:
+            # no exif= passed, so camera/GPS metadata is not written
+            out.save(tmp_path, format=image_format, **save_kwargs)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    os.replace(tmp_path, path)
+    return True
+
+
+def enqueue(name):
+    """
+    Queue optimisation of a media-relative file (e.g. "blog_images/x.jpg").
+
+    The job is only handed to the pool once the surrounding transaction
+    commits, so a rolled-back save never processes a file. A file a done
+    job already optimised is left alone: storage keeps it when the same
+    bytes are uploaded again, and re-encoding it would only lose quality.
+    """
+    from .models import ImageJob
+
+    try:
+        job, created = ImageJob.objects.get_or_create(path=name)
+    except IntegrityError:
+        # a concurrent upload of the same file inserted it in between
+        job, created = ImageJob.objects.get(path=name), False
+    if not created and job.status == ImageJob.DONE and _processed(job):
+        return job
+    if not created:
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.PENDING, attempts=0, error='', run_after=timezone.now()
+        )
+
+    if is_async():
+        transaction.on_commit(lambda: get_executor().submit(run_in_worker, job.pk))
+    else:
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job
+
+
+def _processed(job):
+    """True if the file hasn't been written since `job` finished with it (a newer one is a fresh upload)."""
+    try:
+        return os.path.getmtime(os.path.join(settings.MEDIA_ROOT, job.path)) <= job.updated_at.timestamp()
+    except OSError:
+        return False
+
+
+def refresh_posts(path):
+    """
+    Render the published posts showing `path` again (page cache and
+    snapshots), so they link its optimised file and its renditions.
+    """
+    from .models import ImageReference
+
+    post_ids = ImageReference.objects.filter(path=path, post__publish=True).values_list('post_id', flat=True)
+    for post_id in post_ids:
+        caching.invalidate_post(post_id)
+        snapshots.refresh_post(post_id)
+
+
+def claim(job_id):
+    """Move a due job to processing; False if another worker got it first."""
+    from .models import ImageJob
+
+    return ImageJob.objects.filter(
+        pk=job_id, status=ImageJob.PENDING, run_after__lte=timezone.now()
+    ).update(status=ImageJob.PROCESSING, attempts=F('attempts') + 1, updated_at=timezone.now()) == 1
+
+
+def run_job(job_id):
+    """Process one job. Returns the job, or None if it wasn't due or was taken."""
+    from .models import ImageJob
+
+    if not claim(job_id):
+        return None
+    job = ImageJob.objects.get(pk=job_id)
+    full_path = os.path.join(settings.MEDIA_ROOT, job.path)
+
+    started = time.perf_counter()
+    try:
+        size_before = os.path.getsize(full_path)
+        changed = optimize_image(full_path)
+        # scaled WebP/AVIF copies for srcset, made from the optimised file
+        written = renditions.generate(job.path, force=changed)
+    except FileNotFoundError:
+        # the post or upload went away before we got to it, nothing to retry
+        logger.info("Image job skipped, file no longer exists", extra={'path': job.path, 'job': job.pk})
+        job.mark(ImageJob.FAILED, 'file no longer exists')
+        return job
+    except Exception as e:
+        # anything (a corrupt file, PIL's DecompressionBombError, a full disk) is
+        # retried and then failed, never left in PROCESSING for the pool to swallow
+        if job.attempts >= MAX_ATTEMPTS:
+            logger.error("Image job gave up", exc_info=True, extra={
+                'path': job.path, 'job': job.pk, 'attempts': job.attempts, 'error': str(e),
+            })
+            job.mark(ImageJob.FAILED, str(e))
+        else:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning("Image job failed, retrying", extra={
+                'path': job.path, 'job': job.pk, 'attempts': job.attempts, 'retry_in_s': delay, 'error': str(e),
+            })
+            job.mark(ImageJob.PENDING, str(e), run_after=timezone.now() + timedelta(seconds=delay))
+            if is_async():
+                timer = threading.Timer(delay, lambda: get_executor().submit(run_in_worker, job_id))
+                timer.daemon = True  # the queue table still has it if we exit first
+                timer.start()
+        return job
+
+    logger.info("Image optimised" if changed else "Image already optimised", extra={
+        'path': job.path, 'job': job.pk, 'bytes_before': size_before, 'bytes_after': os.path.getsize(full_path),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+    job.mark(ImageJob.DONE, '' if changed else 'already optimised')
+    if changed or written:
+        refresh_posts(job.path)
+    return job
+
+
+def run_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # pool threads keep their own DB connection, drop it once stale
+        close_old_connections()
+
@@ -0,0 +1,565 @@
+"""
+Load tests for the public URL surface (`manage.py benchmark_site`).
+
+Three parts:
+
+* a deterministic data generator: the same seed always produces the same
+  categories, tags, posts, images and comments, loaded with blog.bulk;
+* scenarios, one per route in blog/urls.py, each rotating through a
+  fixed list of URLs so page caches see a realistic mix;
+* drivers that replay the scenarios in-process (Django's WSGI Client
+  from a thread per client, ASGI AsyncClient from a task per client on
+  one event loop) or over a local HTTP server (wsgiref, or uvicorn for
+  ASGI when it is installed), recording latency, queries and memory.
+
+Either the sync views or their async versions (blog/async_views.py) can
+be measured, so a deployment model can be picked on numbers.
+
+Results are compared to a stored baseline so a regression fails the run.
+"""
+import asyncio
+import importlib
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import clear_url_caches, reverse
+from PIL import Image
+
+from . import bulk, search
+from .models import BlogPost, Category, Comment, ImageJob, Tag
+from .pagination import KeysetPaginator
+
+MODES = ('wsgi', 'asgi', 'wsgi-http', 'asgi-http')
+VIEWS = ('sync', 'async')
+# regression thresholds, see compare()
+DEFAULT_TOLERANCE = 0.25
+LATENCY_SLACK_MS = 1.0  # sub-millisecond routes are all noise
+QUERY_SLACK = 0.5
+
+WORDS = (
+    'mango jackfruit lychee banana guava orchard soil harvest monsoon pruning grafting seedling '
+    'canopy blossom compost irrigation shade mulch sapling fruit tree leaf root sun rain'
+).split()
+SEARCH_TERMS = ('mango', 'harvest monsoon', 'graft*', '"fruit tree"', 'irrigation')
+
+
+# --- Deterministic data ---
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_images(directory, count, seed):
+    """Small, distinct JPEGs under <directory>/blog_images/, returns their media paths."""
+    rng = random.Random(seed)
+    paths = []
+    os.makedirs(os.path.join(directory, 'blog_images'), exist_ok=True)
+    for i in range(count):
+        path = f'blog_images/bench-{i}.jpg'
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (800, 500), color).save(os.path.join(directory, path), quality=80)
+        paths.append(path)
+    return paths
+
+
+def generate_records(posts=2000, comments=20000, tags=200, categories=8, images=(), seed=42):
+    """Export-format records (see blog/bulk.py), identical for identical arguments."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+    for i in range(categories):
+        yield {'type': 'category', 'name': f'Bench category {i}', 'slug': f'bench-category-{i}'}
+    for i in range(tags):
+        yield {'type': 'tag', 'name': f'bench tag {i}', 'slug': f'bench-tag-{i}'}
+
+    for i in range(posts):
+        paragraphs = [f'<p>{_sentence(rng, 40)}</p>' for _ in range(rng.randint(5, 30))]
+        if images and rng.random() < 0.5:
+            paragraphs.insert(2, f'<p><img alt="" src="/media/{rng.choice(images)}"></p>')
+        created = start + timedelta(hours=i)
+        yield {
+            'type': 'post',
+            'slug': f'bench-post-{i}',
+            'title': _sentence(rng, 6).rstrip('.'),
+            'description': _sentence(rng, 20),
+            'content': ''.join(paragraphs),
+            'image': rng.choice(images) if images else '',
+            'category': f'bench-category-{rng.randrange(categories)}',
+            # a few very popular tags, a long tail of rare ones
+            'tags': sorted({f'bench-tag-{min(int(rng.paretovariate(1.2)) - 1, tags - 1)}' for _ in range(5)}),
+            'author': 'bench-author',
+            'publish': rng.random() < 0.9,
+            'created_at': created.isoformat(),
+            'updated_at': created.isoformat(),
+        }
+
+    for i in range(comments):
+        # a third of all comments land on the newest post, the "viral" one
+        post = posts - 1 if i % 3 == 0 else rng.randrange(posts)
+        yield {
+            'type': 'comment',
+            'post': f'bench-post-{post}',
+            'user': f'bench-reader-{rng.randrange(200)}',
+            'content': _sentence(rng, rng.randint(5, 40)),
+            'created_at': (start + timedelta(hours=post, minutes=i % 600)).isoformat(),
+        }
+
+
+@contextmanager
+def scratch_database(directory):
+    """A throwaway test database, a file under `directory` on SQLite."""
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # a file, so the HTTP server and client threads all see the same data
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'loadtest.sqlite3')
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    search._backend = None  # re-detect FTS5 on the test database
+    try:
+        # the views are what's measured, not the site's snapshots
+        with override_settings(BLOG_SNAPSHOTS=False):
+            yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        search._backend = None
+
+
+def seed_database(media_dir, posts, comments, tags, seed):
+    User.objects.create_user('bench-author', password='bench')
+    User.objects.create_user('bench-reader', password='bench')
+    images = generate_images(media_dir, 12, seed)
+    # no background image jobs competing with the requests being measured
+    importer = bulk.Importer(media_dir=media_dir, process_images=False)
+    return importer.run(generate_records(posts, comments, tags, images=images, seed=seed))
+
+
+def _reload_urlconf():
+    from . import urls
+
+    importlib.reload(urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def views(flavour):
+    """Serve the blog with its sync views or their async versions (BLOG_ASYNC_VIEWS)."""
+    try:
+        with override_settings(BLOG_ASYNC_VIEWS=flavour == 'async'):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
+
+
+# --- Scenarios ---
+
+class Scenario:
+    """One route: the URLs to rotate through, plus method/body/login."""
+
+    def __init__(self, name, urls, method='GET', data=None, login=False, http=True, expect=(200,)):
+        self.name = name
+        self.urls = urls
+        self.method = method
+        self.data = data  # callable returning a fresh POST body
+        self.login = login
+        self.http = http  # False: needs a CSRF token, in-process only
+        self.expect = expect
+        self._next = itertools.cycle(urls)
+
+    def next_url(self):
+        return next(self._next)
+
+
+def _upload_body():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (random.randrange(256), 90, 40)).save(buffer, 'JPEG')
+    buffer.seek(0)
+    buffer.name = 'bench-upload.jpg'
+    return {'upload': buffer}
+
+
+def build_scenarios():
+    published = BlogPost.objects.filter(publish=True)
+    newest = list(published.order_by('-created_at', '-id')[:50])
+    viral = newest[0]
+    categories = list(Category.objects.order_by('slug').values_list('slug', flat=True))
+    popular_tags = list(Tag.objects.order_by('slug').values_list('slug', flat=True)[:20])
+    paginator = KeysetPaginator(published)
+    deep_pages = [f"{reverse('blog_list')}?cursor={paginator.cursor_for_page(n)}" for n in (2, 5, 20)]
+    reader = User.objects.get(username='bench-reader')
+    comment = Comment.objects.filter(user=reader).first() or Comment.objects.create(
+        post=viral, user=reader, content='Benchmark comment to edit')
+
+    scenarios = [
+        Scenario('blog_list', [reverse('blog_list')]),
+        Scenario('blog_list_deep', deep_pages),
+        Scenario('category_posts', [reverse('category_posts', args=[slug]) for slug in categories]),
+        Scenario('tag_posts', [reverse('tag_posts', args=[slug]) for slug in popular_tags]),
+        Scenario('search_posts', [f"{reverse('search_posts')}?q={urllib.request.quote(q)}" for q in SEARCH_TERMS]),
+        Scenario('blog_detail', [post.get_absolute_url() for post in newest]),
+        Scenario('blog_detail_viral', [viral.get_absolute_url()]),
+        Scenario('blog_detail_id', [reverse('blog_detail_id', args=[post.pk]) for post in newest[:10]], expect=(301,)),
+        Scenario('about', [reverse('about')]),
+        Scenario('signup', [reverse('signup')]),
+        Scenario('ckeditor_upload', [reverse('ckeditor-upload')], method='POST', data=_upload_body),
+        Scenario('add_comment', [viral.get_absolute_url()], method='POST', login=True, http=False,
+                 data=lambda: {'content': 'Benchmark comment'}, expect=(302,)),
+    ]
+    scenarios.append(Scenario('edit_comment', [reverse('edit_comment', args=[comment.pk])], method='POST',
+                              login=True, http=False, data=lambda: {'content': 'Edited'}, expect=(302,)))
+    return scenarios
+
+
+# --- Measuring ---
+
+def _count_query(execute, sql, params, many, context):
+    counter = QueryCounter.active
+    if counter:
+        with counter._lock:
+            counter.value += 1
+    return execute(sql, params, many, context)
+
+
+def _install_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class QueryCounter:
+    """
+    Counts SQL statements on every connection, including ones opened by
+    request threads. Those threads (ASGI executors, the HTTP server) keep
+    their connections between scenarios, so one wrapper stays installed
+    on each and counts into whichever counter is active.
+    """
+    active = None
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        connection_created.connect(_install_counter, dispatch_uid='blog-loadtest-queries')
+        for connection in connections.all():
+            _install_counter(connection)
+        QueryCounter.active = self
+        return self
+
+    def __exit__(self, *exc):
+        QueryCounter.active = None
+
+
+def summarize(latencies, wall, queries, requests, errors, peak_kb=None):
+    ms = sorted(latency * 1000 for latency in latencies)
+    cuts = statistics.quantiles(ms, n=100, method='inclusive') if len(ms) > 1 else ms * 99
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50': round(cuts[49], 3),
+        'p95': round(cuts[94], 3),
+        'p99': round(cuts[98], 3),
+        'mean': round(statistics.fmean(ms), 3),
+        'rps': round(requests / wall, 1) if wall else 0.0,
+        'queries': round(queries / requests, 2) if requests else 0.0,
+        'peak_kb': peak_kb,
+    }
+
+
+def _check(scenario, status):
+    return status in scenario.expect
+
+
+def _logged_in_client(client_class):
+    client = client_class()
+    client.force_login(User.objects.get(username='bench-reader'))
+    return client
+
+
+def _shares(requests, concurrency):
+    """Split `requests` over `concurrency` clients."""
+    concurrency = max(1, min(concurrency, requests))
+    return [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+
+def run_wsgi(scenario, requests, warmup, concurrency=1):
+    """Through Django's WSGI handler, one thread per client like a threaded WSGI server."""
+    def new_client():
+        return _logged_in_client(Client) if scenario.login else Client()
+
+    def call(client):
+        url = scenario.next_url()
+        if scenario.method == 'POST':
+            return client.post(url, scenario.data())
+        return client.get(url)
+
+    client = new_client()
+    for _ in range(warmup):
+        call(client)
+
+    # one short pass under tracemalloc for memory, kept out of the timings
+    tracemalloc.start()
+    for _ in range(min(5, requests)):
+        call(client)
+    peak_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.stop()
+
+    def worker(count):
+        client = new_client()
+        timings = []
+        for _ in range(count):
+            t0 = time.perf_counter()
+            response = call(client)
+            timings.append((time.perf_counter() - t0, response.status_code))
+        return timings
+
+    shares = _shares(requests, concurrency)
+    with QueryCounter() as counter, ThreadPoolExecutor(max_workers=len(shares)) as pool:
+        started = time.perf_counter()
+        results = [timing for timings in pool.map(worker, shares) for timing in timings]
+        wall = time.perf_counter() - started
+    errors = sum(not _check(scenario, status) for _, status in results)
+    return summarize([latency for latency, _ in results], wall, counter.value, requests, errors, peak_kb)
+
+
+def run_asgi(scenario, requests, warmup, concurrency=1):
+    """Through Django's ASGI handler, one task per client on a single event loop."""
+    # request threads come and go inside the event loop, so count from the start
+    counter = QueryCounter()
+
+    async def new_client():
+        client = AsyncClient()
+        if scenario.login:
+            await client.aforce_login(await User.objects.aget(username='bench-reader'))
+        return client
+
+    async def call(client):
+        url = scenario.next_url()
+        if scenario.method == 'POST':
+            return await client.post(url, scenario.data())
+        return await client.get(url)
+
+    async def worker(count):
+        client = await new_client()
+        timings = []
+        for _ in range(count):
+            t0 = time.perf_counter()
+            response = await call(client)
+            timings.append((time.perf_counter() - t0, response.status_code))
+        return timings
+
+    async def drive():
+        client = await new_client()
+        for _ in range(warmup):
+            await call(client)
+        tracemalloc.start()
+        for _ in range(min(5, requests)):
+            await call(client)
+        peak_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+
+        counter.value = 0
+        started = time.perf_counter()
+        per_worker = await asyncio.gather(*(worker(count) for count in _shares(requests, concurrency)))
+        return [timing for timings in per_worker for timing in timings], time.perf_counter() - started, peak_kb
+
+    with counter:
+        results, wall, peak_kb = asyncio.run(drive())
+    errors = sum(not _check(scenario, status) for _, status in results)
+    return summarize([latency for latency, _ in results], wall, counter.value, requests, errors, peak_kb)
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer:
+    """The site on 127.0.0.1 in a background thread: wsgiref, or uvicorn for ASGI."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.thread = None
+
+    def __enter__(self):
+        if self.kind == 'wsgi':
+            self.server = make_server('127.0.0.1', 0, WSGIHandler(), _ThreadingWSGIServer, _QuietHandler)
+            self.port = self.server.server_port
+            self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        else:
+            import uvicorn
+            from django.core.asgi import get_asgi_application
+
+            self.port = _free_port()
+            config = uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=self.port, log_level='error')
+            self.server = uvicorn.Server(config)
+            self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        self._wait_ready()
+        return self
+
+    def _wait_ready(self):
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{self.port}{reverse("about")}', timeout=1)
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise RuntimeError(f"{self.kind} server did not come up")
+
+    def __exit__(self, *exc):
+        if self.kind == 'wsgi':
+            self.server.shutdown()
+            self.server.server_close()
+        else:
+            self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def _free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_http(scenario, requests, warmup, port, concurrency):
+    opener = urllib.request.build_opener(_NoRedirect)
+
+    def call():
+        url = f'http://127.0.0.1:{port}{scenario.next_url()}'
+        body, headers = None, {}
+        if scenario.method == 'POST':
+            body = encode_multipart(BOUNDARY, scenario.data())
+            headers['Content-Type'] = MULTIPART_CONTENT
+        t0 = time.perf_counter()
+        try:
+            with opener.open(urllib.request.Request(url, body, headers), timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return time.perf_counter() - t0, status
+
+    for _ in range(warmup):
+        call()
+    with QueryCounter() as counter, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: call(), range(requests)))
+        wall = time.perf_counter() - started
+    errors = sum(not _check(scenario, status) for _, status in results)
+    return summarize([latency for latency, _ in results], wall, counter.value, requests, errors)
+
+
+def settle(timeout=30):
+    """Wait for uploads' optimisation jobs, so they don't eat into the next route's numbers."""
+    deadline = time.monotonic() + timeout
+    busy = ImageJob.objects.filter(status__in=(ImageJob.PENDING, ImageJob.PROCESSING))
+    while busy.exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+
+def run_mode(mode, scenarios, requests, warmup, concurrency=4, progress=None):
+    results = {}
+
+    def measure(run):
+        for scenario in scenarios:
+            if mode.endswith('-http') and not scenario.http:
+                continue
+            cache.clear()  # every scenario starts cold and warms up the same way
+            results[scenario.name] = run(scenario)
+            settle()
+            if progress:
+                progress(mode, scenario.name, results[scenario.name])
+
+    if mode == 'wsgi':
+        measure(lambda s: run_wsgi(s, requests, warmup, concurrency))
+    elif mode == 'asgi':
+        measure(lambda s: run_asgi(s, requests, warmup, concurrency))
+    else:
+        with LocalServer(mode.split('-')[0]) as server:
+            measure(lambda s: run_http(s, requests, warmup, server.port, concurrency))
+    return results
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- Baselines ---
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, report):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regressions of `report` against `baseline`, as readable strings.
+
+    Latency (p95) and memory may grow by `tolerance` (plus a little
+    absolute slack), throughput may drop by as much; query counts must not
+    grow at all, they are deterministic.
+    """
+    problems = []
+    for mode, scenarios in report['results'].items():
+        for name, now in scenarios.items():
+            before = baseline.get('results', {}).get(mode, {}).get(name)
+            if not before:
+                continue
+            label = f'{mode} {name}'
+            if now['errors'] > before['errors']:
+                problems.append(f"{label}: {now['errors']} errors (baseline {before['errors']})")
+            if now['p95'] > before['p95'] * (1 + tolerance) + LATENCY_SLACK_MS:
+                problems.append(f"{label}: p95 {now['p95']:.2f} ms (baseline {before['p95']:.2f} ms)")
+            # as time per request, so sub-millisecond routes get the same slack as p95
+            if 1000 / now['rps'] > 1000 / before['rps'] * (1 + tolerance) + LATENCY_SLACK_MS:
+                problems.append(f"{label}: {now['rps']:.0f} req/s (baseline {before['rps']:.0f} req/s)")
+            if now['queries'] > before['queries'] + QUERY_SLACK:
+                problems.append(f"{label}: {now['queries']} queries/request (baseline {before['queries']})")
+            if now.get('peak_kb') and before.get('peak_kb') and now['peak_kb'] > before['peak_kb'] * (1 + tolerance) + 64:
+                problems.append(f"{label}: peak {now['peak_kb']:.0f} KB (baseline {before['peak_kb']:.0f} KB)")
+    return problems
@@ -0,0 +1,119 @@
+"""
+Logging plumbing referenced from LOGGING and LOGGING_CONFIG in my_blog/settings.py.
+
+Request threads never write to stdout themselves: QueueHandler puts the
+record on an in-memory queue and a QueueListener thread formats and
+writes it, so a slow or blocked stdout can't stall a view. Records are
+formatted as one JSON object per line, with anything passed in `extra=`
+(path, duration_ms, ...) as top-level fields.
+
+Loggers are per subsystem, named after the module: blog.images,
+blog.cleanup, blog.models, blog.views, blog.admin.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+# attributes every LogRecord has; the rest came in through extra=
+RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, dt_timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text  # formatted by QueueHandler.prepare
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(config):
+    """
+    LOGGING_CONFIG: dictConfig, then give each QueueHandler the handlers
+    its `handlers` names, which only all exist once dictConfig is done.
+    """
+    configurator = logging.config.dictConfigClass(config)
+    configurator.configure()
+    built = configurator.config.get('handlers', {})
+    for handler in built.values():
+        if isinstance(handler, QueueHandler):
+            missing = set(handler.target_names) - set(built)
+            if missing:
+                raise ValueError(f"QueueHandler {handler.name!r} names undefined handlers: {', '.join(sorted(missing))}")
+            handler.targets = [built[name] for name in handler.target_names]
+
+
+class QueueHandler(logging.Handler):
+    """
+    Hands records to a listener thread that feeds the named `handlers`:
+
+        'queue': {'class': 'blog.log.QueueHandler', 'handlers': ['console']}
+
+    A plain Handler with its own queue rather than a subclass of
+    logging.handlers.QueueHandler: from Python 3.12 dictConfig builds those
+    itself and would pass its queue in as `handlers`. configure()
+    (LOGGING_CONFIG) looks the names up once every handler is built. The
+    listener starts on the first record, so it also runs in worker
+    processes forked after settings were loaded.
+    """
+
+    def __init__(self, handlers=(), maxsize=10000):
+        super().__init__()
+        self.target_names = list(handlers)
+        # held here: logging only keeps weak references to named handlers
+        self.targets = []
+        self.queue = queue.Queue(maxsize)
+        self.listener = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self.listener is None:
+                self.listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        # logging.handlers.QueueHandler folds the traceback into the message; keep it apart
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # tracebacks don't cross threads well
+        return record
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # better a lost line than a stalled request
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()  # flushes what is still queued
+            self.listener = None
+        super().close()
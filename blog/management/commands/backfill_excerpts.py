@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import BlogPost, make_excerpt
+from blog.search import html_to_text
+
+
+class Command(BaseCommand):
+    help = "Fill BlogPost.plain_text and excerpt for posts saved before those fields existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every post, not only empty ones.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        posts = BlogPost.objects.only('pk', 'content', 'plain_text', 'excerpt').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(plain_text='')
+
+        batch_size = options['batch_size']
+        batch = []
+        updated = 0
+        for post in posts.iterator(chunk_size=batch_size):
+            post.plain_text = html_to_text(post.content)
+            post.excerpt = make_excerpt(post.plain_text)
+            batch.append(post)
+            if len(batch) >= batch_size:
+                # bulk_update skips save(), so slugs, images and the search index are untouched
+                BlogPost.objects.bulk_update(batch, ['plain_text', 'excerpt'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            BlogPost.objects.bulk_update(batch, ['plain_text', 'excerpt'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled excerpts for {updated} posts."))
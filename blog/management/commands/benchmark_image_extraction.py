@@ -0,0 +1,91 @@
+import re
+import statistics
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.content_images import iter_image_paths
+
+# the extractor BlogPost used before blog/content_images.py, kept here to compare against
+LEGACY_IMG_RE = re.compile(r'<img [^>]*src="([^"]+)"')
+
+
+def legacy_images_from_content(html_content):
+    img_paths = []
+    for url in LEGACY_IMG_RE.findall(html_content):
+        if not urlparse(url).netloc:
+            img_paths.append(url.replace(settings.MEDIA_URL, ""))
+    return img_paths
+
+
+def parser_images_from_content(html_content):
+    return list(iter_image_paths(html_content))
+
+
+PARAGRAPH = (
+    '<p>Mango trees like <strong>full sun</strong> &amp; well drained soil, '
+    'water young trees weekly during the first dry season.</p>\n'
+)
+# one of each markup CKEditor and pasted HTML produce; only the first is seen by the old regex
+IMAGE_SNIPPETS = [
+    '<p><img alt="tree" src="{m}blog_images/aa/{n}a.jpg" style="width:100%"></p>',
+    "<p><img alt='leaf' src='{m}blog_images/bb/{n}b.jpg'></p>",
+    '<img src="{m}blog_images/cc/{n}c.jpg" srcset="{m}blog_images/cc/{n}c-480.jpg 480w, {m}blog_images/cc/{n}c.jpg 1200w">',
+    '<picture><source type="image/webp" srcset="{m}blog_images/dd/{n}d.webp">'
+    '<img src="{m}blog_images/dd/{n}d.jpg" alt="fruit"></picture>',
+]
+# distinct paths per snippet, in the order above
+PATHS_PER_SNIPPET = [1, 1, 2, 2]
+
+
+def build_body(size, paragraphs_per_image):
+    """A rich post body of about `size` bytes and the number of distinct images in it."""
+    parts, length, expected, n = [], 0, 0, 0
+    while length < size:
+        kind = n % len(IMAGE_SNIPPETS)
+        chunk = PARAGRAPH * paragraphs_per_image + IMAGE_SNIPPETS[kind].format(m=settings.MEDIA_URL, n=n) + '\n'
+        parts.append(chunk)
+        length += len(chunk)
+        expected += PATHS_PER_SNIPPET[kind]
+        n += 1
+    return ''.join(parts), expected
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old regex image extraction with the parser-based one in blog/content_images.py "
+        "on large synthetic post bodies: images found, time and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-kb', type=int, default=1024, help="Size of each test body.")
+        parser.add_argument('--paragraphs-per-image', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per extractor, the median is reported.")
+
+    def handle(self, *args, **options):
+        body, expected = build_body(options['size_kb'] * 1024, options['paragraphs_per_image'])
+        mb = len(body) / (1024 * 1024)
+        self.stdout.write(f"Body: {len(body) / 1024:.0f} KB with {expected} distinct image references\n")
+
+        for name, extract in (('regex (old)', legacy_images_from_content), ('parser', parser_images_from_content)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                found = extract(body)
+                timings.append(time.perf_counter() - started)
+
+            tracemalloc.start()
+            extract(body)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            median = statistics.median(timings)
+            found = len(set(found))
+            status = 'ok' if found == expected else f'MISSED {expected - found}'
+            self.stdout.write(
+                f"  {name:12} {median * 1000:8.2f} ms  {mb / median:7.1f} MB/s  "
+                f"peak {peak / 1024:7.1f} KB  found {found}/{expected} ({status})"
+            )
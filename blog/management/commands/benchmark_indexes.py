@@ -0,0 +1,145 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from blog.models import BlogPost, Category, Comment, recount_comments
+
+BATCH = 10_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch SQLite database with many posts and comments, then report query plans "
+        "and timings for the hot listing/detail queries without and with the blog indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query, the median is reported.")
+        parser.add_argument('--db', help="Scratch database file (default: a temp file, removed afterwards).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("benchmark_indexes only runs against SQLite.")
+
+        path = options['db'] or os.path.join(tempfile.mkdtemp(prefix='blog-bench-'), 'bench.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+
+        self.stdout.write(f"Creating scratch database {path}")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.perf_counter()
+            self.seed(options['posts'], options['comments'])
+            self.stdout.write(f"Seeded {options['posts']} posts / {options['comments']} comments "
+                              f"in {time.perf_counter() - started:.1f}s")
+
+            queries = self.hot_queries()
+            indexes = [(model, index) for model in (BlogPost, Comment) for index in model._meta.indexes]
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            before = self.measure('WITHOUT blog indexes', queries, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            after = self.measure('WITH blog indexes', queries, options['repeat'])
+
+            self.stdout.write("\nSummary (median ms)")
+            for name in queries:
+                speedup = before[name] / after[name] if after[name] else float('inf')
+                self.stdout.write(f"  {name:28} {before[name]:9.3f} -> {after[name]:8.3f}  x{speedup:.1f}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=bool(options['db']))
+
+    def seed(self, post_count, comment_count):
+        rng = random.Random(42)
+        user = User.objects.create(username='bench')
+        categories = [Category.objects.create(name=f'Bench {i}') for i in range(10)]
+        now = timezone.now()
+
+        # one transaction, otherwise every row is its own fsync
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, post_count, BATCH):
+                rows = []
+                for i in range(start, min(start + BATCH, post_count)):
+                    created = now - timedelta(minutes=post_count - i)
+                    rows.append((
+                        f'Bench post {i}', f'bench-post-{i}', rng.choice(categories).pk, '',
+                        f'<p>Body {i}</p>', f'Body {i}', f'Body {i}', '', user.pk,
+                        created, created, rng.random() < 0.8, 0,
+                    ))
+                cursor.executemany(
+                    'INSERT INTO blog_blogpost (title, slug, category_id, description, content, plain_text, '
+                    'excerpt, image, author_id, created_at, updated_at, publish, comment_count) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+                    rows,
+                )
+
+            bounds = BlogPost.objects.aggregate(first=Min('pk'), last=Max('pk'))
+            first_id, last_id = bounds['first'], bounds['last']
+            for start in range(0, comment_count, BATCH):
+                rows = []
+                for i in range(start, min(start + BATCH, comment_count)):
+                    # every tenth comment lands on the newest post, the "viral" detail page
+                    post_id = last_id if i % 10 == 0 else rng.randint(first_id, last_id)
+                    rows.append((post_id, user.pk, f'Comment {i}', now - timedelta(seconds=i)))
+                cursor.executemany(
+                    'INSERT INTO blog_comment (post_id, user_id, content, created_at) VALUES (%s, %s, %s, %s)',
+                    rows,
+                )
+            recount_comments(BlogPost.objects.all())
+
+    def hot_queries(self):
+        published = BlogPost.objects.filter(publish=True).defer('content', 'plain_text').order_by('-created_at', '-id')
+        # the post ~90% of the way down the archive, where a crawler's deep page starts
+        deep_offset = published.count() * 9 // 10
+        created_at, pk = published.values_list('created_at', 'pk')[deep_offset]
+        deep_after = Q(created_at__lte=created_at) & ~Q(created_at=created_at, id__gte=pk)
+        category = Category.objects.order_by('pk').first()
+        popular = BlogPost.objects.aggregate(last=Max('pk'))['last']
+
+        return {
+            'listing first page': published[:7],
+            'listing deep keyset page': published.filter(deep_after)[:7],
+            'listing deep OFFSET page': published[deep_offset:deep_offset + 7],
+            'category first page': published.filter(category=category)[:7],
+            'detail comments': Comment.objects.filter(post_id=popular).order_by('-created_at'),
+        }
+
+    def measure(self, label, queries, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f"\n== {label} ==")
+        medians = {}
+        for name, queryset in queries.items():
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+
+            medians[name] = statistics.median(timings)
+            self.stdout.write(f"{name}: {medians[name]:.3f} ms")
+            for line in plan:
+                self.stdout.write(f"    {line}")
+        return medians
@@ -0,0 +1,147 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from blog import loadtest
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with generated content, drive every public route in-process "
+        "(WSGI/ASGI) and over a local HTTP server, report p50/p95/p99 latency, throughput, "
+        "queries and memory, and fail on a regression against the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per route and mode.")
+        parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests first, to fill caches.")
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Concurrent clients per route: threads for WSGI and HTTP, tasks for in-process ASGI.")
+        parser.add_argument(
+            '--modes', default='wsgi,asgi,wsgi-http,asgi-http',
+            help=f"Comma-separated, any of {', '.join(loadtest.MODES)}. asgi-http needs uvicorn.",
+        )
+        parser.add_argument('--views', default='sync',
+                            help="sync, async (blog/async_views.py) or sync,async to compare both.")
+        parser.add_argument('--only', help="Comma-separated route names to run.")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+        parser.add_argument('--save-baseline', action='store_true', help="Write the results to --baseline.")
+        parser.add_argument('--tolerance', type=float, default=loadtest.DEFAULT_TOLERANCE,
+                            help="Allowed relative slowdown before a route counts as regressed.")
+        parser.add_argument('--report', help="Also write the full results as JSON here.")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(loadtest.MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        flavours = [flavour.strip() for flavour in options['views'].split(',') if flavour.strip()]
+        if not flavours or set(flavours) - set(loadtest.VIEWS):
+            raise CommandError("--views takes sync, async or sync,async")
+        if 'asgi-http' in modes:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                self.stdout.write(self.style.WARNING("uvicorn is not installed, skipping asgi-http."))
+                modes.remove('asgi-http')
+
+        scratch = tempfile.mkdtemp(prefix='blog-loadtest-')
+        media_root = os.path.join(scratch, 'media')
+        hosts = ['testserver', '127.0.0.1', 'localhost']
+        try:
+            # measure what production runs: no DEBUG query log, no debug pages
+            with loadtest.scratch_database(scratch), \
+                    override_settings(DEBUG=False, ALLOWED_HOSTS=hosts, MEDIA_ROOT=media_root):
+                started = time.perf_counter()
+                stats = loadtest.seed_database(os.path.join(scratch, 'source'), options['posts'],
+                                               options['comments'], options['tags'], options['seed'])
+                self.stdout.write(f"Seeded {stats['post']} posts, {stats['comment']} comments, "
+                                  f"{stats['tag']} tags in {time.perf_counter() - started:.1f}s")
+                report = self.run(modes, flavours, options)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        if options['report']:
+            loadtest.save_baseline(options['report'], report)
+        self.check_results(report, options)
+
+    def run(self, modes, flavours, options):
+        scenarios = loadtest.build_scenarios()
+        if options['only']:
+            wanted = set(options['only'].split(','))
+            scenarios = [s for s in scenarios if s.name in wanted]
+
+        results = {}
+        for flavour in flavours:
+            with loadtest.views(flavour):
+                for mode in modes:
+                    # results of the async views are kept apart, e.g. "asgi+async"
+                    key = mode if flavour == 'sync' else f'{mode}+async'
+                    self.stdout.write(f"\n{mode}, {flavour} views  ({options['requests']} requests per route, "
+                                      f"{options['concurrency']} concurrent)")
+                    self.stdout.write(f"  {'route':18} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} "
+                                      f"{'queries':>8} {'peak KB':>8}")
+                    results[key] = loadtest.run_mode(mode, scenarios, options['requests'], options['warmup'],
+                                                     options['concurrency'], progress=self.print_row)
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'database': connection.vendor,
+                'posts': options['posts'],
+                'comments': options['comments'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'views': flavours,
+                'max_rss_kb': loadtest.max_rss_kb(),
+            },
+            'results': results,
+        }
+
+    def print_row(self, mode, name, row):
+        peak = f"{row['peak_kb']:.0f}" if row['peak_kb'] else '-'
+        line = (f"  {name:18} {row['p50']:8.2f} {row['p95']:8.2f} {row['p99']:8.2f} "
+                f"{row['rps']:8.0f} {row['queries']:8.1f} {peak:>8}")
+        if row['errors']:
+            self.stdout.write(self.style.ERROR(f"{line}  {row['errors']} unexpected responses"))
+        else:
+            self.stdout.write(line)
+
+    def check_results(self, report, options):
+        self.stdout.write(f"\nPeak RSS {report['meta']['max_rss_kb'] / 1024:.0f} MB (latencies in ms)")
+        errors = [f"{mode} {name}" for mode, rows in report['results'].items()
+                  for name, row in rows.items() if row['errors']]
+
+        if options['save_baseline']:
+            loadtest.save_baseline(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+        elif os.path.exists(options['baseline']):
+            baseline = loadtest.load_baseline(options['baseline'])
+            if baseline.get('meta', {}).get('posts') != options['posts']:
+                self.stdout.write(self.style.WARNING("Baseline was recorded with a different dataset size."))
+            problems = loadtest.compare(report, baseline, options['tolerance'])
+            if problems:
+                for problem in problems:
+                    self.stdout.write(self.style.ERROR(f"  {problem}"))
+                raise CommandError(f"{len(problems)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+        else:
+            self.stdout.write(f"No baseline at {options['baseline']}, run with --save-baseline to record one.")
+
+        if errors:
+            raise CommandError(f"Unexpected responses from: {', '.join(errors)}")
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import Client
+from django.test.signals import template_rendered
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from blog import loadtest
+from blog.models import BlogPost, Category, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database, capture the context each public view renders its template with, "
+        "then time rendering those templates under each template profile (TEMPLATE_PROFILES), "
+        "with the {% cache %} fragments warm and cold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--comments', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--renders', type=int, default=200, help="Measured renders per page and profile.")
+        parser.add_argument('--profiles', default='development,production',
+                            help=f"Comma-separated, any of {', '.join(settings.TEMPLATE_PROFILES)}.")
+
+    def handle(self, *args, **options):
+        profiles = [name.strip() for name in options['profiles'].split(',') if name.strip()]
+        unknown = set(profiles) - set(settings.TEMPLATE_PROFILES)
+        if not profiles or unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown)) or '(none)'}")
+
+        scratch = tempfile.mkdtemp(prefix='blog-templates-')
+        try:
+            with loadtest.scratch_database(scratch), override_settings(
+                    DEBUG=False, ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=os.path.join(scratch, 'media')):
+                loadtest.seed_database(os.path.join(scratch, 'source'), options['posts'],
+                                       options['comments'], options['tags'], options['seed'])
+                pages = self.capture()
+                results = {profile: self.measure(profile, pages, options['renders']) for profile in profiles}
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        self.report(pages, profiles, results)
+
+    def capture(self):
+        """[(label, template name, context dict, request)] from one real request per page."""
+        newest = BlogPost.objects.filter(publish=True).order_by('-comment_count', '-created_at').first()
+        reader = Client()
+        reader.force_login(User.objects.get(username='bench-reader'))
+        requests = [
+            ('blog_list', Client(), reverse('blog_list')),
+            ('category_posts', Client(), reverse('category_posts', args=[Category.objects.order_by('slug')[0].slug])),
+            ('tag_posts', Client(), reverse('tag_posts', args=[Tag.objects.order_by('slug')[0].slug])),
+            ('blog_detail', Client(), newest.get_absolute_url()),
+            ('blog_detail (reader)', reader, newest.get_absolute_url()),
+            ('about', Client(), reverse('about')),
+        ]
+
+        pages = []
+        for label, client, url in requests:
+            seen = []
+
+            def record(sender, template, context, **kwargs):
+                seen.append((template.name, context.flatten(), context.get('request')))
+
+            # sent for every template render while the test environment is set up;
+            # the first one of a response is the view's own template, the rest are its parents and includes
+            template_rendered.connect(record)
+            try:
+                response = client.get(url)
+            finally:
+                template_rendered.disconnect(record)
+            if response.status_code != 200 or not seen:
+                raise CommandError(f"{url} answered {response.status_code}, can't capture its context")
+            pages.append((label, *seen[0]))
+        return pages
+
+    def measure(self, profile, pages, renders):
+        backend = settings.TEMPLATES[0]
+        templates = [{**backend, 'OPTIONS': {**backend['OPTIONS'], **settings.TEMPLATE_PROFILES[profile]}}]
+        results = {}
+        with override_settings(TEMPLATES=templates):
+            engine = engines['django']
+            for label, name, context, request in pages:
+                engine.get_template(name).render(context, request)  # fill the fragment cache
+                warm = self.time_renders(engine, name, context, request, renders)
+                cold = self.time_renders(engine, name, context, request, max(renders // 4, 1), clear=True)
+                results[label] = (warm, cold)
+        return results
+
+    def time_renders(self, engine, name, context, request, renders, clear=False):
+        timings = []
+        for _ in range(renders):
+            if clear:
+                cache.clear()
+            started = time.perf_counter()
+            # loading is part of the cost: without the cached loader it reads and parses every time
+            engine.get_template(name).render(context, request)
+            timings.append(time.perf_counter() - started)
+        return loadtest.summarize(timings, sum(timings), 0, len(timings), 0)
+
+    def report(self, pages, profiles, results):
+        self.stdout.write(f"\n  {'page':22} {'profile':12} {'p50':>8} {'p95':>8} {'cold p50':>9} {'cold p95':>9}")
+        for label, *_ in pages:
+            for profile in profiles:
+                warm, cold = results[profile][label]
+                self.stdout.write(f"  {label:22} {profile:12} {warm['p50']:8.2f} {warm['p95']:8.2f} "
+                                  f"{cold['p50']:9.2f} {cold['p95']:9.2f}")
+        self.stdout.write("\nRender times in ms per page; cold renders start with an empty fragment cache.")
+        if len(profiles) > 1:
+            first, last = profiles[0], profiles[-1]
+            before = sum(results[first][label][0]['mean'] for label, *_ in pages)
+            after = sum(results[last][label][0]['mean'] for label, *_ in pages)
+            self.stdout.write(f"Mean render time over all pages: {first} {before:.2f} ms, {last} {after:.2f} ms "
+                              f"({before / after if after else 0:.1f}x).")
@@ -0,0 +1,51 @@
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the Tailwind utilities the templates use into one minified stylesheet and subset "
+        "the self-hosted fonts into blog/static/dist/, then collectstatic them under hashed names."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-collectstatic', action='store_true',
+                            help="Only build blog/static/dist/, don't run collectstatic afterwards.")
+        parser.add_argument('--allow-missing-fonts', action='store_true',
+                            help="Build even if blog/assets/fonts/ lacks some faces; those come from Google Fonts.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            summary = assets.build(allow_missing_fonts=options['allow_missing_fonts'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Tailwind CLI failed ({e.returncode}):\n{e.stderr or e.stdout}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built site.css ({summary['css_bytes'] / 1024:.1f} KiB) from {summary['templates']} templates "
+            f"and {len(summary['fonts'])} fonts ({summary['font_bytes'] / 1024:.1f} KiB) "
+            f"into {assets.DIST_DIR} in {time.perf_counter() - started:.1f}s."
+        ))
+        if summary['missing_fonts']:
+            self.stdout.write(self.style.WARNING(
+                f"No source in {assets.FONT_SOURCE_DIR} for {', '.join(summary['missing_fonts'])}: "
+                "those families are still loaded from Google Fonts."
+            ))
+
+        if options['no_collectstatic']:
+            return
+        if not settings.STATIC_ROOT:
+            self.stdout.write("STATIC_ROOT isn't set: run collectstatic where it is to get the hashed names.")
+            return
+        # hashes every file and rewrites the font url()s in site.css to the hashed names
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.stdout.write(f"Collected into {settings.STATIC_ROOT}.")
@@ -0,0 +1,31 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every published post and the first BLOG_SNAPSHOT_PAGES pages of each listing "
+        "into BLOG_SNAPSHOT_DIR, replacing the snapshots that are there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes rendering pages.")
+
+    def handle(self, *args, **options):
+        if not snapshots.enabled():
+            self.stdout.write(self.style.WARNING(
+                "BLOG_SNAPSHOTS is off: the snapshots are built but not served or kept up to date."
+            ))
+        started = time.perf_counter()
+        written, skipped = snapshots.build(max(options['workers'], 1))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {written} pages into {settings.BLOG_SNAPSHOT_DIR} in {time.perf_counter() - started:.1f}s."
+        ))
+        if skipped:
+            self.stdout.write(f"{skipped} pages didn't render as a plain 200 and are left to the views.")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from blog import cleanup
+from blog.models import ImageCleanup
+
+
+class Command(BaseCommand):
+    help = (
+        "Find uploaded images no post uses, in resumable chunks. Dry run unless --apply is given; "
+        "with --apply unused files are marked and deleted by a later run once the grace period has passed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help="Mark unused files and delete expired ones.")
+        parser.add_argument('--resume', nargs='?', type=int, const=0, metavar='ID',
+                            help="Continue an interrupted run (default: the latest unfinished one).")
+        parser.add_argument('--chunk-size', type=int, default=cleanup.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['resume'] is not None:
+            unfinished = ImageCleanup.objects.exclude(status=ImageCleanup.DONE)
+            run = unfinished.filter(pk=options['resume']).first() if options['resume'] else unfinished.first()
+            if run is None:
+                raise CommandError("No unfinished cleanup run to resume.")
+            self.stdout.write(f"Resuming {run} after {run.cursor or 'the start'}")
+        else:
+            active = cleanup.active_run()
+            if active is not None:
+                raise CommandError(f"{active} is still unfinished, use --resume {active.pk}.")
+            run = ImageCleanup.objects.create(dry_run=not options['apply'])
+
+        run = cleanup.run_cleanup(run.pk, options['chunk_size'])
+        if run.status == ImageCleanup.FAILED:
+            raise CommandError(f"{run} stopped at {run.cursor}: {run.error}")
+
+        if run.dry_run:
+            for item in run.report:
+                self.stdout.write(f"  {item['path']} ({filesizeformat(item['size'])})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {run.scanned} files: {run.orphaned} unused ({filesizeformat(run.orphaned_bytes)}), "
+            f"deleted {run.deleted} ({filesizeformat(run.deleted_bytes)})."
+        ))
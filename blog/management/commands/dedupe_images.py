@@ -0,0 +1,73 @@
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import content_images, renditions
+from blog.models import BlogPost, ImageReference
+from blog.storage import content_hash, hashed_name, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Move images uploaded before content-addressed storage to their hashed names, "
+        "merging byte-identical copies into one file. Dry run unless --apply is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help="Rename files and update the posts using them.")
+
+    def handle(self, *args, **options):
+        moves = {}
+        for path in ImageReference.objects.values_list('path', flat=True).distinct():
+            if is_hashed_name(path):
+                continue
+            full_path = os.path.join(settings.MEDIA_ROOT, path)
+            if not os.path.exists(full_path):
+                self.stdout.write(self.style.WARNING(f"  missing: {path}"))
+                continue
+            moves[path] = hashed_name(content_hash(full_path), path)
+
+        copies = defaultdict(list)
+        for path, target in moves.items():
+            copies[target].append(path)
+        for target, paths in copies.items():
+            self.stdout.write(f"  {', '.join(sorted(paths))} -> {target}")
+        duplicates = sum(len(paths) - 1 for paths in copies.values())
+        self.stdout.write(f"{len(moves)} images to rename, {duplicates} of them duplicates.")
+
+        if not options['apply']:
+            self.stdout.write("Dry run, nothing changed. Re-run with --apply.")
+            return
+
+        for path, target in moves.items():
+            source = os.path.join(settings.MEDIA_ROOT, path)
+            dest = os.path.join(settings.MEDIA_ROOT, target)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if not os.path.exists(dest):
+                # a second name for the same file; the old one goes once no post uses it
+                os.link(source, dest)
+                old_renditions = renditions.rendition_dir(path)
+                if os.path.isdir(old_renditions) and not os.path.exists(renditions.rendition_dir(target)):
+                    os.makedirs(os.path.dirname(renditions.rendition_dir(target)), exist_ok=True)
+                    os.rename(old_renditions, renditions.rendition_dir(target))
+
+        def rename(url):
+            # src and srcset URLs, however they are quoted or percent-encoded
+            path = content_images.media_path(url)
+            return f'{settings.MEDIA_URL}{moves[path]}' if path in moves else url
+
+        post_ids = ImageReference.objects.filter(path__in=moves).values_list('post_id', flat=True).distinct()
+        updated = 0
+        with transaction.atomic():
+            for post in BlogPost.objects.filter(pk__in=post_ids):
+                if post.image and post.image.name in moves:
+                    post.image.name = moves[post.image.name]
+                post.content = content_images.rewrite_image_urls(post.content, rename)
+                # save() re-syncs the post's references; the old names are removed on commit
+                post.save()
+                updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Renamed {len(moves)} images, updated {updated} posts."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream categories, tags, posts and comments to DIRECTORY/blog.jsonl "
+        "and copy the images they use to DIRECTORY/media/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--no-media', action='store_true', help="Only write blog.jsonl.")
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = bulk.export_to(options['directory'], not options['no_media'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {stats['category']} categories, {stats['tag']} tags, {stats['post']} posts, "
+            f"{stats['comment']} comments and {stats['media']} images in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import images, renditions
+
+
+def _generate(name, force):
+    try:
+        return name, renditions.generate(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = "Backfill responsive WebP/AVIF renditions for every image in media/blog_images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rewrite renditions that already exist.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        root = os.path.join(settings.MEDIA_ROOT, 'blog_images')
+        names = []
+        for dirpath, _, files in os.walk(root):
+            for filename in files:
+                rel = os.path.relpath(os.path.join(dirpath, filename), settings.MEDIA_ROOT)
+                names.append(rel.replace('\\', '/'))
+
+        self.stdout.write(f"Rendering {', '.join(renditions.formats())} for {len(names)} images...")
+        written = failed = 0
+        # encoding is CPU bound, so spread it over processes
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name, count, error in pool.map(_generate, names, [options['force']] * len(names)):
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"  {name}: {error}"))
+                elif count:
+                    # cached pages and snapshots still have the markup without them
+                    images.refresh_posts(name)
+                written += count
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} renditions, {failed} images failed."))
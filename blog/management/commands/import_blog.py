@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an export_blog directory in batched bulk writes. Posts whose slug already exists "
+        "are skipped unless --update is given; re-running an import does not duplicate comments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--update', action='store_true', help="Overwrite posts that already exist.")
+        parser.add_argument('--no-media', action='store_true', help="Keep image paths, don't copy media files.")
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes deriving plain text and excerpts from post bodies.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            stats = bulk.import_from(
+                options['directory'], options['batch_size'], options['update'], not options['no_media'],
+                options['workers'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Import failed: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['category']} categories, {stats['tag']} tags, {stats['post']} posts "
+            f"({stats['post_updated']} updated, {stats['post_skipped']} skipped), {stats['comment']} comments "
+            f"({stats['comment_skipped']} already there), {stats['user']} new users and {stats['media']} images "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+        if stats['comment_orphaned'] or stats['media_missing']:
+            self.stdout.write(self.style.WARNING(
+                f"{stats['comment_orphaned']} comments had no matching post or user, "
+                f"{stats['media_missing']} images were missing from the export."
+            ))
+        if stats['media']:
+            self.stdout.write(f"{stats['media']} images were queued for optimisation and renditions.")
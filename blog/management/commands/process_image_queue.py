@@ -0,0 +1,72 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog import images
+from blog.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = "Drain the background image queue in this process, or queue images for reprocessing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Give failed jobs another round of attempts.")
+        parser.add_argument('--reset-stuck', action='store_true',
+                            help="Requeue jobs left 'processing' by a worker that died.")
+        parser.add_argument('--reprocess', nargs='*', metavar='PATH',
+                            help="Queue these media-relative paths again; with no paths, every file in blog_images/.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        if options['reset_stuck']:
+            count = ImageJob.objects.filter(status=ImageJob.PROCESSING).update(status=ImageJob.PENDING, run_after=now)
+            self.stdout.write(f"Requeued {count} stuck jobs.")
+
+        if options['retry_failed']:
+            count = ImageJob.objects.filter(status=ImageJob.FAILED).update(
+                status=ImageJob.PENDING, attempts=0, run_after=now
+            )
+            self.stdout.write(f"Requeued {count} failed jobs.")
+
+        if options['reprocess'] is not None:
+            paths = options['reprocess'] or self.all_blog_images()
+            for path in paths:
+                ImageJob.objects.update_or_create(
+                    path=path, defaults={'status': ImageJob.PENDING, 'attempts': 0, 'error': '', 'run_after': now}
+                )
+            self.stdout.write(f"Queued {len(paths)} images.")
+
+        done = failed = 0
+        # run due jobs until none are left; retries get pushed into the future and wait
+        while True:
+            job_ids = list(
+                ImageJob.objects.filter(status=ImageJob.PENDING, run_after__lte=timezone.now())
+                .order_by('created_at').values_list('pk', flat=True)[:100]
+            )
+            if not job_ids:
+                break
+            for job_id in job_ids:
+                job = images.run_job(job_id)
+                if job is None:
+                    continue
+                if job.status == ImageJob.DONE:
+                    done += 1
+                elif job.status == ImageJob.FAILED:
+                    failed += 1
+
+        waiting = ImageJob.objects.filter(status=ImageJob.PENDING).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {done} images, {failed} failed, {waiting} waiting for a retry."
+        ))
+
+    def all_blog_images(self):
+        root = os.path.join(settings.MEDIA_ROOT, 'blog_images')
+        paths = []
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                rel = os.path.relpath(os.path.join(dirpath, name), settings.MEDIA_ROOT)
+                paths.append(rel.replace('\\', '/'))
+        return sorted(paths)
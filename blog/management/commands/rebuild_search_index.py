@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import search
+from blog.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from scratch."
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if isinstance(backend, search.FallbackBackend):
+            self.stdout.write(self.style.WARNING("No FTS5 index on this database, search uses the fallback scan."))
+            return
+
+        indexed = 0
+        with transaction.atomic():
+            backend.clear()
+            for post in BlogPost.objects.filter(publish=True).iterator(chunk_size=500):
+                backend.index(post)
+                indexed += 1
+        backend.optimize()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} published posts."))
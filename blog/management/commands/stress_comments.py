@@ -0,0 +1,137 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from blog import loadtest
+from blog.models import BlogPost, Comment
+
+
+class Command(BaseCommand):
+    help = (
+        "Post comments from many concurrent writers (while readers load the same pages) against a "
+        "scratch copy of the configured database, and fail if any write errors or goes missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=16, help="Threads posting comments.")
+        parser.add_argument('--comments', type=int, default=50, help="Comments posted by each writer.")
+        parser.add_argument('--readers', type=int, default=4, help="Threads loading post pages meanwhile.")
+        parser.add_argument('--hot', type=float, default=0.5,
+                            help="Share of comments that go to one post, the rest spread over the newest 20.")
+        parser.add_argument('--untuned', action='store_true',
+                            help="Drop the database OPTIONS (pragmas, transaction mode) for comparison.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        saved = connection.settings_dict.get('OPTIONS', {}), connection.settings_dict['CONN_MAX_AGE']
+        if options['untuned']:
+            # the settings dict is shared, so every thread's connection sees this
+            connection.settings_dict['OPTIONS'] = {}
+            connection.settings_dict['CONN_MAX_AGE'] = 0
+
+        scratch = tempfile.mkdtemp(prefix='blog-stress-')
+        try:
+            with loadtest.scratch_database(scratch), \
+                    override_settings(DEBUG=False, MEDIA_ROOT=os.path.join(scratch, 'media')):
+                loadtest.seed_database(os.path.join(scratch, 'source'), 200, 500, 20, options['seed'])
+                self.describe_database()
+                self.run(options)
+        finally:
+            connection.settings_dict['OPTIONS'], connection.settings_dict['CONN_MAX_AGE'] = saved
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def describe_database(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                journal = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+                timeout = cursor.execute('PRAGMA busy_timeout').fetchone()[0]
+            self.stdout.write(f"SQLite, journal_mode={journal}, busy_timeout={timeout}ms, "
+                              f"transactions {connection.transaction_mode or 'DEFERRED'}")
+        else:
+            pool = connection.settings_dict.get('OPTIONS', {}).get('pool')
+            self.stdout.write(f"{connection.vendor}, {'pooled' if pool else 'unpooled'} connections")
+
+    def run(self, options):
+        posts = list(BlogPost.objects.filter(publish=True).order_by('-created_at', '-id')[:20])
+        writers = [User.objects.create_user(f'stress-writer-{i}', password='stress')
+                   for i in range(options['writers'])]
+        before = Comment.objects.count()
+        errors = Counter()
+        done = threading.Event()
+
+        def write(index):
+            rng = random.Random(options['seed'] + index)
+            client = Client()
+            client.force_login(writers[index])
+            timings = []
+            try:
+                for n in range(options['comments']):
+                    post = posts[0] if rng.random() < options['hot'] else rng.choice(posts)
+                    started = time.perf_counter()
+                    try:
+                        response = client.post(post.get_absolute_url(), {'content': f'Stress {index}-{n}'})
+                    except Exception as e:
+                        errors[f'{type(e).__name__}: {e}'] += 1
+                        continue
+                    if response.status_code != 302:
+                        errors[f'HTTP {response.status_code}'] += 1
+                        continue
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            return timings
+
+        def read(index):
+            rng = random.Random(-index)
+            client = Client()
+            timings = []
+            try:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    try:
+                        response = client.get(rng.choice(posts).get_absolute_url())
+                    except Exception as e:
+                        errors[f'read {type(e).__name__}: {e}'] += 1
+                        continue
+                    if response.status_code != 200:
+                        errors[f'read HTTP {response.status_code}'] += 1
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            return timings
+
+        with ThreadPoolExecutor(max_workers=options['readers'] + options['writers']) as pool:
+            readers = [pool.submit(read, i) for i in range(options['readers'])]
+            started = time.perf_counter()
+            writes = [t for timings in pool.map(write, range(options['writers'])) for t in timings]
+            wall = time.perf_counter() - started
+            done.set()
+            reads = [t for future in readers for t in future.result()]
+
+        saved = Comment.objects.count() - before
+        self.stdout.write(f"\n  {'':8} {'count':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'per s':>8}")
+        for label, timings in (('writes', writes), ('reads', reads)):
+            if timings:
+                row = loadtest.summarize(timings, wall, 0, len(timings), 0)
+                self.stdout.write(f"  {label:8} {len(timings):8} {row['p50']:8.2f} {row['p95']:8.2f} "
+                                  f"{row['p99']:8.2f} {row['rps']:8.0f}")
+        self.stdout.write(f"\n{saved} of {options['writers'] * options['comments']} comments saved "
+                          f"in {wall:.1f}s (latencies in ms)")
+
+        for message, count in errors.most_common():
+            self.stdout.write(self.style.ERROR(f"  {count} x {message}"))
+        if errors or saved != len(writes):
+            raise CommandError(f"{sum(errors.values())} failed requests, "
+                               f"{len(writes) - saved} acknowledged comments missing")
+        self.stdout.write(self.style.SUCCESS("All comments saved, no errors."))
@@ -0,0 +1,44 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    """Create the FTS5 table on SQLite and fill it with the published posts."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    from blog.search import SEARCH_TABLE, html_to_text
+
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(title, description, content, tokenize='porter unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5, the fallback backend takes over
+        return
+
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    with schema_editor.connection.cursor() as cursor:
+        for post in BlogPost.objects.filter(publish=True).iterator():
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, content) VALUES (%s, %s, %s, %s)",
+                [post.pk, post.title, html_to_text(post.description), html_to_text(post.content)],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from blog.search import SEARCH_TABLE
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_blogpost_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
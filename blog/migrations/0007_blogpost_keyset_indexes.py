@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_blogpost_plain_text_excerpt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('publish', True)), fields=['-created_at', '-id'], name='blog_post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('publish', True)), fields=['category', '-created_at', '-id'], name='blog_post_cat_published_idx'),
+        ),
+    ]
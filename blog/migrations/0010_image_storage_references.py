@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:57
+
+import re
+from html import unescape
+from urllib.parse import unquote
+
+import blog.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# a frozen copy of blog/content_images.py, so replaying this migration
+# finds the same images whatever the live extractor becomes
+IMAGE_TAG_RE = re.compile(r'<(?:[iI][mM][gG]|[sS][oO][uU][rR][cC][eE])\b([^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*)>')
+ATTR_RE = re.compile(r'''([^\s/>"'=][^\s/>=]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]*))?''')
+SRCSET_URL_RE = re.compile(r'[\s,]*(\S+)')
+
+
+def parse_srcset(value):
+    pos, end = 0, len(value)
+    while pos < end:
+        match = SRCSET_URL_RE.match(value, pos)
+        if not match:
+            return
+        url, pos = match.group(1), match.end()
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            comma = value.find(',', pos)
+            pos = end if comma == -1 else comma + 1
+        if url:
+            yield url
+
+
+def get_images_from_content(html):
+    """Media-relative paths of the images in <img src/srcset> and <source src/srcset>."""
+    for tag in IMAGE_TAG_RE.finditer(html or ''):
+        for attr in ATTR_RE.finditer(tag.group(1)):
+            name, value = attr.group(1).lower(), attr.group(2)
+            if name not in ('src', 'srcset') or not value:
+                continue
+            if value[0] in '"\'' and value[0] == value[-1]:
+                value = value[1:-1]
+            value = unescape(value)
+            for url in parse_srcset(value) if name == 'srcset' else [value.strip()]:
+                if url.startswith(settings.MEDIA_URL):
+                    yield unquote(url[len(settings.MEDIA_URL):].split('?', 1)[0].split('#', 1)[0])
+
+
+def backfill_references(apps, schema_editor):
+    """One ImageReference row per image each existing post uses."""
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    ImageReference = apps.get_model('blog', 'ImageReference')
+    refs = []
+    for post in BlogPost.objects.only('image', 'content').iterator():
+        paths = {post.image.name} if post.image else set()
+        paths.update(get_images_from_content(post.content))
+        refs.extend(
+            ImageReference(post_id=post.pk, path=path.lstrip('/'))
+            for path in paths if path.lstrip('/').startswith('blog_images/')
+        )
+    ImageReference.objects.bulk_create(refs, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_imagejob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=blog.storage.get_blog_image_storage, upload_to='blog_images/'),
+        ),
+        migrations.CreateModel(
+            name='ImageReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_index=True, help_text='path relative to MEDIA_ROOT', max_length=255)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_references', to='blog.blogpost')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('post', 'path'), name='blog_imageref_post_path_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_references, migrations.RunPython.noop),
+    ]
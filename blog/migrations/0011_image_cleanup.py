@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_image_storage_references'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageCleanup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dry_run', models.BooleanField(default=True, help_text='only report, never mark or delete files')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('phase', models.CharField(choices=[('scan', 'Scanning files'), ('sweep', 'Deleting expired orphans')], default='scan', max_length=20)),
+                ('cursor', models.CharField(blank=True, help_text='last path scanned', max_length=255)),
+                ('scanned', models.PositiveIntegerField(default=0)),
+                ('orphaned', models.PositiveIntegerField(default=0)),
+                ('orphaned_bytes', models.PositiveBigIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('deleted_bytes', models.PositiveBigIntegerField(default=0)),
+                ('report', models.JSONField(blank=True, default=list, help_text='orphans found, for dry runs')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrphanImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='path relative to MEDIA_ROOT', max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('found_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delete_after', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
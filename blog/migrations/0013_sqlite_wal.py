@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    """
+    Switch the SQLite database file to write-ahead logging, once: the mode
+    is stored in the file, so connections don't have to set it.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+
+def disable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=DELETE')
+
+
+class Migration(migrations.Migration):
+    # the journal mode can't be changed inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('blog', '0012_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal, atomic=False),
+    ]
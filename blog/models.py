@@ -1,31 +1,42 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from ckeditor.fields import RichTextField
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 
 # auto delete image -- main ImageField
+import logging
 import os
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save, pre_delete, m2m_changed
 from django.dispatch import receiver
 
 # auto delete image -- CKEditor images
 from django.conf import settings
-import re
-from urllib.parse import urlparse
-
-from PIL import Image
 
 from django.urls import reverse
+from django.utils.text import Truncator
+from django.utils import timezone
+
+from . import caching, content_images, images, renditions, search, snapshots
+from .storage import get_blog_image_storage
+from .tracking import LoadedStateMixin
+
+logger = logging.getLogger(__name__)
+
+# words kept in BlogPost.excerpt, the list cards show at most this many
+EXCERPT_WORDS = 150
+
+class Category(LoadedStateMixin, models.Model):
+    tracked_fields = ('name',)
 
-class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True)
 
     def save(self, *args, **kwargs):
         # Auto-generate slug from name if not provided or if the name has changed
         if self.pk:  # Check if the object already exists (update)
-            original = Category.objects.get(pk=self.pk)
-            if original.name != self.name:  # If the name has changed, regenerate the slug
+            if self.has_changed('name'):  # If the name has changed, regenerate the slug
                 self.slug = slugify(self.name)
         elif not self.slug:  # If slug is not provided, generate it from the name
             self.slug = slugify(self.name)
@@ -34,15 +45,16 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Tag(models.Model):
+class Tag(LoadedStateMixin, models.Model):
+    tracked_fields = ('name',)
+
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(unique=True, blank=True)
 
     def save(self, *args, **kwargs):
         # Auto-generate slug from name if not provided or if the name has changed
         if self.pk:  # Check if the object already exists (update)
-            original = Tag.objects.get(pk=self.pk)
-            if original.name != self.name:  # If the name has changed, regenerate the slug
+            if self.has_changed('name'):  # If the name has changed, regenerate the slug
                 self.slug = slugify(self.name)
         elif not self.slug:  # If slug is not provided, generate it from the name
             self.slug = slugify(self.name)
@@ -52,24 +64,58 @@ class Tag(models.Model):
         return self.name
 
 def get_images_from_content(html_content):
-    """Extract list of image paths from CKEditor HTML content."""
-    if not html_content:
-        return []
-
-    # Find all src attributes of img tags
-    img_urls = re.findall(r'<img [^>]*src="([^"]+)"', html_content)
-    img_paths = []
-
-    for url in img_urls:
-        # Convert URL to MEDIA_ROOT path if it's local
-        parsed = urlparse(url)
-        if not parsed.netloc:  # relative URL
-            # Remove MEDIA_URL prefix to get relative path
-            relative_path = url.replace(settings.MEDIA_URL, "")
-            img_paths.append(relative_path)
-    return img_paths
-
-class BlogPost(models.Model):
+    """List of local image paths used in CKEditor HTML content (see blog/content_images.py)."""
+    return list(content_images.iter_image_paths(html_content))
+
+def referenced_paths(post):
+    """Media paths a post uses: its main image plus every uploaded image in its content."""
+    paths = {post.image.name} if post.image else set()
+    paths.update(content_images.iter_image_paths(post.content))
+    # only uploads are ours to track (and ever delete), not other media
+    return {path for path in paths if path.startswith('blog_images/')}
+
+def update_image_references(post):
+    """
+    Bring the post's ImageReference rows in line with what it uses now.
+
+    Returns the paths it dropped that no post references any more.
+    """
+    wanted = referenced_paths(post)
+    existing = set(ImageReference.objects.filter(post=post).values_list('path', flat=True))
+
+    dropped = existing - wanted
+    if dropped:
+        ImageReference.objects.filter(post=post, path__in=dropped).delete()
+    if wanted - existing:
+        ImageReference.objects.bulk_create(
+            [ImageReference(post=post, path=path) for path in wanted - existing], ignore_conflicts=True
+        )
+
+    still_used = set(ImageReference.objects.filter(path__in=dropped).values_list('path', flat=True))
+    return dropped - still_used
+
+def delete_image_file(path):
+    """Remove an unreferenced upload and its renditions once the transaction commits."""
+    def remove():
+        # re-check: another post may have picked the file up in the meantime
+        if ImageReference.objects.filter(path=path).exists():
+            return
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+            logger.info("Deleted image no longer used by any post", extra={'path': path})
+        renditions.delete(path)
+
+    transaction.on_commit(remove)
+
+def make_excerpt(plain_text):
+    """Short plain-text teaser shown on listing cards."""
+    return Truncator(plain_text).words(EXCERPT_WORDS)
+
+class BlogPost(LoadedStateMixin, models.Model):
+    # compared against their loaded values on save, see blog/tracking.py
+    tracked_fields = ('title', 'description', 'content', 'image', 'category', 'publish')
+
     title = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, blank=True, max_length=255)
     category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, related_name='posts')
@@ -78,74 +124,86 @@ class BlogPost(models.Model):
     description = models.TextField(blank=True, help_text="short blog description")
 
     content = RichTextField()
-    image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
+    # derived from content on save, so listings never need to load content
+    plain_text = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    image = models.ImageField(upload_to='blog_images/', storage=get_blog_image_storage, blank=True, null=True)
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     publish = models.BooleanField(default=False)
+    # kept by Comment.save() and the comment delete signal, never read-modify-written
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # keyset pagination walks published posts by (created_at, id) newest first;
+            # partial so the planner can match the bare `WHERE publish` Django emits
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(publish=True), name='blog_post_published_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(publish=True), name='blog_post_cat_published_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.slug:
+        adding = self._state.adding
+        if not self.slug or (not adding and self.has_changed('title')):
             self.slug = slugify(self.title)
 
-        if self.pk:
-            original = BlogPost.objects.get(pk=self.pk)
-            if original.title != self.title:
-                self.slug = slugify(self.title)
-
-            # Handle main ImageField
-            old_image_path = original.image.name if original.image else None
-            new_image_path = self.image.name if self.image else None
-
-            if old_image_path and old_image_path != new_image_path:
-                if not BlogPost.objects.filter(image=old_image_path).exclude(pk=self.pk).exists():
-                    print(f"💀 OLD BLOG IMAGE NOT being USED, DELETING: {old_image_path}")
-                    original.image.delete(save=False)
-                else:
-                    posts_using_old_image = BlogPost.objects.filter(image=old_image_path).exclude(pk=self.pk)
-                    print(f"OLD BLOG IMAGE is BEING USED by: {[post.title for post in posts_using_old_image]}")
-            
-
-            # --- Handle CKEditor images ---
-            old_images = set(get_images_from_content(original.content))
-            new_images = set(get_images_from_content(self.content))
-            removed_images = old_images - new_images
-
-            for img in removed_images:
-                # Check if any other post still uses this image
-                still_used = BlogPost.objects.exclude(pk=self.pk).filter(content__icontains=img).exists()
-                if not still_used:
-                    full_path = os.path.join(settings.MEDIA_ROOT, img)
-                    if os.path.exists(full_path):
-                        print(f"💀 CKEditor image not used, deleting: {img}")
-                        os.remove(full_path)
+        content_changed = self.has_changed('content')
+        image_changed = self.has_changed('image')
+        if adding:
+            sidebar_changed = search_changed = self.publish
+        else:
+            # sidebar counts only move when publish state or category changes
+            sidebar_changed = self.has_changed('publish') or (self.publish and self.has_changed('category'))
+            # an unpublished post isn't in the index, so only publishing it or editing a published one matters
+            search_changed = self.has_changed('publish') or (
+                self.publish and (content_changed or self.has_changed('title') or self.has_changed('description'))
+            )
+
+        # an unpublished post has no snapshots until it's published; a moved one
+        # has to leave its old category's listing
+        snapshot_changed = self.publish or (not adding and self.has_changed('publish'))
+        old_category_id = self.loaded_value('category') if self.has_changed('category') else None
+
+        if content_changed:
+            self.plain_text = search.html_to_text(self.content)
+            self.excerpt = make_excerpt(self.plain_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # fields derived here have to be written along with their source
+            update_fields = set(update_fields)
+            if 'title' in update_fields:
+                update_fields.add('slug')
+            if 'content' in update_fields:
+                update_fields.update(('plain_text', 'excerpt'))
+            kwargs['update_fields'] = update_fields
+        elif not adding and not kwargs.get('force_insert'):
+            # a post loaded before a comment came in mustn't write its stale count back
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'comment_count' and f.attname not in deferred
+            ]
 
         super().save(*args, **kwargs)
 
-        # after everything updated, 
-        # now check wether self.image is greater than 1 mb
-
-        try:
-            if self.image:
-                img_path = self.image.path
-                img = Image.open(img_path)
-
-                # Check image size in bytes
-                if self.image.size > 1024 * 1024:  # 1 MB
-                    # Resize proportionally
-                    max_width = 1200  # optional: max width to avoid huge images
-                    max_height = 1200
-
-                    img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+        # keep the full-text index in step (drops the post if unpublished)
+        if search_changed:
+            search.index_post(self)
+        caching.invalidate_post(self.pk)
+        if sidebar_changed:
+            caching.invalidate_sidebar()
+        if snapshot_changed:
+            snapshots.refresh_post(self.pk, old_category_id, sidebar=sidebar_changed)
 
-                    # Save back, overwrite original
-                    img.save(img_path, optimize=True, quality=70)
+        # resizing/re-encoding runs in the background, see blog/images.py
+        if image_changed and self.image:
+            images.enqueue(self.image.name)
 
-                    print(f"📷✅😮 BLOG IMAGE: {img_path} resized properly")
-                else:
-                    print(f"📷 BLOG Image: {img_path} is under 1MB, no resizing needed")
-        except Exception as e:
-            print(f"FAILED to RESIZE BLOG IMAGE: {img_path}, reason: {e}")
+        # --- Image bookkeeping: reference rows instead of scanning every post ---
+        if content_changed or image_changed:
+            for path in update_image_references(self):
+                delete_image_file(path)
 
     def get_absolute_url(self):
         return reverse('blog_detail', kwargs={'id': self.id, 'slug': self.slug})
@@ -154,35 +212,214 @@ class BlogPost(models.Model):
         return self.title
 
 
-# Signal to delete image file when BlogPost is deleted
+# Signal to delete image files when BlogPost is deleted
 @receiver(post_delete, sender=BlogPost)
 def delete_blog_image(sender, instance, **kwargs):
-    try:
-        if instance.image: #if the blog has a main_image
-            if os.path.isfile(instance.image.path):
-                print(f"🏀💥🗑️ IMAGE {instance.image.path}: DELETED as BLOG is DELETED")
-                os.remove(instance.image.path)
-
-        # --- Handle CKEditor images ---
-        unused_images_in_CKEDITOR = set(get_images_from_content(instance.content))
-
-        if len(unused_images_in_CKEDITOR) > 0:
-            for img in unused_images_in_CKEDITOR:
-                full_path = os.path.join(settings.MEDIA_ROOT, img)
-                if os.path.exists(full_path):
-                    print(f"💀💥🗑️ AFTER DELETE BLOG: CKEditor image not used, deleting: {img}")
-                    os.remove(full_path)
-        else:
-            print(f"0️⃣0️⃣0️⃣ There are NO IMAGES LEFT in CKEDITOR")
-        
-    except Exception as e:
-        print(f"ERROR trying to DELETE unused photos, after deleting blog, due to: {e}")
+    search.remove_post(instance.pk)
+
+    # the post's ImageReference rows are already gone (CASCADE), so any
+    # path with no reference left was used by this post only
+    paths = referenced_paths(instance)
+    still_used = set(ImageReference.objects.filter(path__in=paths).values_list('path', flat=True))
+    for path in paths - still_used:
+        delete_image_file(path)
 
 class Comment(models.Model):
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    class Meta:
+        indexes = [
+            # blog_detail walks a post's comments newest first by (created_at, id)
+            models.Index(fields=['post', '-created_at', '-id'], name='blog_comment_post_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        # the row and its post's count commit together
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            BlogPost.objects.filter(pk=self.post_id).update(comment_count=F('comment_count') + 1)
+
     def __str__(self):
         return f'Comment by {self.user.username} on {self.post.title}'
+
+
+def recount_comments(posts):
+    """Recompute comment_count for a BlogPost queryset, after comments were bulk created."""
+    counts = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(n=Count('pk')).values('n')
+    return posts.update(comment_count=Coalesce(Subquery(counts), 0))
+
+
+# --- Page cache invalidation (see blog/caching.py) ---
+@receiver(post_delete, sender=BlogPost)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    caching.invalidate_post(instance.pk)
+    if instance.publish:
+        caching.invalidate_sidebar()
+        snapshots.refresh_post(instance.pk, sidebar=True)
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def invalidate_post_tags(sender, instance, action, **kwargs):
+    if action == 'pre_clear' and not isinstance(instance, BlogPost):
+        # the posts losing the tag can't be found once it's cleared
+        snapshots.refresh_taxonomy(instance)
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if isinstance(instance, BlogPost):
+            caching.invalidate_post(instance.pk)
+            if instance.publish:
+                caching.invalidate_sidebar()
+                snapshots.refresh_post(instance.pk, sidebar=True)
+        else:  # changed from the Tag side
+            caching.invalidate_taxonomy()
+            snapshots.refresh_taxonomy(instance, post_ids=kwargs['pk_set'] or ())
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_comments(sender, instance, **kwargs):
+    caching.invalidate_comments(instance.post_id)
+    snapshots.refresh_comments(instance.post_id)
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, origin=None, **kwargs):
+    # runs inside the delete's transaction; when the post itself is being
+    # deleted its comments go with it and there is nothing to keep in sync
+    if isinstance(origin, BlogPost) or getattr(origin, 'model', None) is BlogPost:
+        return
+    BlogPost.objects.filter(pk=instance.post_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_taxonomy(sender, instance, **kwargs):
+    caching.invalidate_taxonomy()
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def refresh_taxonomy_snapshots(sender, instance, created=False, **kwargs):
+    # a new category or tag has no posts yet, so no page shows it; a deleted
+    # one is looked up before the delete detaches its posts
+    if not created:
+        snapshots.refresh_taxonomy(instance)
+
+
+class ImageJob(models.Model):
+    """Queued background optimisation of one stored image (see blog/images.py)."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    path = models.CharField(max_length=255, unique=True, help_text="path relative to MEDIA_ROOT")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def mark(self, status, error='', run_after=None):
+        self.status = status
+        self.error = error
+        fields = ['status', 'error', 'updated_at']
+        if run_after is not None:
+            self.run_after = run_after
+            fields.append('run_after')
+        self.save(update_fields=fields)
+
+    def __str__(self):
+        return f'{self.path} ({self.status})'
+
+
+class ImageReference(models.Model):
+    """
+    One row per (post, uploaded image) it uses, main image or inside content.
+
+    An image with no rows left is unused and can be deleted: an indexed
+    lookup instead of a LIKE scan over every post body.
+    """
+    path = models.CharField(max_length=255, db_index=True, help_text="path relative to MEDIA_ROOT")
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='image_references')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'path'], name='blog_imageref_post_path_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.path} used by post {self.post_id}'
+
+
+class ImageCleanup(models.Model):
+    """
+    One run of the unused-image cleanup (see blog/cleanup.py).
+
+    The scan walks blog_images/ in path order a chunk at a time and saves
+    its position in `cursor`, so an interrupted run resumes where it stopped.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    SCAN = 'scan'
+    SWEEP = 'sweep'
+    PHASE_CHOICES = [
+        (SCAN, 'Scanning files'),
+        (SWEEP, 'Deleting expired orphans'),
+    ]
+
+    dry_run = models.BooleanField(default=True, help_text="only report, never mark or delete files")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, default=SCAN)
+    cursor = models.CharField(max_length=255, blank=True, help_text="last path scanned")
+    scanned = models.PositiveIntegerField(default=0)
+    orphaned = models.PositiveIntegerField(default=0)
+    orphaned_bytes = models.PositiveBigIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    deleted_bytes = models.PositiveBigIntegerField(default=0)
+    report = models.JSONField(default=list, blank=True, help_text="orphans found, for dry runs")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        kind = 'dry run' if self.dry_run else 'cleanup'
+        return f'Image {kind} #{self.pk} ({self.status})'
+
+
+class OrphanImage(models.Model):
+    """
+    An uploaded file no post referenced when a cleanup last looked.
+
+    It is only deleted once `delete_after` has passed and it is still
+    unreferenced, which protects uploads whose post hasn't been saved yet.
+    """
+    path = models.CharField(max_length=255, unique=True, help_text="path relative to MEDIA_ROOT")
+    size = models.PositiveBigIntegerField(default=0)
+    found_at = models.DateTimeField(default=timezone.now)
+    delete_after = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.path
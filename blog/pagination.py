@@ -0,0 +1,233 @@
+"""
+Keyset (cursor) pagination for the listing views and a post's comments.
+
+Pages are walked by the (created_at, id) of the last/first post shown, so
+every page is one index range scan no matter how deep, and no COUNT(*) is
+run unless asked for. Cursors are opaque url-safe tokens.
+
+Search results are ordered by relevance rather than date, so they use the
+same page/token interface with an offset inside the token instead.
+
+Every paginator has an async twin of page() (apage) for the async views.
+"""
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import HttpResponsePermanentRedirect
+from django.utils.dateparse import parse_datetime
+
+PER_PAGE = 6
+# deepest page number (legacy ?page=N or search offset) taken from a URL,
+# anything past it starts over at page 1 instead of reaching the SQL OFFSET
+MAX_PAGE = 10_000
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(token):
+    """Return the cursor dict, or None for a missing or mangled token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class CursorPage:
+    """Quacks enough like Django's Page for the listing templates."""
+
+    def __init__(self, object_list, number, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset (posts, or a post's comments) newest first on (created_at, id)."""
+
+    def __init__(self, queryset, per_page=PER_PAGE, with_count=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.with_count = with_count
+
+    def _token(self, created_at, pk, direction, number):
+        return encode_cursor({'c': created_at.isoformat(), 'i': pk, 'd': direction, 'n': number})
+
+    def _parse(self, token):
+        """(created_at, id, direction, number) from a token, or None to start at page 1."""
+        cursor = decode_cursor(token)
+        if not cursor or not isinstance(cursor.get('c'), str) or not isinstance(cursor.get('i'), int):
+            return None
+        created_at = parse_datetime(cursor['c'])
+        if created_at is None:
+            return None
+        number = cursor.get('n')
+        if not isinstance(number, int) or number < 1:
+            number = 1
+        return created_at, cursor['i'], cursor.get('d'), number
+
+    def _window(self, token):
+        """(page number, direction, unevaluated queryset of up to per_page + 1 posts) for a token."""
+        cursor = self._parse(token)
+        if cursor is None:
+            return 1, None, self.queryset.order_by('-created_at', '-id')[:self.per_page + 1]
+        created_at, pk, direction, number = cursor
+        if direction == 'p':
+            # walk backwards, then flip so the page still reads newest first
+            before = Q(created_at__gte=created_at) & ~Q(created_at=created_at, id__lte=pk)
+            return number, 'p', self.queryset.filter(before).order_by('created_at', 'id')[:self.per_page + 1]
+        # written as a range on created_at (not an OR) so the index can seek to it
+        after = Q(created_at__lte=created_at) & ~Q(created_at=created_at, id__gte=pk)
+        return number, 'n', self.queryset.filter(after).order_by('-created_at', '-id')[:self.per_page + 1]
+
+    def page(self, token=None):
+        number, direction, window = self._window(token)
+        count = self.queryset.count() if self.with_count else None
+        return self._page(number, direction, list(window), count)
+
+    async def apage(self, token=None):
+        number, direction, window = self._window(token)
+        count = await self.queryset.acount() if self.with_count else None
+        return self._page(number, direction, [post async for post in window], count)
+
+    def _page(self, number, direction, rows, count):
+        if direction is None:
+            more_before, more_after = False, len(rows) > self.per_page
+            posts = rows[:self.per_page]
+        elif direction == 'p':
+            more_before, more_after = len(rows) > self.per_page, True
+            posts = rows[:self.per_page][::-1]
+        else:
+            more_before, more_after = True, len(rows) > self.per_page
+            posts = rows[:self.per_page]
+
+        if not posts:
+            more_before = more_after = False
+
+        return CursorPage(
+            posts,
+            number,
+            next_cursor=self._token(posts[-1].created_at, posts[-1].pk, 'n', number + 1) if more_after else None,
+            previous_cursor=self._token(posts[0].created_at, posts[0].pk, 'p', number - 1) if more_before else None,
+            count=count,
+        )
+
+    def _boundary(self, number):
+        offset = (number - 1) * self.per_page - 1
+        return self.queryset.order_by('-created_at', '-id').values_list('created_at', 'pk')[offset:offset + 1]
+
+    def cursor_for_page(self, number):
+        """Token that lands on the old `?page=number`, or None for page 1/out of range."""
+        if number <= 1:
+            return None
+        boundary = next(iter(self._boundary(number)), None)
+        return self._token(*boundary, 'n', number) if boundary else None
+
+    async def acursor_for_page(self, number):
+        if number <= 1:
+            return None
+        boundary = [row async for row in self._boundary(number)]
+        return self._token(*boundary[0], 'n', number) if boundary else None
+
+
+class OffsetPaginator:
+    """Same interface over relevance-ranked search results, without a COUNT."""
+
+    def __init__(self, results, per_page=PER_PAGE, with_count=False):
+        self.results = results
+        self.per_page = per_page
+        self.with_count = with_count
+
+    def page(self, token=None):
+        cursor = decode_cursor(token) or {}
+        offset = cursor.get('o', 0)
+        if not isinstance(offset, int) or not 0 <= offset < MAX_PAGE * self.per_page:
+            offset = 0
+        number = offset // self.per_page + 1
+
+        rows = list(self.results[offset:offset + self.per_page + 1])
+        posts = rows[:self.per_page]
+        return CursorPage(
+            posts,
+            number,
+            next_cursor=encode_cursor({'o': offset + self.per_page}) if len(rows) > self.per_page else None,
+            previous_cursor=encode_cursor({'o': max(offset - self.per_page, 0)}) if offset else None,
+            count=self.results.count() if self.with_count else None,
+        )
+
+    async def apage(self, token=None):
+        # FTS5 results come from a raw cursor, which has no async API: one thread hop for the page
+        return await sync_to_async(self.page)(token)
+
+    def cursor_for_page(self, number):
+        return encode_cursor({'o': (number - 1) * self.per_page}) if number > 1 else None
+
+    async def acursor_for_page(self, number):
+        return self.cursor_for_page(number)
+
+
+def _legacy_redirect(request, cursor):
+    params = request.GET.copy()
+    params.pop('page')
+    params.pop('cursor', None)
+    if cursor:
+        params['cursor'] = cursor
+    query = params.urlencode()
+    return HttpResponsePermanentRedirect(request.path + ('?' + query if query else ''))
+
+
+def _legacy_page_number(request):
+    page_number = request.GET.getlist('page')[-1]
+    if not (page_number.isascii() and page_number.isdigit()):
+        return None
+    number = int(page_number)
+    return number if number <= MAX_PAGE else None
+
+
+def paginate(request, paginator):
+    """
+    Return (page, None), or (None, redirect) for a legacy `?page=N` URL.
+
+    Old offset links keep working: they are sent once to the matching
+    cursor URL instead of being served with OFFSET.
+    """
+    if 'page' in request.GET:
+        number = _legacy_page_number(request)
+        cursor = paginator.cursor_for_page(number) if number else None
+        return None, _legacy_redirect(request, cursor)
+
+    return paginator.page(request.GET.get('cursor')), None
+
+
+async def apaginate(request, paginator):
+    if 'page' in request.GET:
+        number = _legacy_page_number(request)
+        cursor = await paginator.acursor_for_page(number) if number else None
+        return None, _legacy_redirect(request, cursor)
+
+    return await paginator.apage(request.GET.get('cursor')), None
@@ -0,0 +1,315 @@
+"""
+Request-level performance instrumentation.
+
+PerfMiddleware (appended to MIDDLEWARE) records, for every request, the
+view that handled it, its status, total time, SQL query count and time,
+template render time and response size. Records go to a per-process
+ring buffer of the last BLOG_PERF_BUFFER_SIZE requests, which the admin
+dashboard turns into per-route percentiles, and to cumulative counters
+rendered in the Prometheus text format at /greenblog/metrics/.
+
+Per request the cost is a couple of perf_counter() calls per SQL query,
+one per template render and one locked append, cheap enough to leave on.
+Queries and renders are attributed through a ContextVar, so they are
+also counted when an async view runs them in a worker thread.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template as BackendTemplate
+
+# upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_LIMIT = 20  # slowest statements kept for the dashboard
+SQL_PREVIEW_CHARS = 500
+UNRESOLVED_ROUTE = '<unresolved>'  # 404s, one label instead of one per URL
+
+_current = ContextVar('blog_perf_request', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time', 'slowest_query', 'slowest_sql')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.slowest_query = 0.0
+        self.slowest_sql = ''
+
+
+class Recorder:
+    """The ring buffer and the cumulative counters, shared by all threads of a process."""
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # (finished at, route, method, status, seconds, queries, db seconds, template seconds, bytes)
+        self.recent = deque(maxlen=size)
+        self.slow_queries = []  # min-heap of (seconds, finished at, route, sql)
+        self.requests = defaultdict(int)  # (route, method, status) -> count
+        self.routes = defaultdict(lambda: {
+            'buckets': [0] * len(DURATION_BUCKETS), 'count': 0, 'seconds': 0.0,
+            'queries': 0, 'db_seconds': 0.0, 'template_seconds': 0.0, 'bytes': 0,
+        })
+
+    def add(self, route, method, status, seconds, stats, size):
+        now = time.time()
+        with self.lock:
+            self.recent.append((now, route, method, status, seconds, stats.queries,
+                                stats.db_time, stats.template_time, size))
+            self.requests[route, method, status] += 1
+            totals = self.routes[route]
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += stats.queries
+            totals['db_seconds'] += stats.db_time
+            totals['template_seconds'] += stats.template_time
+            totals['bytes'] += size
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    totals['buckets'][i] += 1
+                    break
+            if stats.slowest_sql:
+                entry = (stats.slowest_query, now, route, stats.slowest_sql)
+                if len(self.slow_queries) < SLOW_QUERY_LIMIT:
+                    heapq.heappush(self.slow_queries, entry)
+                elif entry > self.slow_queries[0]:
+                    heapq.heapreplace(self.slow_queries, entry)
+
+    def reset(self):
+        # cleared in place under the lock, so a request finishing meanwhile can't land in a half-reset state
+        with self.lock:
+            self.started = time.time()
+            self.recent.clear()
+            self.slow_queries.clear()
+            self.requests.clear()
+            self.routes.clear()
+
+
+recorder = Recorder(getattr(settings, 'BLOG_PERF_BUFFER_SIZE', 5000))
+
+
+# --- Collection ---
+
+def _time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if elapsed > stats.slowest_query:
+            stats.slowest_query = elapsed
+            stats.slowest_sql = sql[:SQL_PREVIEW_CHARS]
+
+
+def _install(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+_original_render = BackendTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _current.get()
+    if stats is None:
+        return _original_render(self, context, request)
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template_time += time.perf_counter() - started
+
+
+def install():
+    """Hook the query wrapper and template timer in, once per process."""
+    if BackendTemplate.render is not _timed_render:
+        # only render()/render_to_string() go through the backend template,
+        # so {% include %}s count once, as part of the page that includes them
+        BackendTemplate.render = _timed_render
+    connection_created.connect(_install, dispatch_uid='blog-perf-queries')
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED_ROUTE
+
+
+def response_size(response):
+    if response.streaming:
+        # files are streamed, their size is in the header
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+class PerfMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, seconds, stats):
+        recorder.add(route_name(request), request.method, response.status_code, seconds, stats,
+                     response_size(response))
+
+
+# --- Reporting ---
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def route_summary():
+    """Per-route rows over the ring buffer, slowest p95 first, times in ms."""
+    with recorder.lock:
+        recent = list(recorder.recent)
+    by_route = defaultdict(list)
+    for record in recent:
+        by_route[record[1]].append(record)
+
+    rows = []
+    for route, records in by_route.items():
+        durations = sorted(r[4] for r in records)
+        count = len(records)
+        rows.append({
+            'route': route,
+            'count': count,
+            'errors': sum(1 for r in records if r[3] >= 500),
+            'p50': percentile(durations, 0.50) * 1000,
+            'p95': percentile(durations, 0.95) * 1000,
+            'p99': percentile(durations, 0.99) * 1000,
+            'max': durations[-1] * 1000,
+            'queries': sum(r[5] for r in records) / count,
+            'db_ms': sum(r[6] for r in records) / count * 1000,
+            'template_ms': sum(r[7] for r in records) / count * 1000,
+            'kb': sum(r[8] for r in records) / count / 1024,
+        })
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    return rows
+
+
+def _when(timestamp):
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc)
+
+
+def slowest_requests(limit=20):
+    with recorder.lock:
+        recent = list(recorder.recent)
+    return [
+        {'at': _when(r[0]), 'route': r[1], 'method': r[2], 'status': r[3], 'ms': r[4] * 1000,
+         'queries': r[5], 'db_ms': r[6] * 1000, 'template_ms': r[7] * 1000}
+        for r in heapq.nlargest(limit, recent, key=lambda r: r[4])
+    ]
+
+
+def slowest_queries():
+    with recorder.lock:
+        entries = sorted(recorder.slow_queries, reverse=True)
+    return [{'ms': seconds * 1000, 'at': _when(at), 'route': route, 'sql': sql} for seconds, at, route, sql in entries]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """All counters in the Prometheus text exposition format (version 0.0.4)."""
+    with recorder.lock:
+        requests = dict(recorder.requests)
+        routes = {route: dict(totals, buckets=list(totals['buckets'])) for route, totals in recorder.routes.items()}
+    summary = route_summary()
+
+    lines = [
+        '# HELP blog_requests_total Requests handled, by route, method and status.',
+        '# TYPE blog_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append(f'blog_requests_total{{route="{_label(route)}",method="{method}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP blog_request_duration_seconds Time spent in the view and the middleware after PerfMiddleware.',
+        '# TYPE blog_request_duration_seconds histogram',
+    ]
+    for route, totals in sorted(routes.items()):
+        label = _label(route)
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, totals['buckets']):
+            cumulative += count
+            lines.append(f'blog_request_duration_seconds_bucket{{route="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'blog_request_duration_seconds_bucket{{route="{label}",le="+Inf"}} {totals["count"]}')
+        lines.append(f'blog_request_duration_seconds_sum{{route="{label}"}} {totals["seconds"]:.6f}')
+        lines.append(f'blog_request_duration_seconds_count{{route="{label}"}} {totals["count"]}')
+
+    counters = (
+        ('blog_db_queries_total', 'SQL statements run while handling requests.', 'queries', '{}'),
+        ('blog_db_query_seconds_total', 'Time spent in SQL statements.', 'db_seconds', '{:.6f}'),
+        ('blog_template_render_seconds_total', 'Time spent rendering templates.', 'template_seconds', '{:.6f}'),
+        ('blog_response_bytes_total', 'Response body bytes.', 'bytes', '{}'),
+    )
+    for name, help_text, key, fmt in counters:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for route, totals in sorted(routes.items()):
+            lines.append(f'{name}{{route="{_label(route)}"}} {fmt.format(totals[key])}')
+
+    lines += [
+        '# HELP blog_request_recent_seconds Request duration quantiles over the last requests in the ring buffer.',
+        '# TYPE blog_request_recent_seconds summary',
+    ]
+    for row in summary:
+        label = _label(row['route'])
+        for quantile in ('p50', 'p95', 'p99'):
+            value = row[quantile] / 1000
+            lines.append(f'blog_request_recent_seconds{{route="{label}",quantile="0.{quantile[1:]}"}} {value:.6f}')
+
+    lines += [
+        '# HELP blog_process_start_time_seconds When this process started recording.',
+        '# TYPE blog_process_start_time_seconds gauge',
+        f'blog_process_start_time_seconds {recorder.started:.3f}',
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,161 @@
+"""
+Responsive image renditions.
+
+Every stored image gets scaled copies in modern formats, written by the
+background image pipeline (blog/images.py) or `manage.py generate_renditions`:
+
+    media/renditions/blog_images/forest.jpg/480.webp
+    media/renditions/blog_images/forest.jpg/480.avif
+
+Templates turn them into <picture>/srcset markup with the tags in
+blog/templatetags/blog_images.py; an image without renditions yet just
+falls back to its original URL.
+"""
+import os
+import shutil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+from PIL import Image, ImageOps, features
+
+from . import content_images
+from .serving import versioned_url
+
+RENDITIONS_DIR = 'renditions'
+WIDTHS = (320, 480, 768, 1200)
+QUALITY = {'webp': 75, 'avif': 55}
+# srcset sources are listed best-compressed first, the browser takes the first it supports
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+CACHE_KEY = 'blog:renditions:{}'
+MISSING_TIMEOUT = 5 * 60  # recheck soon for images whose renditions are still being made
+
+
+def formats():
+    """Output formats this Pillow build can write."""
+    found = ['webp'] if features.check('webp') else []
+    if features.check('avif'):
+        found.insert(0, 'avif')
+    return found
+
+
+def rendition_dir(name):
+    return os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR, name)
+
+
+def _url(name, filename):
+    return f'{settings.MEDIA_URL}{RENDITIONS_DIR}/{name}/{filename}'
+
+
+def target_widths(width):
+    """Standard widths below the original, plus the original (capped) itself."""
+    widths = [w for w in WIDTHS if w < width]
+    widths.append(min(width, WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def generate(name, force=False):
+    """Write the renditions for one media-relative image. Returns how many files were written."""
+    source = os.path.join(settings.MEDIA_ROOT, name)
+    out_dir = rendition_dir(name)
+    os.makedirs(out_dir, exist_ok=True)
+    written = 0
+
+    with Image.open(source) as img:
+        if getattr(img, 'is_animated', False):
+            return 0
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'P') else 'RGB')
+
+        for width in target_widths(img.width):
+            resized = None
+            for fmt in formats():
+                target = os.path.join(out_dir, f'{width}.{fmt}')
+                if not force and os.path.exists(target):
+                    continue
+                if resized is None:
+                    height = max(round(img.height * width / img.width), 1)
+                    resized = img if width == img.width else img.resize((width, height), Image.Resampling.LANCZOS)
+                tmp = f'{target}.tmp'
+                resized.save(tmp, format=fmt.upper(), quality=QUALITY[fmt])
+                os.replace(tmp, target)
+                written += 1
+
+    cache.delete(CACHE_KEY.format(name))
+    return written
+
+
+def delete(name):
+    """Drop all renditions of an image, called wherever the original is removed."""
+    shutil.rmtree(rendition_dir(name), ignore_errors=True)
+    cache.delete(CACHE_KEY.format(name))
+
+
+def available(name):
+    """{format: [(width, url), ...]} for the renditions that exist on disk (cached)."""
+    key = CACHE_KEY.format(name)
+    found = cache.get(key)
+    if found is not None:
+        return found
+
+    found = {}
+    directory = rendition_dir(name)
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        filenames = []
+    for filename in filenames:
+        width, _, fmt = filename.partition('.')
+        if width.isdigit() and fmt in MIME_TYPES:
+            # versioned, so browsers may keep them until they are regenerated
+            url = versioned_url(_url(name, filename), os.path.join(directory, filename))
+            found.setdefault(fmt, []).append((int(width), url))
+    for entries in found.values():
+        entries.sort()
+
+    cache.set(key, found, None if found else MISSING_TIMEOUT)
+    return found
+
+
+def sources_html(name, sizes):
+    """<source> tags for a <picture>, best format first. Empty if nothing is rendered yet."""
+    found = available(name)
+    tags = []
+    for fmt in sorted(found, key=lambda f: list(MIME_TYPES).index(f)):
+        srcset = ', '.join(f'{url} {width}w' for width, url in found[fmt])
+        tags.append(
+            f'<source type="{MIME_TYPES[fmt]}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+        )
+    return ''.join(tags)
+
+
+def rewrite_content(html, sizes):
+    """
+    Wrap local CKEditor <img> tags in <picture> with their renditions. Tags
+    are found and tokenized like blog/content_images.py does (any quoting),
+    so every image the references track gets its srcset.
+    """
+    after_source = False
+
+    def replace(match):
+        nonlocal after_source
+        img = match.group(0)
+        if img[1:4].lower() != 'img':
+            after_source = True
+            return img
+        if after_source:
+            # the fallback <img> of a <picture> the author wrote, already has its sources
+            after_source = False
+            return img
+        src = next((value for attr, value in content_images.iter_url_attrs(match.group(1)) if attr == 'src'), '')
+        name = content_images.media_path(src.strip())
+        sources = sources_html(name, sizes) if name else ''
+        if not sources:
+            return img
+        if 'loading=' not in img.lower():
+            img = img[:4] + ' loading="lazy" decoding="async"' + img[4:]
+        return f'<picture>{sources}{img}</picture>'
+
+    return content_images.IMAGE_TAG_RE.sub(replace, html or '')
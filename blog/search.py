@@ -0,0 +1,262 @@
+"""
+Full-text search for blog posts.
+
+On SQLite the posts live in an FTS5 virtual table (``blog_search``) holding the
+HTML-stripped title, description and content, ranked with BM25. Any other
+database falls back to a plain ``icontains`` scan so the site keeps working.
+"""
+import html
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection, OperationalError
+from django.utils.html import escape, strip_tags
+
+SEARCH_TABLE = 'blog_search'
+
+# title matches count more than description, description more than body
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+SNIPPET_TOKENS = 32
+# private-use markers, swapped for <mark> after the snippet has been escaped
+HL_START, HL_END = '\ue000', '\ue001'
+
+QUERY_TOKEN_RE = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def html_to_text(value):
+    """Turn CKEditor HTML into plain searchable text."""
+    if not value:
+        return ''
+    text = html.unescape(strip_tags(value))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def parse_query(query):
+    """
+    Split a user query into terms.
+
+    Returns a list of (words, is_prefix) tuples: `"green tea"` becomes one
+    phrase, `mang*` a prefix term, anything else a plain word.
+    """
+    terms = []
+    for phrase, phrase_star, word in QUERY_TOKEN_RE.findall(query or ''):
+        if word:
+            words = WORD_RE.findall(word)
+            if words:
+                # punctuation inside a word ("e-mail") keeps the parts together
+                terms.append((words, len(words) == 1 and word.endswith('*')))
+        else:
+            words = WORD_RE.findall(phrase)
+            if words:
+                terms.append((words, bool(phrase_star)))
+    return terms
+
+
+def to_fts_query(terms):
+    """Build a safe FTS5 MATCH expression from parsed terms."""
+    parts = []
+    for words, is_prefix in terms:
+        part = '"%s"' % ' '.join(words)
+        if is_prefix:
+            part += '*'
+        parts.append(part)
+    return ' '.join(parts)
+
+
+def highlight(text):
+    """Escape a snippet and turn the highlight markers into <mark> tags."""
+    return escape(text).replace(HL_START, '<mark>').replace(HL_END, '</mark>')
+
+
+class SearchResults:
+    """
+    Lazy, sliceable result set so Paginator only fetches the page it shows.
+
+    Items are BlogPost instances with an extra `search_snippet` attribute.
+    """
+
+    def __init__(self, backend, terms, queryset):
+        self.backend = backend
+        self.terms = terms
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms, self.queryset) if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if not self.terms:
+                return []
+            start = key.start or 0
+            stop = key.stop if key.stop is not None else self.count()
+            return self.backend.fetch(self.terms, self.queryset, start, stop)
+        return self[key:key + 1][0]
+
+
+class FTS5Backend:
+    """SQLite FTS5 index, kept in sync by BlogPost.save and post_delete."""
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post.pk])
+            if post.publish:
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, content) VALUES (%s, %s, %s, %s)',
+                    [post.pk, post.title, html_to_text(post.description), post.plain_text or html_to_text(post.content)],
+                )
+
+    def index_many(self, posts):
+        """index() for a batch of posts, two statements however many there are."""
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [[post.pk] for post in posts])
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, content) VALUES (%s, %s, %s, %s)',
+                [[post.pk, post.title, html_to_text(post.description), post.plain_text or html_to_text(post.content)]
+                 for post in posts if post.publish],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+    def count(self, terms, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+                [to_fts_query(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, queryset, start, stop):
+        weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({SEARCH_TABLE}, -1, %s, %s, %s, %s) '
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [HL_START, HL_END, '…', SNIPPET_TOKENS, to_fts_query(terms), stop - start, start],
+            )
+            rows = cursor.fetchall()
+
+        posts = queryset.in_bulk([pk for pk, _ in rows])
+        results = []
+        for pk, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:  # index can briefly lag an unpublish
+                post.search_snippet = highlight(snippet)
+                results.append(post)
+        return results
+
+
+class FallbackBackend:
+    """icontains scan over BlogPost.plain_text for databases without FTS5."""
+
+    def index(self, post):
+        pass
+
+    def index_many(self, posts):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def optimize(self):
+        pass
+
+    def _filter(self, terms, queryset):
+        from django.db.models import Q
+
+        for words, _ in terms:
+            phrase = ' '.join(words)
+            queryset = queryset.filter(
+                Q(title__icontains=phrase) | Q(description__icontains=phrase) | Q(plain_text__icontains=phrase)
+            )
+        return queryset
+
+    def count(self, terms, queryset):
+        return self._filter(terms, queryset).count()
+
+    def fetch(self, terms, queryset, start, stop):
+        queryset = self._filter(terms, queryset).defer(None).defer('content')
+        posts = list(queryset.order_by('-created_at')[start:stop])
+        needle = ' '.join(terms[0][0]).lower() if terms else ''
+        for post in posts:
+            post.search_snippet = self._snippet(post.plain_text, needle)
+        return posts
+
+    def _snippet(self, text, needle, width=200):
+        pos = text.lower().find(needle) if needle else -1
+        if pos < 0:
+            return escape(text[:width])
+        start = max(pos - width // 2, 0)
+        end = pos + len(needle)
+        return (
+            ('…' if start else '')
+            + escape(text[start:pos])
+            + '<mark>' + escape(text[pos:end]) + '</mark>'
+            + escape(text[end:end + width // 2])
+            + '…'
+        )
+
+
+_backend = None
+
+
+def fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+            return cursor.fetchone() is not None
+    except OperationalError:
+        return False
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = FTS5Backend() if fts5_available() else FallbackBackend()
+    return _backend
+
+
+def search(query, queryset):
+    """Search `queryset` (published posts) and return a lazy SearchResults."""
+    return SearchResults(get_backend(), parse_query(query), queryset)
+
+
+async def asearch(query, queryset):
+    """search() for async views; detecting the backend may query, once per process."""
+    backend = _backend or await sync_to_async(get_backend)()
+    return SearchResults(backend, parse_query(query), queryset)
+
+
+def index_post(post):
+    get_backend().index(post)
+
+
+def index_posts(posts):
+    get_backend().index_many(posts)
+
+
+def remove_post(post_id):
+    get_backend().remove(post_id)
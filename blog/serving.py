@@ -0,0 +1,207 @@
+"""
+Static and media file serving with validators and long-lived caching.
+
+Replaces django.conf.urls.static, which only works with DEBUG on and
+sends no caching headers. Every file gets an ETag (size and mtime, no
+hashing) and Last-Modified, so revalidation is a stat() and a 304;
+single byte ranges are answered with 206 for video and resumed downloads.
+
+Names that can never change content are cached for a year as immutable:
+
+* static files under their manifest-hashed names (HashedStaticFilesStorage,
+  written by collectstatic);
+* media URLs carrying the file's current version, `?v=<version>`, which
+  ContentAddressedStorage.url() and the renditions add. The optimiser
+  rewrites uploads in place, so the version comes from the file, not
+  from its name.
+
+Everything else is cached for BLOG_FILE_MAX_AGE seconds and revalidated.
+
+With BLOG_SENDFILE set to "x-accel-redirect" (nginx) or "x-sendfile"
+(Apache, lighttpd) Django only decides the headers and the web server
+sends the bytes.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+_hashed_names = None
+
+
+class HashedStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that falls back to the plain name for files
+    collectstatic hasn't seen, so a missing collectstatic degrades to
+    uncached URLs instead of a 500.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+def file_version(st):
+    """Changes whenever the file's bytes do, from its stat() alone."""
+    return f'{st.st_size:x}-{st.st_mtime_ns:x}'
+
+
+def versioned_url(url, path):
+    """`url?v=<version>` for the file at `path`, the bare url if it doesn't exist."""
+    try:
+        return f'{url}?v={file_version(os.stat(path))}'
+    except OSError:
+        return url
+
+
+def _hashed_static_names():
+    """The names in the collectstatic manifest that embed a content hash."""
+    global _hashed_names
+    if _hashed_names is None:
+        _hashed_names = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    return _hashed_names
+
+
+def _byte_range(request, size, etag, mtime):
+    """
+    (start, end) inclusive for a satisfiable single `Range`, None to send
+    the whole file, or False when the range lies outside it.
+    """
+    header = request.headers.get('Range')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None  # the client's copy is outdated, it needs all of it
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # multiple ranges or another unit: the whole file is a valid answer
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+        if not int(last):
+            return False
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(path, internal_url):
+    response = HttpResponse()
+    if settings.BLOG_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = internal_url
+    else:
+        response['X-Sendfile'] = path
+    # the web server fills in the body, its length and any range
+    return response
+
+
+def serve_file(request, path, immutable=False, internal_url=None):
+    """
+    Response for the file at absolute `path`: 304/412 from the validators,
+    206/416 for a Range, otherwise the whole file (or a sendfile header
+    when `internal_url` is given and BLOG_SENDFILE is on).
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    etag = f'"{file_version(st)}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        byte_range = _byte_range(request, st.st_size, etag, st.st_mtime)
+        if internal_url and settings.BLOG_SENDFILE:
+            response = _offload(path, internal_url)
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        if response.status_code != 416:
+            response['Content-Type'] = content_type
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    response['Cache-Control'] = IMMUTABLE if immutable else f'public, max-age={settings.BLOG_FILE_MAX_AGE}'
+    return response
+
+
+@require_safe
+def serve_static(request, path):
+    full_path = safe_join(settings.STATIC_ROOT, path) if settings.STATIC_ROOT else None
+    if full_path and os.path.isfile(full_path):
+        internal_url = f'{settings.BLOG_SENDFILE_PREFIX}static/{path}'
+    else:
+        # not collected (yet): straight from the app's static/ folder
+        full_path, internal_url = finders.find(path), None
+        if not full_path:
+            raise Http404
+    return serve_file(request, full_path, immutable=path in _hashed_static_names(), internal_url=internal_url)
+
+
+@require_safe
+def serve_media(request, path):
+    full_path = safe_join(settings.MEDIA_ROOT, path)
+    version = request.GET.get('v')
+    try:
+        immutable = version is not None and version == file_version(os.stat(full_path))
+    except OSError:
+        raise Http404
+    return serve_file(request, full_path, immutable=immutable,
+                      internal_url=f'{settings.BLOG_SENDFILE_PREFIX}media/{path}')
+
+
+def _prefix_pattern(prefix):
+    return r'^%s(?P<path>.*)$' % re.escape(prefix.lstrip('/'))
+
+
+def urlpatterns():
+    """The static and media routes for the root URLconf."""
+    return [
+        re_path(_prefix_pattern(settings.STATIC_URL), serve_static),
+        re_path(_prefix_pattern(settings.MEDIA_URL), serve_media),
+    ]
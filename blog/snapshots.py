@@ -0,0 +1,456 @@
+"""
+Pre-rendered pages for anonymous readers.
+
+With BLOG_SNAPSHOTS on, every published post and the first
+BLOG_SNAPSHOT_PAGES pages of the blog, category and tag listings are kept
+as rendered HTML under BLOG_SNAPSHOT_DIR, one file per URL. SnapshotMiddleware
+sits right after SecurityMiddleware and answers an anonymous GET for one
+of them from the file: no session, ORM or template work, and a 304 from a
+stat() when the reader already has it. A request with a session or
+messages cookie (logged in, or a flash message waiting) goes on to the
+views as before.
+
+Pages are rendered by passing a request through the whole middleware
+stack with Django's own request handler, so a snapshot is byte for byte
+what the view would send.
+Saves only queue the pages they affect, like the page cache versions do:
+
+- a post: its page, the blog listing, its category's and tags' listings,
+  or every listing when the sidebar counts move
+- a comment: its post's page
+- a category or tag: every listing (their filters list all of them) and
+  the pages of its posts; listings under a slug that's gone are dropped
+
+and a background thread re-renders them once the transaction commits.
+A page that no longer renders as a plain 200 loses its file.
+`manage.py build_snapshots` renders everything from scratch, in
+parallel processes, and swaps the new set in.
+"""
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from urllib.parse import unquote_to_bytes, urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.db import close_old_connections, connections, transaction
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .pagination import KeysetPaginator
+from .serving import file_version
+
+DEFAULT_PAGES = 3
+INDEX = 'index.html'
+
+logger = logging.getLogger(__name__)
+
+# set while this process renders a page, so the middleware lets it through to the view
+_rendering = ContextVar('blog_snapshot_rendering', default=False)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'BLOG_SNAPSHOTS', False)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # one worker: a page is never rendered twice at once, and queued saves coalesce
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blog-snapshots')
+    return _executor
+
+
+def _origin():
+    origin = urlsplit(settings.BLOG_SNAPSHOT_ORIGIN)
+    return origin.scheme, origin.netloc
+
+
+def snapshot_file(path, query='', root=None):
+    """The file holding the page at `path`?`query` (SuspiciousFileOperation outside the root)."""
+    name = f'index.{hashlib.md5(query.encode()).hexdigest()[:16]}.html' if query else INDEX
+    return safe_join(root or settings.BLOG_SNAPSHOT_DIR, path.lstrip('/'), name)
+
+
+# --- Serving ---
+
+class SnapshotMiddleware:
+    """Answer anonymous GETs from BLOG_SNAPSHOT_DIR when the page has a snapshot."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.scheme, self.host = _origin()
+        # it sits further in and never sees the responses answered here
+        self.xframe = (XFrameOptionsMiddleware(get_response)
+                       if 'django.middleware.clickjacking.XFrameOptionsMiddleware' in settings.MIDDLEWARE else None)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # a stat() and a read of a small local file, not worth a thread hop
+        return self.serve(request) or await self.get_response(request)
+
+    def servable(self, request):
+        if not enabled() or request.method not in ('GET', 'HEAD') or _rendering.get():
+            return False
+        cookies = request.COOKIES
+        if settings.SESSION_COOKIE_NAME in cookies or CookieStorage.cookie_name in cookies:
+            return False
+        # absolute URLs in the page (canonical, og:url) were rendered for this origin
+        return request.scheme == self.scheme and request.get_host() == self.host
+
+    def serve(self, request):
+        if not self.servable(request):
+            return None
+        try:
+            path = snapshot_file(request.path, request.META.get('QUERY_STRING', ''))
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                etag = f'"{file_version(st)}"'
+                response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+                if response is None:
+                    response = HttpResponse(f.read())
+        except (OSError, SuspiciousFileOperation):
+            return None  # no snapshot of this page (yet)
+
+        # the same validators and caching rules as the page cache's anonymous pages
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(st.st_mtime)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        if self.xframe is not None:
+            response = self.xframe.process_response(request, response)
+        return response
+
+
+# --- Rendering ---
+
+def _write(path, content):
+    # written aside and renamed over, readers see the old page or the new one
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _request(url, scheme, host):
+    """An anonymous GET for `url` as it arrives from the origin's web server."""
+    path, _, query = url.partition('?')
+    return WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        # WSGI carries the percent-decoded path as latin-1
+        'PATH_INFO': unquote_to_bytes(path).decode('iso-8859-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': host.rpartition(':')[0] or host,
+        'SERVER_PORT': '443' if scheme == 'https' else '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'wsgi.url_scheme': scheme,
+        'wsgi.input': io.BytesIO(),
+    })
+
+
+def render_urls(urls, root=None):
+    """
+    Render each URL (path plus optional ?query) into its snapshot file
+    under `root`; returns the URLs that rendered as a plain 200. The rest
+    lose any file they had.
+    """
+    scheme, host = _origin()
+    handler = BaseHandler()
+    # errors come back as the usual 500 response (and are logged), not raised
+    handler.load_middleware()
+    written = []
+    token = _rendering.set(True)
+    try:
+        for url in urls:
+            path, _, query = url.partition('?')
+            target = snapshot_file(path, query, root)
+            response = handler.get_response(_request(url, scheme, host))
+            try:
+                # a redirect, 404 or personalised page is left to the view
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    _write(target, response.content)
+                    written.append(url)
+                else:
+                    _remove(target)
+            finally:
+                response.close()
+    finally:
+        _rendering.reset(token)
+        close_old_connections()
+    return written
+
+
+def post_url(post_id, slug):
+    return reverse('blog_detail', kwargs={'id': post_id, 'slug': slug})
+
+
+def listing_urls(path, posts, pages=None):
+    """`path` and the ?cursor= URLs of the next pages of a published-posts queryset."""
+    pages = pages or getattr(settings, 'BLOG_SNAPSHOT_PAGES', DEFAULT_PAGES)
+    paginator = KeysetPaginator(posts.only('id', 'created_at'))
+    urls, cursor = [path], None
+    for _ in range(pages - 1):
+        cursor = paginator.page(cursor).next_cursor
+        if cursor is None:
+            break
+        # the same query string the listing's "next" link has
+        urls.append(f'{path}?cursor={cursor}')
+    return urls
+
+
+def blog_listing():
+    from .models import BlogPost
+    return listing_urls(reverse('blog_list'), BlogPost.objects.filter(publish=True))
+
+
+def category_listing(category_id):
+    from .models import BlogPost, Category
+    slug = Category.objects.filter(pk=category_id).values_list('slug', flat=True).first()
+    if slug is None:
+        return []
+    return listing_urls(reverse('category_posts', kwargs={'slug': slug}),
+                        BlogPost.objects.filter(publish=True, category_id=category_id))
+
+
+def tag_listing(tag_id):
+    from .models import BlogPost, Tag
+    slug = Tag.objects.filter(pk=tag_id).values_list('slug', flat=True).first()
+    if slug is None:
+        return []
+    return listing_urls(reverse('tag_posts', kwargs={'slug': slug}),
+                        BlogPost.objects.filter(publish=True, tags=tag_id))
+
+
+def all_listings():
+    """Every listing page kept as a snapshot, grouped per listing."""
+    from .models import Category, Tag
+    yield blog_listing()
+    for category_id in Category.objects.values_list('pk', flat=True):
+        yield category_listing(category_id)
+    for tag_id in Tag.objects.values_list('pk', flat=True):
+        yield tag_listing(tag_id)
+
+
+def all_urls():
+    from .models import BlogPost
+    urls = [post_url(pk, slug) for pk, slug in
+            BlogPost.objects.filter(publish=True).order_by('-created_at', '-id').values_list('pk', 'slug')]
+    for group in all_listings():
+        urls.extend(group)
+    return urls
+
+
+def refresh_listing(urls):
+    """Re-render one listing's pages and drop its cursor pages that no longer exist."""
+    if not urls:
+        return
+    written = set(render_urls(urls))
+    directory = os.path.dirname(snapshot_file(urls[0]))
+    keep = {os.path.basename(snapshot_file(*url.partition('?')[::2])) for url in written}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        # only this listing's own pages, not the pages in folders below it
+        if name.startswith('index.') and name.endswith('.html') and name not in keep:
+            _remove(os.path.join(directory, name))
+
+
+def refresh_post_page(post_id):
+    """Re-render a post's page; files under an old slug go, so the view redirects again."""
+    from .models import BlogPost
+    slug = BlogPost.objects.filter(pk=post_id).values_list('slug', flat=True).first()
+    current = None
+    if slug is not None:
+        url = post_url(post_id, slug)
+        if render_urls([url]):
+            current = os.path.dirname(snapshot_file(url))
+    directory = os.path.dirname(snapshot_file(reverse('blog_detail_id', kwargs={'id': post_id})))
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir() and entry.path != current:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def prune_listings():
+    """Drop the listings of categories and tags that were renamed or deleted."""
+    from .models import Category, Tag
+    for model, name in ((Category, 'category_posts'), (Tag, 'tag_posts')):
+        slugs = set(model.objects.values_list('slug', flat=True))
+        # <root>/.../category/<slug>/index.html
+        directory = os.path.dirname(os.path.dirname(snapshot_file(reverse(name, kwargs={'slug': 'x'}))))
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir() and entry.name not in slugs:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def build(workers=1, chunk_size=50):
+    """
+    Render every page into a fresh directory and swap it in place of
+    BLOG_SNAPSHOT_DIR; returns (pages written, pages left to the views).
+    """
+    target = os.path.abspath(settings.BLOG_SNAPSHOT_DIR)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{os.path.basename(target)}-', dir=os.path.dirname(target))
+    try:
+        urls = all_urls()
+        if workers > 1 and len(urls) > chunk_size:
+            chunks = [urls[i:i + chunk_size] for i in range(0, len(urls), chunk_size)]
+            # forked workers open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                written = sum(len(done) for done in pool.map(render_urls, chunks, [staging] * len(chunks)))
+        else:
+            written = len(render_urls(urls, staging))
+
+        previous = f'{target}.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(target):
+            os.rename(target, previous)
+        os.rename(staging, target)
+        shutil.rmtree(previous, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return written, len(urls) - written
+
+
+# --- Invalidation ---
+
+def _queue(targets):
+    with _pending_lock:
+        idle = not _pending
+        _pending.update(targets)
+    if idle:
+        get_executor().submit(_drain)
+
+
+def _schedule(*targets):
+    if enabled():
+        # after the commit: the renderer reads through its own connection
+        transaction.on_commit(lambda: _queue(targets))
+
+
+def refresh_post(post_id, old_category_id=None, sidebar=False):
+    """A post was saved, deleted or retagged: its page and the listings it shows on."""
+    _schedule(('post', post_id), ('listings',) if sidebar else ('post-listings', post_id, old_category_id))
+
+
+def refresh_comments(post_id):
+    _schedule(('post', post_id))
+
+
+def refresh_taxonomy(taxonomy, post_ids=None):
+    """
+    A category or tag was saved, deleted or (un)assigned: every listing's
+    filters show it, and so do the pages of `post_ids` (default: its
+    published posts, so call it before a delete detaches them).
+    """
+    if not enabled():
+        return
+    if post_ids is None:
+        post_ids = taxonomy.posts.filter(publish=True).values_list('pk', flat=True)
+    _schedule(('listings',), *(('post', post_id) for post_id in post_ids))
+
+
+def refresh_all():
+    """Everything may have changed (a bulk import): render it all again."""
+    _schedule(('all',))
+
+
+def _drain():
+    with _pending_lock:
+        targets = set(_pending)
+        _pending.clear()
+    started = time.perf_counter()
+    close_old_connections()
+    try:
+        if ('all',) in targets:
+            written, skipped = build()
+            logger.info("Rebuilt all snapshots", extra={'pages': written, 'skipped': skipped,
+                                                        'duration_ms': round((time.perf_counter() - started) * 1000)})
+            return
+        _refresh(targets)
+        logger.info("Refreshed snapshots", extra={'targets': len(targets),
+                                                  'duration_ms': round((time.perf_counter() - started) * 1000)})
+    except Exception:
+        logger.exception("Snapshot refresh failed, affected pages fall back to the views")
+    finally:
+        close_old_connections()
+
+
+def _refresh(targets):
+    from .models import BlogPost
+
+    for post_id in {target[1] for target in targets if target[0] == 'post'}:
+        refresh_post_page(post_id)
+
+    moved = [target[1:] for target in targets if target[0] == 'post-listings']
+    if ('listings',) in targets:
+        prune_listings()
+        groups = list(all_listings())
+    elif moved:
+        categories, tags = set(), set()
+        for post_id, old_category_id in moved:
+            categories.update(BlogPost.objects.filter(pk=post_id).values_list('category_id', flat=True))
+            categories.add(old_category_id)
+            tags.update(BlogPost.tags.through.objects.filter(blogpost_id=post_id).values_list('tag_id', flat=True))
+        groups = [blog_listing()]
+        groups += [category_listing(pk) for pk in categories if pk is not None]
+        groups += [tag_listing(pk) for pk in tags]
+    else:
+        groups = []
+    for urls in groups:
+        refresh_listing(urls)
@@ -0,0 +1,77 @@
+// Page behaviour for the blog templates, loaded once (deferred) from base.html.
+
+// navbar: the hamburger shows and hides the menu on small screens
+document.addEventListener('DOMContentLoaded', function () {
+  const toggleBtn = document.getElementById('menu-toggle');
+  const menu = document.getElementById('menu-content');
+  if (!toggleBtn || !menu) return;
+  toggleBtn.addEventListener('click', () => {
+    menu.classList.toggle('hidden');
+    menu.classList.toggle('flex');
+  });
+});
+
+// listings: "Show more filters" slides the tag list open, and starts open on a tag page
+document.addEventListener('DOMContentLoaded', function () {
+  const btn = document.getElementById('toggle-filters');
+  const icon = document.getElementById('toggle-icon');
+  const container = document.getElementById('filter-container');
+  if (!btn || !icon || !container) return;
+
+  let isOpen = false;
+  let fullHeight = '500px'; // fallback
+
+  // Measure real height
+  function measureHeight() {
+    container.style.maxHeight = 'none';
+    container.style.opacity = '1';
+    container.style.pointerEvents = 'auto';
+    fullHeight = container.scrollHeight + 'px';
+    if (!isOpen) {
+      container.style.maxHeight = '0';
+      container.style.opacity = '0';
+      container.style.pointerEvents = 'none';
+    }
+  }
+
+  function open() {
+    measureHeight();
+    container.style.maxHeight = fullHeight;
+    container.style.opacity = '1';
+    container.style.pointerEvents = 'auto';
+    icon.textContent = '▲';
+    btn.classList.remove('bg-[#fffd8d]');
+    btn.classList.add('bg-treegreen');
+    isOpen = true;
+  }
+
+  function close() {
+    container.style.maxHeight = '0';
+    container.style.opacity = '0';
+    container.style.pointerEvents = 'none';
+    icon.textContent = '▼';
+    btn.classList.remove('bg-treegreen');
+    btn.classList.add('bg-[#fffd8d]');
+    isOpen = false;
+  }
+
+  // Auto-open if filtered
+  if (container.dataset.open === 'true') {
+    open();
+  }
+
+  btn.addEventListener('click', () => {
+    if (isOpen) close();
+    else open();
+  });
+});
+
+// post page: swap the "Load more comments" button for the next page (and that page's own button)
+function loadMoreComments(button) {
+  button.disabled = true;
+  fetch(button.dataset.url, {headers: {'Accept': 'application/json'}})
+    .then(response => response.json())
+    .then(data => button.insertAdjacentHTML('afterend', data.html))
+    .then(() => button.remove())
+    .catch(() => { button.disabled = false; });
+}
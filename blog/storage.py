@@ -0,0 +1,92 @@
+"""
+Content-addressed storage for uploaded blog images.
+
+A file is stored under the hash of its bytes, e.g.
+blog_images/3f/3fa2c0d9e4b1...jpg, so uploading the same picture twice
+(or into two posts) keeps a single copy. The name is the hash of the
+bytes as uploaded; the background optimiser may rewrite the file in place
+later, which is fine because the name only has to be stable, not verifiable.
+
+Which posts use which file is tracked in ImageReference (blog/models.py).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+from .serving import versioned_url
+
+IMAGE_DIR = 'blog_images'
+HASH_CHARS = 32  # 128 bits of sha256, plenty for a blog's uploads
+HASHED_NAME_RE = re.compile(rf'^{IMAGE_DIR}/([0-9a-f]{{2}})/\1[0-9a-f]{{{HASH_CHARS - 2}}}\.\w+$')
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'chunks'):
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+    else:
+        with open(content, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:HASH_CHARS]
+
+
+def hashed_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    return f'{IMAGE_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def is_hashed_name(name):
+    """True for names this storage produced (the bytes may since have been optimised)."""
+    return bool(HASHED_NAME_RE.match(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after their content and never stores a duplicate."""
+
+    def get_available_name(self, name, max_length=None):
+        # the real name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        name = hashed_name(content_hash(content), name)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name  # same bytes already stored
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            try:
+                # link, not replace: never clobber a copy the optimiser already rewrote
+                os.link(tmp_path, full_path)
+            except FileExistsError:
+                pass  # a concurrent upload of the same bytes got there first
+        finally:
+            os.remove(tmp_path)
+        return name
+
+
+    def url(self, name):
+        # versioned: the optimiser may still rewrite the bytes behind this name
+        return versioned_url(super().url(name), self.path(name))
+
+
+blog_image_storage = ContentAddressedStorage()
+
+
+def get_blog_image_storage():
+    """Callable for ImageField(storage=...), keeps the instance out of migrations."""
+    return blog_image_storage
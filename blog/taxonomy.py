@@ -0,0 +1,51 @@
+"""
+Category/tag sidebar shared by every listing page.
+
+Built once with published-post counts and kept in the cache until a
+category, tag, post publish state or post category/tags change commits
+(see the signal handlers in blog/models.py), or for at most
+BLOG_SIDEBAR_CACHE_TIMEOUT seconds: with a per-process cache only the
+process that saved drops its copy.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+
+from .caching import SIDEBAR_KEY, sidebar_timeout
+from .models import Category, Tag
+
+
+def sidebar_entries(model):
+    return (
+        model.objects.filter(posts__publish=True)
+        .annotate(post_count=Count('posts'))
+        .order_by('name')
+        .values('name', 'slug', 'post_count')
+    )
+
+
+def build_sidebar():
+    """Two queries: categories and tags that have published posts, with counts."""
+    return {'categories': list(sidebar_entries(Category)), 'tags': list(sidebar_entries(Tag))}
+
+
+async def abuild_sidebar():
+    return {
+        'categories': [row async for row in sidebar_entries(Category)],
+        'tags': [row async for row in sidebar_entries(Tag)],
+    }
+
+
+def get_sidebar():
+    sidebar = cache.get(SIDEBAR_KEY)
+    if sidebar is None:
+        sidebar = build_sidebar()
+        cache.set(SIDEBAR_KEY, sidebar, sidebar_timeout())
+    return sidebar
+
+
+async def aget_sidebar():
+    sidebar = await cache.aget(SIDEBAR_KEY)
+    if sidebar is None:
+        sidebar = await abuild_sidebar()
+        await cache.aset(SIDEBAR_KEY, sidebar, sidebar_timeout())
+    return sidebar
@@ -0,0 +1,16 @@
+from django import template
+
+from blog import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def site_assets():
+    """
+    The stylesheet and font preloads `manage.py build_assets` wrote, or the
+    Tailwind browser build and Google Fonts until it has run.
+
+        <head>{% site_assets %}</head>
+    """
+    return assets.head_html()
@@ -0,0 +1,35 @@
+from django import template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from blog import renditions
+
+register = template.Library()
+
+FULL_SIZES = '(min-width: 768px) 90vw, 100vw'
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=FULL_SIZES, css_class='', lazy=True):
+    """
+    <picture> for an ImageField value with AVIF/WebP srcsets and the original as fallback.
+
+        {% responsive_image post.image alt=post.title sizes="(min-width: 1280px) 40vw, 100vw" %}
+    """
+    if not image:
+        return ''
+    img = format_html(
+        '<img src="{}" alt="{}" class="{}"{}>',
+        image.url, alt, css_class,
+        mark_safe(' loading="lazy" decoding="async"') if lazy else '',
+    )
+    sources = renditions.sources_html(image.name, sizes)
+    if not sources:
+        return img
+    return mark_safe(f'<picture>{sources}{img}</picture>')
+
+
+@register.filter
+def responsive_content(html, sizes=FULL_SIZES):
+    """Add renditions to the <img> tags inside CKEditor content."""
+    return mark_safe(renditions.rewrite_content(html, sizes))
@@ -0,0 +1,151 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from blog import log, search
+from blog.models import BlogPost, Category, Comment, Tag, recount_comments
+from blog.pagination import KeysetPaginator
+
+# SQL queries per page; a higher count means an N+1 crept back in
+ANONYMOUS_BUDGETS = {
+    'blog_list': 3,
+    'blog_list_page_2': 3,
+    'category_posts': 4,
+    'tag_posts': 4,
+    'search_posts': 4,
+    'blog_detail': 3,
+    'post_comments': 2,
+}
+# logged-in requests add the session and user lookups
+AUTHENTICATED_EXTRA = 2
+
+# SQL queries per save of an already loaded object; change detection
+# must come from the loaded state (blog/tracking.py), not a SELECT
+SAVE_BUDGETS = {
+    'unpublish_post': 2,  # UPDATE + drop from search index
+    'publish_post': 3,  # UPDATE + search index delete/insert
+    'retitle_post': 3,
+    'rename_category': 1,
+}
+
+
+# the views are what's measured, not the site's snapshots
+@override_settings(BLOG_SNAPSHOTS=False)
+class QueryBudgetTests(TestCase):
+    """
+    Every public view and every save of a loaded post or category runs a
+    fixed number of queries, on posts carrying hundreds of tags and comments.
+    """
+    POSTS = 30
+    TAGS = 300
+    COMMENTS = 500
+
+    @classmethod
+    def setUpClass(cls):
+        search._backend = None  # re-detect FTS5 on the test database
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        search._backend = None
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f'reader{i}', email=f'reader{i}@example.com') for i in range(50)]
+        )
+        users[0].set_password('budget')
+        users[0].save()
+
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(5)]
+        tags = Tag.objects.bulk_create([Tag(name=f'tag {i}', slug=f'tag-{i}') for i in range(cls.TAGS)])
+
+        posts = []
+        for i in range(cls.POSTS):
+            post = BlogPost.objects.create(
+                title=f'Seeded post {i} about mango farming',
+                content=f'<p>Mango orchards, <b>post {i}</b>.</p>' * 20,
+                description=f'Seeded post {i}',
+                category=categories[i % len(categories)],
+                author=users[i % len(users)],
+                publish=True,
+            )
+            post.tags.set(tags)
+            posts.append(post)
+
+        detail_post = posts[-1]
+        Comment.objects.bulk_create([
+            Comment(post=detail_post, user=users[i % len(users)], content=f'Comment {i}')
+            for i in range(cls.COMMENTS)
+        ])
+        recount_comments(BlogPost.objects.filter(pk=detail_post.pk))
+        comments_page_2 = KeysetPaginator(
+            detail_post.comments.all(), per_page=settings.BLOG_COMMENTS_PER_PAGE
+        ).page().next_cursor
+
+        page_2 = KeysetPaginator(BlogPost.objects.filter(publish=True)).cursor_for_page(2)
+        cls.post = posts[0]
+        cls.urls = {
+            'blog_list': reverse('blog_list'),
+            'blog_list_page_2': reverse('blog_list') + '?cursor=' + page_2,
+            'category_posts': reverse('category_posts', args=[categories[0].slug]),
+            'tag_posts': reverse('tag_posts', args=[tags[0].slug]),
+            'search_posts': reverse('search_posts') + '?q=mango',
+            'blog_detail': detail_post.get_absolute_url(),
+            'post_comments': reverse('post_comments', args=[detail_post.pk]) + '?cursor=' + comments_page_2,
+        }
+
+    def setUp(self):
+        # one-off lookups (search backend detection, content types) stay out of the counts
+        for url in self.urls.values():
+            self.client.get(url)
+
+    def tearDown(self):
+        cache.clear()
+
+    def assertViewBudgets(self, extra):
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                cache.clear()  # measure the uncached render, not a page cache hit
+                with self.assertNumQueries(ANONYMOUS_BUDGETS[name] + extra):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_views(self):
+        self.assertViewBudgets(0)
+
+    def test_authenticated_views(self):
+        self.assertTrue(self.client.login(username='reader0', password='budget'))
+        self.assertViewBudgets(AUTHENTICATED_EXTRA)
+
+    def assertSaveBudget(self, label, obj, **changes):
+        for field, value in changes.items():
+            setattr(obj, field, value)
+        with self.subTest(save=label), self.assertNumQueries(SAVE_BUDGETS[label]):
+            obj.save()
+
+    def test_post_saves(self):
+        # loaded the way the admin loads them, outside the count
+        load = lambda: BlogPost.objects.get(pk=self.post.pk)
+        self.assertSaveBudget('unpublish_post', load(), publish=False)
+        self.assertSaveBudget('publish_post', load(), publish=True)
+        self.assertSaveBudget('retitle_post', load(), title='Retitled seeded post')
+
+    def test_category_save(self):
+        category = Category.objects.get(pk=self.post.category_id)
+        self.assertSaveBudget('rename_category', category, name='Renamed category')
+
+
+class LoggingConfigTests(SimpleTestCase):
+    def test_configure_wires_queue_to_its_handlers(self):
+        # dictConfig from Python 3.12 takes over QueueHandler subclasses; ours must still build
+        log.configure(settings.LOGGING)
+        handler = logging.getLogger('blog').handlers[0]
+        self.assertIsInstance(handler, log.QueueHandler)
+        self.assertEqual([target.name for target in handler.targets], handler.target_names)
+        self.assertTrue(handler.targets)
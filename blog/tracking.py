@@ -0,0 +1,74 @@
+"""
+Change detection without a pre-save SELECT.
+
+Models mixing in LoadedStateMixin remember the values of their
+`tracked_fields` as they came out of the database (Model.from_db), so
+save() can ask `has_changed('title')` instead of re-reading the row.
+"""
+from django.db.models.fields.files import FieldFile
+
+
+def _comparable(value):
+    # FileFields hold a str when loaded and a FieldFile once touched
+    return value.name if isinstance(value, FieldFile) else value
+
+
+class LoadedStateMixin:
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_loaded_state()
+        return instance
+
+    def _tracked_attnames(self):
+        return [self._meta.get_field(name).attname for name in self.tracked_fields]
+
+    def _snapshot_loaded_state(self):
+        # deferred fields aren't in __dict__ and are left out
+        self._loaded_state = {
+            attname: _comparable(self.__dict__[attname])
+            for attname in self._tracked_attnames() if attname in self.__dict__
+        }
+
+    def _ensure_loaded_state(self):
+        if getattr(self, '_loaded_state', None) is None:
+            # built by hand (e.g. Model(pk=...)) rather than loaded: one query to find out
+            row = type(self)._base_manager.filter(pk=self.pk).values(*self._tracked_attnames()).first()
+            self._loaded_state = row or {}
+
+    def has_changed(self, field_name):
+        """True if `field_name` differs from its loaded value (always True for unsaved rows)."""
+        if self._state.adding:
+            return True
+        self._ensure_loaded_state()
+        attname = self._meta.get_field(field_name).attname
+        if attname not in self.__dict__:
+            return False  # still deferred, so never assigned
+        if attname not in self._loaded_state:
+            return True  # loaded lazily after the snapshot, can't tell
+        return _comparable(self.__dict__[attname]) != self._loaded_state[attname]
+
+    def loaded_value(self, field_name):
+        """The value `field_name` had in the database, None for unsaved rows."""
+        if self._state.adding:
+            return None
+        self._ensure_loaded_state()
+        return self._loaded_state.get(self._meta.get_field(field_name).attname)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or getattr(self, '_loaded_state', None) is None:
+            self._snapshot_loaded_state()
+            return
+        # a deferred field loaded on first access joins the snapshot
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if (name in fields or attname in fields) and attname in self.__dict__:
+                self._loaded_state[attname] = _comparable(self.__dict__[attname])
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # what was just written is the new baseline
+        self._snapshot_loaded_state()
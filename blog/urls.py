@@ -1,20 +1,29 @@
+from django.conf import settings
 from django.urls import path
 from . import views
-from .views import upload_ckeditor_image
+
+# async versions of the read paths and the upload, for ASGI deployments
+if getattr(settings, 'BLOG_ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
 
 urlpatterns = [
-    path('', views.blog_list, name='blog_list'),
-    path('category/<slug:slug>/', views.category_posts, name='category_posts'),
-    path('tag/<slug:slug>/', views.tag_posts, name='tag_posts'),
-    path('search/', views.search_posts, name='search_posts'),
+    path('', read_views.blog_list, name='blog_list'),
+    path('category/<slug:slug>/', read_views.category_posts, name='category_posts'),
+    path('tag/<slug:slug>/', read_views.tag_posts, name='tag_posts'),
+    path('search/', read_views.search_posts, name='search_posts'),
 
     # post by ID + optional slug
-    path('post/<int:id>/<slug:slug>/', views.blog_detail, name='blog_detail'),
-    path('post/<int:id>/', views.blog_detail, name='blog_detail_id'),
+    path('post/<int:id>/<slug:slug>/', read_views.blog_detail, name='blog_detail'),
+    path('post/<int:id>/', read_views.blog_detail, name='blog_detail_id'),
+    path('post-comments/<int:id>/', read_views.post_comments, name='post_comments'),
 
-    path('ckeditor/upload/', upload_ckeditor_image, name='ckeditor-upload'),
+    path('ckeditor/upload/', read_views.upload_ckeditor_image, name='ckeditor-upload'),
     path('about/', views.about, name='about'),
 
     path('comment/<int:pk>/edit/', views.edit_comment, name='edit_comment'),
     path('comment/<int:pk>/delete/', views.delete_comment, name='delete_comment'),
+
+    path('metrics/', views.metrics, name='metrics'),
 ]
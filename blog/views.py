@@ -1,103 +1,151 @@
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
 from .models import BlogPost, Category, Tag
+from . import caching, images, perf, search, taxonomy
+from .storage import blog_image_storage
+from .pagination import KeysetPaginator, OffsetPaginator, paginate
 from .forms import CustomUserCreationForm
 from django.shortcuts import redirect
 
 from .models import Comment
 from .forms import CommentForm
-from django.http import HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.contrib import messages
 
-from django.core.paginator import Paginator
-from django.db.models import Q
 
 from django.conf import settings
 from django.http import JsonResponse
-from django.core.files.storage import default_storage
 
+import logging
 import os
+import time
 from PIL import Image
 from django.views.decorators.csrf import csrf_exempt
 
+logger = logging.getLogger(__name__)
+
+# listing cards only show the precomputed excerpt, never the full body
+LIST_DEFERRED_FIELDS = ('content', 'plain_text')
+
+def listing(posts):
+    """Trim a BlogPost queryset to what the listing cards render."""
+    return posts.select_related('category').defer(*LIST_DEFERRED_FIELDS)
+
+def store_upload(image):
+    """ Store an upload under its content hash; returns (path, format), format is None if it isn't an image """
+    # stored under the hash of its bytes, re-uploading the same picture reuses the file
+    path = blog_image_storage.save(image.name, image)
+
+    # Get the full file path where the image is saved
+    img_path = os.path.join(settings.MEDIA_ROOT, path)
+
+    try:
+        # only reads the header, the heavy resize/re-encode happens in the background
+        with Image.open(img_path) as img:
+            return path, img.format
+    except Exception as e:
+        if os.path.exists(img_path):
+            os.remove(img_path)
+        logger.warning("CKEditor upload is not a readable image", extra={'upload': image.name, 'error': str(e)})
+        return path, None
+
+def upload_response(image, path, img_format, started):
+    if img_format is None:
+        return JsonResponse({'uploaded': 0, 'error': {'message': 'File is not a valid image'}})
+    logger.info("CKEditor image stored, optimisation queued", extra={
+        'upload': image.name, 'path': path, 'format': img_format, 'bytes': image.size,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+    # Respond with the image URL
+    image_url = os.path.join(settings.MEDIA_URL, path)
+    return JsonResponse({
+        'uploaded': 1,
+        'fileName': image.name,
+        'url': image_url  # This URL is what CKEditor will use to display the image
+    })
+
 @csrf_exempt
 def upload_ckeditor_image(request):
     """ Handle image upload from CKEditor """
     if request.method == 'POST' and request.FILES.get('upload'):
         image = request.FILES['upload']
-        path = default_storage.save(f"blog_images/{image.name}", image)
-
-        # Get the full file path where the image is saved
-        img_path = os.path.join(settings.MEDIA_ROOT, path)
-
-        try:
-            # Open the image to check its size
-            img = Image.open(img_path)
-            # Check if image size is greater than 1MB
-            if os.path.getsize(img_path) > 1024 * 1024:  # 1 MB
-                img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
-                img.save(img_path, optimize=True, quality=70)
-                print(f"📷✅ CKEDITOR Image {image.name} resized successfully")
-            else:
-                print(f"📷 CKEDITOR Image {image.name} is under 1MB, no resizing needed")
-        except Exception as e:
-            if os.path.exists(img_path):
-                os.remove(img_path)
-            print(f"Error during resizing: {e}")
-            pass
-
-        # Respond with the image URL
-        image_url = os.path.join(settings.MEDIA_URL, path)
-        return JsonResponse({
-            'uploaded': 1,
-            'fileName': image.name,
-            'url': image_url  # This URL is what CKEditor will use to display the image
-        })
+        started = time.perf_counter()
+        path, img_format = store_upload(image)
+        if img_format:
+            images.enqueue(path)
+        return upload_response(image, path, img_format, started)
     return JsonResponse({'uploaded': 0, 'error': {'message': 'Image upload failed'}})
 
+@caching.cache_anonymous_page(caching.listing_page_version)
 def blog_list(request):
-    posts = BlogPost.objects.filter(publish=True).order_by('-created_at')
+    posts = listing(BlogPost.objects.filter(publish=True))
 
-    paginator = Paginator(posts, 6)  # 6 posts per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # newest first, walked by (created_at, id) cursors
+    page_obj, redirect_response = paginate(request, KeysetPaginator(posts))
+    if redirect_response:
+        return redirect_response
 
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    sidebar = taxonomy.get_sidebar()
 
     return render(request, 'blog/blog_list.html', {
         'page_obj': page_obj,
-        'categories': categories,
-        'tags': tags,
+        'cache_version': caching.listing_version(),
+        'categories': sidebar['categories'],
+        'tags': sidebar['tags'],
     })
 
+def handle_comment(request, blog_post):
+    """ (redirect, None) after a comment is posted or a login is needed, else (None, form to show) """
+    if request.method != 'POST':
+        return None, CommentForm()
+    if not request.user.is_authenticated:
+        return redirect('login'), None
+    form = CommentForm(request.POST)
+    if form.is_valid():
+        comment = form.save(commit=False)
+        comment.post = blog_post
+        comment.user = request.user
+        comment.save()
+        return redirect(blog_post.get_absolute_url()), None
+    return None, form
+
+def comment_paginator(blog_post):
+    """ Newest first in pages of BLOG_COMMENTS_PER_PAGE, walked by (created_at, id) cursors """
+    return KeysetPaginator(blog_post.comments.select_related('user'), per_page=settings.BLOG_COMMENTS_PER_PAGE)
+
+@caching.cache_anonymous_page(caching.detail_page_version)
 def blog_detail(request, id, slug=None):
-    blog_post = get_object_or_404(BlogPost, id=id, publish=True)
-    comments = blog_post.comments.all().order_by('-created_at')
+    blog_post = get_object_or_404(BlogPost.objects.select_related('category', 'author'), id=id, publish=True)
 
     # if slug is outdated, redirect to canonical URL
     if slug != blog_post.slug:
         return redirect(blog_post.get_absolute_url(), permanent=True)
     
-    if request.method == 'POST':
-        if request.user.is_authenticated:
-            form = CommentForm(request.POST)
-            if form.is_valid():
-                comment = form.save(commit=False)
-                comment.post = blog_post
-                comment.user = request.user
-                comment.save()
-                return redirect(blog_post.get_absolute_url())
-        else:
-            return redirect('login')
-    else:
-        form = CommentForm()
+    response, form = handle_comment(request, blog_post)
+    if response:
+        return response
+
+    # one query each, the template must not touch blog_post.tags / comment.user lazily
+    tags = list(blog_post.tags.all())
+    # only the newest page, "Load more" fetches the rest from post_comments
+    comments = comment_paginator(blog_post).page()
 
     return render(request, 'blog/blog_detail.html', {
         'blog_post': blog_post,
+        'cache_version': caching.post_version(blog_post.pk),
+        'tags': tags,
         'comments': comments,
         'form': form
     })
 
+def post_comments(request, id):
+    """ The page of comments after `?cursor=`, as {"html": fragment, "next": cursor or null} for "Load more" """
+    blog_post = get_object_or_404(BlogPost.objects.only('id'), id=id, publish=True)
+    comments = comment_paginator(blog_post).page(request.GET.get('cursor'))
+    html = render_to_string('blog/comment_page.html', {'blog_post': blog_post, 'comments': comments}, request)
+    return JsonResponse({'html': html, 'next': comments.next_cursor})
+
 def signup(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -108,9 +156,9 @@ def signup(request):
         form = CustomUserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
 
+@caching.cache_anonymous_page(caching.listing_page_version)
 def category_posts(request, slug=None):
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    sidebar = taxonomy.get_sidebar()
     selected_category = None
 
     # Check if deselect query param is present
@@ -118,24 +166,25 @@ def category_posts(request, slug=None):
 
     if slug and not deselect:
         selected_category = get_object_or_404(Category, slug=slug)
-        posts = BlogPost.objects.filter(publish=True,category=selected_category).order_by('-created_at')
+        posts = listing(BlogPost.objects.filter(publish=True,category=selected_category))
     else:
-        posts = BlogPost.objects.all().order_by('-created_at')
+        posts = listing(BlogPost.objects.all())
 
-    paginator = Paginator(posts, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj, redirect_response = paginate(request, KeysetPaginator(posts))
+    if redirect_response:
+        return redirect_response
 
     return render(request, 'blog/blog_list.html', {
         'page_obj': page_obj,
-        'categories': categories,
-        'tags': tags,
+        'cache_version': caching.listing_version(),
+        'categories': sidebar['categories'],
+        'tags': sidebar['tags'],
         'selected_category': selected_category,
     })
 
+@caching.cache_anonymous_page(caching.listing_page_version)
 def tag_posts(request, slug=None):
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    sidebar = taxonomy.get_sidebar()
     selected_tag = None
 
     # Check if deselect query param is present
@@ -143,38 +192,41 @@ def tag_posts(request, slug=None):
 
     if slug and not deselect:
         selected_tag = get_object_or_404(Tag, slug=slug)
-        posts = BlogPost.objects.filter(publish=True, tags=selected_tag).order_by('-created_at')
+        posts = listing(BlogPost.objects.filter(publish=True, tags=selected_tag))
     else:
-        posts = BlogPost.objects.all().order_by('-created_at')
+        posts = listing(BlogPost.objects.all())
 
-    paginator = Paginator(posts, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj, redirect_response = paginate(request, KeysetPaginator(posts))
+    if redirect_response:
+        return redirect_response
 
     return render(request, 'blog/blog_list.html', {
         'page_obj': page_obj,
-        'categories': categories,
-        'tags': tags,
+        'cache_version': caching.listing_version(),
+        'categories': sidebar['categories'],
+        'tags': sidebar['tags'],
         'selected_tag': selected_tag,
     })
 
 def search_posts(request):
-    query = request.GET.get('q')
-    posts = BlogPost.objects.filter(
-        Q(title__icontains=query) | Q(content__icontains=query)
-    ).filter(publish=True).order_by('-created_at')
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return redirect('blog_list')
 
-    paginator = Paginator(posts, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # ranked by relevance (BM25), each post carries a highlighted search_snippet
+    posts = search.search(query, listing(BlogPost.objects.filter(publish=True)))
 
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    page_obj, redirect_response = paginate(request, OffsetPaginator(posts))
+    if redirect_response:
+        return redirect_response
+
+    sidebar = taxonomy.get_sidebar()
 
     return render(request, 'blog/blog_list.html', {
         'page_obj': page_obj,
-        'categories': categories,
-        'tags': tags,
+        'cache_version': caching.listing_version(),
+        'categories': sidebar['categories'],
+        'tags': sidebar['tags'],
         'search_query': query,
     })
 
@@ -217,4 +269,13 @@ def delete_comment(request, pk):
         comment.delete()
         return redirect(post_url)
 
-    return render(request, 'blog/delete_comment.html', {'comment': comment})
\ No newline at end of file
+    return render(request, 'blog/delete_comment.html', {'comment': comment})
+
+
+def metrics(request):
+    """ Request timings in Prometheus text format, for staff or a scraper holding BLOG_METRICS_TOKEN """
+    token = getattr(settings, 'BLOG_METRICS_TOKEN', '')
+    authorized = request.user.is_staff or (token and request.headers.get('Authorization') == f'Bearer {token}')
+    if not authorized:
+        raise Http404
+    return HttpResponse(perf.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
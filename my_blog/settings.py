@@ -48,14 +48,53 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# serve the listing, detail, search and upload views as async views
+# (blog/async_views.py); only worth it when running under ASGI
+BLOG_ASYNC_VIEWS = os.getenv('BLOG_ASYNC_VIEWS', '0') == '1'
+
+# pre-rendered pages for anonymous readers (blog/snapshots.py), answered
+# before the session is even loaded; `manage.py build_snapshots` renders
+# them all, saves re-render what they touch
+BLOG_SNAPSHOTS = os.getenv('BLOG_SNAPSHOTS', '0') == '1'
+if BLOG_SNAPSHOTS:
+    MIDDLEWARE.insert(1, 'blog.snapshots.SnapshotMiddleware')
+BLOG_SNAPSHOT_DIR = os.getenv('BLOG_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+# the scheme and host the pages' absolute URLs are rendered for, and the only one they're served to
+BLOG_SNAPSHOT_ORIGIN = os.getenv('BLOG_SNAPSHOT_ORIGIN', f'http://{URL_PATH or "localhost"}')
+# listing pages kept per listing, deeper pages come from the views
+BLOG_SNAPSHOT_PAGES = int(os.getenv('BLOG_SNAPSHOT_PAGES', 3))
+
+# per-view timings, query counts and render times (blog/perf.py), shown under
+# Blog posts > Performance in the admin and at /greenblog/metrics/. Off by
+# default: it wraps every Template.render in the process to time it
+if os.getenv('BLOG_PERF', '0') == '1':
+    MIDDLEWARE.append('blog.perf.PerfMiddleware')
+BLOG_PERF_BUFFER_SIZE = int(os.getenv('BLOG_PERF_BUFFER_SIZE', 5000))
+# lets a Prometheus scraper read /greenblog/metrics/ with "Authorization: Bearer <token>"
+BLOG_METRICS_TOKEN = os.getenv('BLOG_METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'my_blog.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# "production" (the default without DEBUG) compiles each template once per
+# process and keeps it, without the source positions only the debug page
+# needs; "development" (the default with DEBUG) reads and parses templates
+# on every render. `manage.py benchmark_templates` compares the two.
+TEMPLATE_PROFILES = {
+    'production': {'loaders': [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)], 'debug': False},
+    'development': {'loaders': TEMPLATE_LOADERS, 'debug': True},
+}
+BLOG_TEMPLATE_PROFILE = os.getenv('BLOG_TEMPLATE_PROFILE', 'development' if DEBUG else 'production')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'blog' / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            **TEMPLATE_PROFILES[BLOG_TEMPLATE_PROFILE],
             'context_processors': [
                  'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -64,6 +103,7 @@ TEMPLATES = [
                 
                 # custom context processors here
                 'blog.context_processors.current_time',
+                'blog.context_processors.page_cache',
             ],
         },
     },
@@ -72,12 +112,88 @@ TEMPLATES = [
 WSGI_APPLICATION = 'my_blog.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: "sqlite" (default, db.sqlite3) or "postgres" (DB_NAME, DB_USER, ...)
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+# seconds a connection is kept open for the next request
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'greenblog'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', ''),
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+    if os.getenv('DB_POOL', '1') == '1':
+        # psycopg's pool (needs psycopg[pool]); every thread borrows a connection
+        # per request, so pooled connections can't also be persistent ones
+        DATABASES['default']['OPTIONS'] = {'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }}
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+else:
+    # run on every new connection; WAL, which readers and the writer need to not
+    # block each other, is stored in the file and set once by migration 0013
+    SQLITE_PRAGMAS = {
+        'synchronous': 'NORMAL',  # fsync at checkpoints only, still safe with WAL
+        'mmap_size': int(os.getenv('SQLITE_MMAP_MB', 256)) * 1024 * 1024,
+        'cache_size': -int(os.getenv('SQLITE_CACHE_MB', 64)) * 1024,  # negative means KiB
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),  # wait for the write lock
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # take the write lock when a transaction starts: a read lock that
+                # later needs upgrading fails at once with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            },
+        }
+    }
+
+# Page cache: "file" (default, shared by every worker on the host) or "locmem"
+# (per process: faster lookups, but a save only invalidates its own process's
+# pages and validators, the others serve theirs until they expire)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'blog',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
+# seconds a rendered page/fragment stays cached, saves invalidate it sooner;
+# with locmem that is also how stale another process's copy can get
+BLOG_PAGE_CACHE_TIMEOUT = int(os.getenv('BLOG_PAGE_CACHE_TIMEOUT', 60 * 60 if CACHE_BACKEND == 'file' else 60))
+# seconds the category/tag sidebar is kept; saves drop it in their own process,
+# other processes with their own (locmem) cache pick the change up after this
+BLOG_SIDEBAR_CACHE_TIMEOUT = int(os.getenv('BLOG_SIDEBAR_CACHE_TIMEOUT', 5 * 60))
+
+# comments shown with a post, "Load more" fetches the next as many
+BLOG_COMMENTS_PER_PAGE = int(os.getenv('BLOG_COMMENTS_PER_PAGE', 20))
 
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -102,9 +218,65 @@ CKEDITOR_CONFIGS = {
     },
 }
 
+# Uploaded images are resized/re-encoded by a background thread pool (blog/images.py)
+BLOG_IMAGE_ASYNC = os.getenv('BLOG_IMAGE_ASYNC', '1') == '1'
+BLOG_IMAGE_WORKERS = int(os.getenv('BLOG_IMAGE_WORKERS', 2))
+# unused images are deleted this long after a cleanup first finds them (blog/cleanup.py)
+BLOG_IMAGE_CLEANUP_GRACE = int(os.getenv('BLOG_IMAGE_CLEANUP_GRACE', 7 * 24 * 60 * 60))
+
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# collectstatic writes content-hashed copies, {% static %} links to them
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'blog.serving.HashedStaticFilesStorage'},
+}
+
+# static/media served by Django (blog/serving.py): hashed and versioned URLs are
+# cached for a year, everything else for BLOG_FILE_MAX_AGE seconds and revalidated
+BLOG_SERVE_FILES = os.getenv('BLOG_SERVE_FILES', '1') == '1'
+BLOG_FILE_MAX_AGE = int(os.getenv('BLOG_FILE_MAX_AGE', 60 * 60))
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache): Django picks the headers,
+# the web server sends the file from its internal location BLOG_SENDFILE_PREFIX
+# + "static/..." or "media/..."
+BLOG_SENDFILE = os.getenv('BLOG_SENDFILE', '')
+BLOG_SENDFILE_PREFIX = os.getenv('BLOG_SENDFILE_PREFIX', '/internal/')
+
+# command running the Tailwind v4 CLI for `manage.py build_assets` (blog/assets.py),
+# e.g. the standalone binary or "npx @tailwindcss/cli"
+BLOG_TAILWIND_CLI = os.getenv('BLOG_TAILWIND_CLI', 'tailwindcss')
+
+
+# JSON lines on stdout, written by a background listener thread (blog/log.py)
+# so request threads never block on the stream. LOG_FORMAT=text for local work.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# dictConfig, then wires the queue handler to the handlers it names
+LOGGING_CONFIG = 'blog.log.configure'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'blog.log.JSONFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': os.getenv('LOG_FORMAT', 'json'),
+        },
+        'queue': {'class': 'blog.log.QueueHandler', 'handlers': ['console']},
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': os.getenv('DJANGO_LOG_LEVEL', 'WARNING'), 'propagate': False},
+        'blog': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+# per subsystem, e.g. LOG_LEVEL_CLEANUP=DEBUG lists every file a cleanup deletes
+for subsystem in ('images', 'cleanup', 'models', 'views', 'admin'):
+    LOGGING['loggers'][f'blog.{subsystem}'] = {'level': os.getenv(f'LOG_LEVEL_{subsystem.upper()}', LOG_LEVEL)}
@@ -5,7 +5,8 @@ import os
 from dotenv import load_dotenv
 
 from django.conf import settings
-from django.conf.urls.static import static
+
+from blog import serving
 
 load_dotenv()
 SECRET_ADMIN_PATH = os.getenv('SECRET_ADMIN_PATH')
@@ -28,5 +29,7 @@ urlpatterns = [
     path('greenblog/accounts/', include('blog.user_urls')),
 ]
 
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# static and media with validators, ranges and far-future caching (blog/serving.py);
+# leave off when the web server serves both directories itself
+if settings.BLOG_SERVE_FILES:
+    urlpatterns += serving.urlpatterns()